@@ -12,29 +12,52 @@ necesidad de un scheduler interno.
 """
 from __future__ import annotations
 
+import asyncio
 import json
 import math
 import os
 import threading
+import time
 import unicodedata
+from contextlib import asynccontextmanager
 from datetime import datetime
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 import pyarrow.compute as pc
-import pyarrow.parquet as pq
 from fastapi import Body, FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 
-from .services import parquet_service
+from .services import attribute_index, cart_patch, client_index, parquet_service, product_search, stock_index
+from services import arrow_cache, async_bridge, database, db_retry, http_client
 from services.config import (
     CACHE_DIR,
     CACHE_FILE_ATRIBUTOS,
     CACHE_FILE_CLIENTES,
     CACHE_FILE_PRODUCTOS,
     CACHE_FILE_STOCK,
+    CACHE_WATCH_DEBOUNCE,
+    CACHE_WATCH_INTERVAL,
 )
 
-app = FastAPI(title="POS Backend", version="1.0.0")
+@asynccontextmanager
+async def _lifespan(_app: FastAPI):
+    # Precarga los Parquet (y sus índices) en segundo plano y los
+    # mantiene actualizados sin bloquear las peticiones.
+    parquet_cache.register(CACHE_FILE_PRODUCTOS, "catalog", _build_product_catalog)
+    parquet_cache.register(CACHE_FILE_STOCK, "index", stock_index.StockIndex)
+    parquet_cache.register(CACHE_FILE_ATRIBUTOS, "index", attribute_index.AttributeIndex)
+    parquet_cache.register(CACHE_FILE_CLIENTES, "index", client_index.ClientIndex)
+    parquet_cache.start_watcher([CACHE_FILE_PRODUCTOS, CACHE_FILE_STOCK, CACHE_FILE_CLIENTES, CACHE_FILE_ATRIBUTOS])
+    try:
+        yield
+    finally:
+        parquet_cache.stop_watcher()
+        database.cerrar_conexiones()
+        await http_client.cerrar_cliente()
+        await asyncio.to_thread(async_bridge.detener)
+
+
+app = FastAPI(title="POS Backend", version="1.0.0", lifespan=_lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=[
@@ -53,30 +76,193 @@ app.add_middleware(
 # Caché de archivos Parquet
 # =============================================================================
 class ParquetCache:
-    """Pequeño caché en memoria basado en el ``mtime`` del archivo."""
+    """Caché en memoria de archivos Parquet con recarga en segundo plano.
+
+    Además de la tabla original guarda tablas derivadas (columnas normalizadas,
+    índices, etc.) que se recalculan únicamente cuando el archivo cambia. Con
+    ``SERVICES_PARQUET_MMAP`` las tablas se leen de un Arrow IPC mapeado en
+    memoria y se comparten entre workers (ver ``services.arrow_cache``).
+
+    Sin watcher cada lectura compara la firma ``(mtime, tamaño)`` del archivo.
+    Con ``start_watcher`` un hilo detecta los cambios, espera a que el archivo
+    deje de modificarse, lo carga junto con sus derivados fuera del camino de
+    las peticiones y publica la versión nueva reemplazando el diccionario
+    completo (copy-on-write): los lectores no toman el lock ni hacen I/O.
+    """
 
     def __init__(self) -> None:
-        self._cache: Dict[str, Tuple[float, Any]] = {}
+        # Diccionarios copy-on-write: se reemplazan completos, nunca se mutan.
+        self._cache: Dict[str, Tuple[Tuple[int, int], Any, Dict[str, Any]]] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._builders: Dict[str, Dict[str, Callable[[Any], Any]]] = {}
+        self._watched: Tuple[str, ...] = ()
+        self._pending: Dict[str, Tuple[Tuple[int, int], float]] = {}
         self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self._interval = CACHE_WATCH_INTERVAL
+        self._debounce = CACHE_WATCH_DEBOUNCE
+
+    # ------------------------------------------------------------------
+    # Carga y publicación
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _signature(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _read(self, path: str, signature: Tuple[int, int]):
+        stats: Dict[str, Any] = {"mtime": signature[0] / 1e9}
+        table = arrow_cache.read_table(path, stats=stats)
+        derived: Dict[str, Any] = {}
+        for name, builder in self._builders.get(path, {}).items():
+            try:
+                derived[name] = builder(table)
+            except Exception:
+                continue
+        return (signature, table, derived), stats
+
+    def _publish(self, path: str, entry, stats: Dict[str, Any]) -> None:
+        # Debe llamarse con ``self._lock`` tomado.
+        self._cache = {**self._cache, path: entry}
+        self._stats = {**self._stats, path: stats}
+        if path not in self._watched:
+            self._watched = self._watched + (path,)
+
+    @property
+    def watching(self) -> bool:
+        return self._watcher is not None and self._watcher.is_alive()
+
+    def _entry(self, path: str):
+        entry = self._cache.get(path)
+        if entry is not None and self.watching:
+            return entry
+        with self._lock:
+            signature = self._signature(path)
+            if signature is None:
+                return None
+            entry = self._cache.get(path)
+            if entry and entry[0] == signature:
+                return entry
+            try:
+                entry, stats = self._read(path, signature)
+            except Exception:
+                return None
+            self._publish(path, entry, stats)
+            return entry
 
     def load(self, path: str):
         if not path:
             return None
-        try:
-            mtime = os.path.getmtime(path)
-        except FileNotFoundError:
-            return None
+        entry = self._entry(path)
+        return entry[1] if entry else None
+
+    def register(self, path: str, name: str, builder: Callable[[Any], Any]) -> None:
+        """Registra un derivado para que el watcher lo precalcule en cada recarga."""
+        if self._builders.get(path, {}).get(name) is builder:
+            return
+        with self._lock:
+            self._builders = {**self._builders, path: {**self._builders.get(path, {}), name: builder}}
 
+    def load_derived(self, path: str, name: str, builder: Callable[[Any], Any]):
+        """Devuelve ``builder(tabla)`` calculado una vez por versión del archivo."""
+        if not path:
+            return None
+        self.register(path, name, builder)
+        entry = self._entry(path)
+        if entry is None:
+            return None
+        if name in entry[2]:
+            return entry[2][name]
         with self._lock:
-            cached = self._cache.get(path)
-            if cached and cached[0] == mtime:
-                return cached[1]
+            current = self._cache.get(path)
+            if current is not None and current[0] == entry[0]:
+                entry = current
+            if name in entry[2]:
+                return entry[2][name]
             try:
-                table = pq.read_table(path)
+                value = builder(entry[1])
             except Exception:
                 return None
-            self._cache[path] = (mtime, table)
-            return table
+            # Copy-on-write: entrada nueva con el derivado agregado, salvo que
+            # mientras tanto se haya publicado otra versión del archivo.
+            if self._cache.get(path) is entry:
+                self._cache = {**self._cache, path: (entry[0], entry[1], {**entry[2], name: value})}
+            return value
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Modo de lectura y memoria de cada archivo cargado."""
+        return {path: dict(stats) for path, stats in self._stats.items()}
+
+    # ------------------------------------------------------------------
+    # Watcher
+    # ------------------------------------------------------------------
+    def poll(self) -> None:
+        """Recarga los archivos observados que cambiaron y ya están estables."""
+        now = time.monotonic()
+        for path in self._watched:
+            signature = self._signature(path)
+            current = self._cache.get(path)
+            if signature is None or (current is not None and current[0] == signature):
+                self._pending.pop(path, None)
+                continue
+            # El proceso externo puede estar escribiendo todavía: se espera a
+            # que la firma se mantenga ``debounce`` segundos (o a que el mtime
+            # ya sea así de antiguo) antes de leer.
+            seen = self._pending.get(path)
+            if seen is None or seen[0] != signature:
+                self._pending[path] = (signature, now)
+                if time.time() - signature[0] / 1e9 < self._debounce:
+                    continue
+            elif now - seen[1] < self._debounce:
+                continue
+            try:
+                entry, stats = self._read(path, signature)
+            except Exception:
+                # Archivo incompleto o corrupto: se reintenta en el próximo ciclo.
+                self._pending[path] = (signature, now)
+                continue
+            if self._signature(path) != signature:
+                continue
+            self._pending.pop(path, None)
+            with self._lock:
+                self._publish(path, entry, stats)
+
+    def _watch(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception:
+                pass
+            self._stop.wait(self._interval)
+
+    def start_watcher(
+        self,
+        paths: Iterable[str] = (),
+        interval: Optional[float] = None,
+        debounce: Optional[float] = None,
+    ) -> None:
+        """Observa ``paths`` (y todo archivo que se cargue) desde un hilo propio."""
+        with self._lock:
+            self._watched = self._watched + tuple(path for path in paths if path and path not in self._watched)
+        if interval is not None:
+            self._interval = interval
+        if debounce is not None:
+            self._debounce = debounce
+        if self.watching:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="parquet-cache-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+        self._watcher = None
 
 
 parquet_cache = ParquetCache()
@@ -111,6 +297,7 @@ REMOTE_CARTS_FILE = os.path.join(CACHE_DIR, "remote_carts.json")
 LAST_STORE_FILE = os.path.join(CACHE_DIR, "last_store.json")
 
 _json_lock = threading.Lock()
+_migrated_files: set = set()
 
 
 def _read_json(path: str, default: Any) -> Any:
@@ -133,6 +320,16 @@ def _write_json(path: str, payload: Any) -> None:
         os.replace(tmp_path, path)
 
 
+def _migrate_once(path: str, migrate: Callable[[str], Any]) -> None:
+    """Ejecuta ``migrate(path)`` (JSON histórico → SQLite) una vez por proceso."""
+    if path in _migrated_files:
+        return
+    with _json_lock:
+        if path not in _migrated_files:
+            migrate(path)
+            _migrated_files.add(path)
+
+
 # =============================================================================
 # Utilidades de normalización
 # =============================================================================
@@ -213,32 +410,32 @@ def _normalize_product(record: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
-def _iter_batches(table) -> Iterable[List[Dict[str, Any]]]:
-    for batch in table.to_batches(max_chunksize=2048):
-        pdf = batch.to_pandas()
-        if pdf.empty:
-            continue
-        yield pdf.to_dict("records")
-
-
-def _filter_by_store(table, store: Optional[str]):
+def _store_mask(table, store: Optional[str]):
+    """Máscara de filas de ``store`` o ``None`` si no aplica el filtro."""
     if table is None or not store:
-        return table
+        return None
     store = store.strip().lower()
     expressions = []
     for column in STORE_FIELD_CANDIDATES:
         if column in table.column_names:
             try:
-                expressions.append(pc.equal(pc.utf8_lower(pc.field(column)), store))
+                expressions.append(pc.equal(pc.utf8_lower(table[column]), store))
             except Exception:
                 continue
     if not expressions:
-        return table
+        return None
     predicate = expressions[0]
     for expr in expressions[1:]:
         predicate = pc.or_(predicate, expr)
+    return pc.fill_null(predicate, False)
+
+
+def _filter_by_store(table, store: Optional[str]):
+    mask = _store_mask(table, store)
+    if mask is None:
+        return table
     try:
-        return table.filter(predicate)
+        return table.filter(mask)
     except Exception:
         return table
 
@@ -286,10 +483,18 @@ def _normalize_text(value: Any) -> str:
     return cleaned.strip()
 
 
-def _matches_tokens(haystack: List[str], tokens: List[str]) -> bool:
-    if not tokens:
-        return True
-    return all(any(token in candidate for candidate in haystack if candidate) for token in tokens)
+def _build_product_catalog(table):
+    return product_search.build_catalog(_rename_columns(table, PRODUCT_COLUMN_MAPPING), STORE_FIELD_CANDIDATES)
+
+
+def _load_products() -> Optional[product_search.ProductCatalog]:
+    """Catálogo de productos con columnas e índices de búsqueda precalculados."""
+    return parquet_cache.load_derived(CACHE_FILE_PRODUCTOS, "catalog", _build_product_catalog)
+
+
+def _materialize_products(table, indices) -> List[Dict[str, Any]]:
+    raw = table.select(product_search.raw_column_names(table))
+    return [_normalize_product(record) for record in raw.take(indices).to_pylist()]
 
 
 @app.get("/api/productos")
@@ -336,105 +541,47 @@ def search_products(
     page: int = Query(1, ge=1),
     per_page: int = Query(20, ge=1, le=200),
 ) -> Dict[str, Any]:
-    table = parquet_cache.load(CACHE_FILE_PRODUCTOS)
-    if table is None:
+    catalog = _load_products()
+    if catalog is None:
         return {
             "items": [],
             "total": 0,
             "page": page,
             "per_page": per_page,
             "total_pages": 1,
-            "facets": {"categories": [], "coverage_groups": []},
+            "facets": {"categories": [], "coverage_groups": [], "category_counts": [], "coverage_group_counts": []},
         }
 
-    table = _rename_columns(table, PRODUCT_COLUMN_MAPPING)
-    table = _filter_by_store(table, store)
-
-    tokens = [token for token in _normalize_text(query).split() if token]
-    normalized_category = _normalize_text(category)
-    normalized_coverage = _normalize_text(coverage_group)
-
-    categories: Dict[str, str] = {}
-    coverage_groups: Dict[str, str] = {}
-    filtered: List[Dict[str, Any]] = []
-
-    include_positive = bool(stock_positive)
-    include_zero = bool(stock_zero)
-    include_negative = bool(stock_negative)
-    apply_stock_filter = include_positive or include_zero or include_negative
-
-    for batch in _iter_batches(table):
-        for record in batch:
-            product = _normalize_product(record)
-
-            category_value = _string(product.get("categoria"))
-            if category_value:
-                key = category_value.strip()
-                upper = key.upper()
-                categories.setdefault(upper, key)
-
-            coverage_value = _string(product.get("grupo_cobertura"))
-            if coverage_value:
-                key = coverage_value.strip()
-                upper = key.upper()
-                coverage_groups.setdefault(upper, key)
-
-            if normalized_category and _normalize_text(category_value) != normalized_category:
-                continue
-            if normalized_coverage and _normalize_text(coverage_value) != normalized_coverage:
-                continue
-
-            price_value = _coerce_float(product.get("precio"), 0.0)
-            if min_price is not None and price_value < float(min_price):
-                continue
-            if max_price is not None and price_value > float(max_price):
-                continue
-
-            stock_value = _coerce_float(product.get("total_disponible_venta") or product.get("stock"), 0.0)
-            if apply_stock_filter:
-                matches_stock = False
-                if include_positive and stock_value > 0:
-                    matches_stock = True
-                if include_zero and stock_value == 0:
-                    matches_stock = True
-                if include_negative and stock_value < 0:
-                    matches_stock = True
-                if not matches_stock:
-                    continue
-
-            haystack = [
-                _normalize_text(product.get("nombre")),
-                _normalize_text(product.get("descripcion")),
-                _normalize_text(product.get("categoria")),
-                _normalize_text(product.get("grupo_cobertura")),
-                _normalize_text(product.get("codigo")),
-                _normalize_text(product.get("barcode")),
-            ]
-            if not _matches_tokens(haystack, tokens):
-                continue
+    table = catalog.table
+    # Filas de la tienda precalculadas por recarga (ver ``partition_by_store``).
+    store_rows = catalog.store_rows(store)
+
+    filters = product_search.SearchFilters(
+        tokens=[token for token in _normalize_text(query).split() if token],
+        category=_normalize_text(category),
+        coverage_group=_normalize_text(coverage_group),
+        min_price=min_price,
+        max_price=max_price,
+        stock_positive=bool(stock_positive),
+        stock_zero=bool(stock_zero),
+        stock_negative=bool(stock_negative),
+    )
 
-            filtered.append(product)
-
-    if sort == "priceAsc":
-        filtered.sort(key=lambda item: _coerce_float(item.get("precio"), 0.0))
-    elif sort == "priceDesc":
-        filtered.sort(key=lambda item: _coerce_float(item.get("precio"), 0.0), reverse=True)
-    elif sort == "nameAsc":
-        filtered.sort(key=lambda item: _normalize_text(item.get("nombre")))
-    elif sort == "nameDesc":
-        filtered.sort(key=lambda item: _normalize_text(item.get("nombre")), reverse=True)
-    elif sort == "stockDesc":
-        filtered.sort(
-            key=lambda item: _coerce_float(item.get("total_disponible_venta") or item.get("stock"), 0.0),
-            reverse=True,
-        )
+    # El texto libre se resuelve con el índice invertido y el resto de los
+    # filtros con kernels de pyarrow sobre las columnas precalculadas; sólo
+    # las filas de la página se convierten a diccionarios.
+    indices = product_search.select_rows(catalog, filters, sort, store_rows)
 
-    total = len(filtered)
+    total = len(indices)
     total_pages = max(1, math.ceil(total / per_page))
     current_page = min(page, total_pages)
     start = (current_page - 1) * per_page
-    end = start + per_page
-    items = filtered[start:end]
+    page_indices = indices[start:start + per_page]
+    items = _materialize_products(table, page_indices)
+
+    # Las facetas de la tienda se calculan al recargar el Parquet; por consulta
+    # sólo se cuentan las filas seleccionadas.
+    facets = catalog.store_facets(store)
 
     return {
         "items": items,
@@ -443,8 +590,14 @@ def search_products(
         "per_page": per_page,
         "total_pages": total_pages,
         "facets": {
-            "categories": sorted(categories.values(), key=lambda value: value.lower()),
-            "coverage_groups": sorted(coverage_groups.values(), key=lambda value: value.lower()),
+            "categories": facets.categories,
+            "coverage_groups": facets.coverage_groups,
+            "category_counts": product_search.facet_counts(
+                pc.take(table[product_search.COL_CATEGORY], indices), facets.categories
+            ),
+            "coverage_group_counts": product_search.facet_counts(
+                pc.take(table[product_search.COL_COVERAGE], indices), facets.coverage_groups
+            ),
         },
     }
 
@@ -457,92 +610,84 @@ def products_by_code(
 ) -> List[Dict[str, Any]]:
     """Busca productos cuyo código, nombre o código de barras contengan ``code``."""
 
-    table = parquet_cache.load(CACHE_FILE_PRODUCTOS)
-    if table is None:
+    catalog = _load_products()
+    if catalog is None:
         return []
-    table = _rename_columns(table, PRODUCT_COLUMN_MAPPING)
-    table = _filter_by_store(table, store)
 
     code = code.strip().lower()
     if not code:
         return []
 
-    results: List[Dict[str, Any]] = []
-    columns = [
-        "numero_producto",
-        "codigo",
-        "nombre_producto",
-        "nombre",
-        "codigo_barras",
-        "barcode",
-    ]
-    for batch in _iter_batches(table):
-        for record in batch:
-            haystack = [
-                _string(record.get(column)).lower()
-                for column in columns
-                if column in record and record.get(column) is not None
-            ]
-            if any(code in value for value in haystack if value):
-                results.append(_normalize_product(record))
-                if len(results) >= limit:
-                    return results
-    return results
+    table = catalog.table
+    indices = product_search.select_code_rows(catalog, code, catalog.store_rows(store))
+    return _materialize_products(table, indices[:limit])
+
+
+def _load_stock_index() -> Optional[stock_index.StockIndex]:
+    """Índice (código, almacén) → filas, reconstruido en cada recarga del stock."""
+    return parquet_cache.load_derived(CACHE_FILE_STOCK, "index", stock_index.StockIndex)
+
+
+def _stock_record(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "almacen": row.get("almacen") or row.get("almacen_nombre") or row.get("almacen_365") or row.get("store"),
+        "disponible_venta": row.get("disponible_venta") or row.get("stock_venta") or row.get("disponible"),
+        "disponible_entrega": row.get("disponible_entrega") or row.get("disponible_ent"),
+        "comprometido": row.get("comprometido") or row.get("reservado"),
+    }
 
 
 @app.get("/api/stock/{product_code}/{store_id}")
 def stock_by_store(product_code: str, store_id: str) -> List[Dict[str, Any]]:
-    table = parquet_cache.load(CACHE_FILE_STOCK)
-    if table is None:
+    index = _load_stock_index()
+    if index is None:
         return []
-    product_code = product_code.strip().lower()
-    store_id = store_id.strip().lower()
-    if not product_code or not store_id:
-        return []
-
-    records: List[Dict[str, Any]] = []
-    for batch in _iter_batches(table):
-        for row in batch:
-            codigo = _string(row.get("codigo") or row.get("numero_producto") or row.get("productId")).lower()
-            if codigo and codigo != product_code:
-                continue
-            store_candidates = [
-                _string(row.get("almacen")),
-                _string(row.get("almacen_nombre")),
-                _string(row.get("almacen_365")),
-                _string(row.get("store")),
-            ]
-            if store_id not in {candidate.lower() for candidate in store_candidates if candidate}:
-                continue
-            records.append(
-                {
-                    "almacen": row.get("almacen") or row.get("almacen_nombre") or row.get("almacen_365") or row.get("store"),
-                    "disponible_venta": row.get("disponible_venta") or row.get("stock_venta") or row.get("disponible"),
-                    "disponible_entrega": row.get("disponible_entrega") or row.get("disponible_ent"),
-                    "comprometido": row.get("comprometido") or row.get("reservado"),
-                }
-            )
-    return records
+    return [_stock_record(row) for row in index.lookup(product_code, store_id)]
 
 
-@app.get("/producto/atributos/{product_id}")
-def product_attributes(product_id: str) -> Dict[str, Any]:
-    table = parquet_cache.load(CACHE_FILE_ATRIBUTOS)
-    if table is None:
-        return {}
-    product_id = product_id.strip()
-    if not product_id:
-        return {}
-
+def _fulfillment_stores(store: str) -> List[str]:
+    """Almacenes del grupo de cumplimiento de ``store`` (incluido el propio)."""
+    try:
+        from services.database import obtener_grupos_cumplimiento
+    except Exception:
+        return [store]
     try:
-        filtered = table.filter(pc.equal(pc.field("ProductNumber"), product_id))
+        stores = [_string(value) for value in obtener_grupos_cumplimiento(store) or []]
     except Exception:
-        filtered = table
-    if filtered.num_rows == 0:
+        stores = []
+    return list(dict.fromkeys([store] + [value for value in stores if value]))
+
+
+@app.post("/api/stock/bulk")
+def stock_by_store_bulk(payload: Dict[str, Any] = Body(...)) -> Dict[str, List[Dict[str, Any]]]:
+    """Stock de varios productos en una sola llamada (carrito, página de resultados).
+
+    Cuerpo: ``{"store": ..., "codes": [...], "fulfillment_group": false}``.
+    Con ``fulfillment_group`` se incluyen todos los almacenes del grupo de
+    cumplimiento de ``store``. Devuelve código (en minúsculas) → filas de stock.
+    """
+    store = _string(payload.get("store"))
+    codes = payload.get("codes") or []
+    if not store or not isinstance(codes, list):
+        raise HTTPException(status_code=400, detail="Se requieren 'store' y la lista 'codes'")
+    index = _load_stock_index()
+    if index is None:
         return {}
-    df = filtered.to_pandas()
+    stores = _fulfillment_stores(store) if payload.get("fulfillment_group") else [store]
+    found = index.lookup_many([_string(code) for code in codes], stores)
+    return {code: [_stock_record(row) for row in rows] for code, rows in found.items()}
+
+
+def _load_attribute_index() -> Optional[attribute_index.AttributeIndex]:
+    """Atributos agrupados por ``ProductNumber``, reconstruidos en cada recarga."""
+    return parquet_cache.load_derived(CACHE_FILE_ATRIBUTOS, "index", attribute_index.AttributeIndex)
+
+
+def _attributes_from_rows(rows) -> Dict[str, Any]:
     attributes: Dict[str, Any] = {}
-    for row in df.to_dict("records"):
+    if rows is None:
+        return attributes
+    for row in rows.to_pylist():
         key = row.get("AttributeName") or row.get("Name") or row.get("nombre")
         value = row.get("AttributeValue") or row.get("Value") or row.get("valor")
         if key:
@@ -550,16 +695,41 @@ def product_attributes(product_id: str) -> Dict[str, Any]:
     return attributes
 
 
+@app.get("/producto/atributos/{product_id}")
+def product_attributes(product_id: str) -> Dict[str, Any]:
+    index = _load_attribute_index()
+    if index is None:
+        return {}
+    product_id = product_id.strip()
+    if not product_id:
+        return {}
+    return _attributes_from_rows(index.rows(product_id))
+
+
+@app.get("/producto/atributos")
+def products_attributes(
+    ids: List[str] = Query(..., description="Productos (repetido o separado por comas)"),
+) -> Dict[str, Dict[str, Any]]:
+    """Atributos de varios productos, p. ej. para precargar una página de resultados."""
+    index = _load_attribute_index()
+    product_ids = list(dict.fromkeys(part.strip() for value in ids for part in value.split(",") if part.strip()))
+    if index is None:
+        return {product_id: {} for product_id in product_ids}
+    found = index.rows_many(product_ids)
+    return {product_id: _attributes_from_rows(found.get(product_id)) for product_id in product_ids}
+
+
 # =============================================================================
 # Clientes
 # =============================================================================
-def _load_extra_clients() -> List[Dict[str, Any]]:
-    data = _read_json(CLIENTS_EXTRA_FILE, [])
-    return data if isinstance(data, list) else []
+def _extra_clients_ready() -> None:
+    """Crea la tabla de clientes extra e importa ``clientes_extra.json`` una vez."""
+    _migrate_once(CLIENTS_EXTRA_FILE, database.migrar_clientes_extra_json)
 
 
-def _save_extra_clients(clients: List[Dict[str, Any]]) -> None:
-    _write_json(CLIENTS_EXTRA_FILE, clients)
+def _load_client_index() -> Optional[client_index.ClientIndex]:
+    """Índices de documento y texto de clientes, reconstruidos en cada recarga."""
+    return parquet_cache.load_derived(CACHE_FILE_CLIENTES, "index", client_index.ClientIndex)
 
 
 @app.get("/api/clientes/search")
@@ -568,31 +738,14 @@ def search_clients(query: str = Query("", min_length=1)) -> List[Dict[str, Any]]
     if not query:
         return []
 
-    table = parquet_cache.load(CACHE_FILE_CLIENTES)
+    index = _load_client_index()
     candidates: List[Dict[str, Any]] = []
-    if table is not None:
-        df = table.to_pandas()
-        mask = None
-        for column in [
-            "nif",
-            "numero_cliente",
-            "nombre_cliente",
-            "nombre_completo",
-            "doc",
-            "dni",
-        ]:
-            if column in df.columns:
-                series = df[column].astype(str).str.lower()
-                current = series.str.contains(query, na=False)
-                mask = current if mask is None else (mask | current)
-        if mask is not None:
-            df = df[mask]
-        candidates.extend(df.head(50).to_dict("records"))
-
-    for extra in _load_extra_clients():
-        haystack = " ".join(str(extra.get(key, "")) for key in ("numero_cliente", "doc", "dni", "nombre", "nombre_completo"))
-        if query in haystack.lower():
-            candidates.append(extra)
+    if index is not None:
+        candidates.extend(index.search(query, limit=50))
+
+    if len(candidates) < 50:
+        _extra_clients_ready()
+        candidates.extend(database.buscar_clientes_extra(query, limite=50 - len(candidates)))
 
     results: List[Dict[str, Any]] = []
     for row in candidates[:50]:
@@ -633,8 +786,8 @@ def create_client(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
     if missing:
         raise HTTPException(status_code=400, detail=f"Faltan campos requeridos: {', '.join(missing)}")
 
-    clients = _load_extra_clients()
-    numero_cliente = _string(payload.get("dni")) or f"CL-{len(clients)+1:05d}"
+    _extra_clients_ready()
+    numero_cliente = _string(payload.get("dni")) or f"CL-{database.contar_clientes_extra() + 1:05d}"
     client = {
         "id": numero_cliente,
         "numero_cliente": numero_cliente,
@@ -652,9 +805,7 @@ def create_client(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
         "calle": payload.get("calle"),
         "altura": payload.get("altura"),
     }
-    clients = [entry for entry in clients if entry.get("numero_cliente") != numero_cliente]
-    clients.append(client)
-    _save_extra_clients(clients)
+    database.guardar_cliente_extra(client)
     return client
 
 
@@ -664,22 +815,13 @@ def validate_client(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
     if not doc:
         raise HTTPException(status_code=400, detail="doc requerido")
 
-    table = parquet_cache.load(CACHE_FILE_CLIENTES)
-    if table is not None:
-        df = table.to_pandas()
-        mask = None
-        for column in ("doc", "dni", "nif", "numero_cliente"):
-            if column in df.columns:
-                series = df[column].astype(str).str.lower()
-                current = series == doc.lower()
-                mask = current if mask is None else (mask | current)
-        if mask is not None and mask.any():
-            existing = df[mask].head(1).to_dict("records")[0]
-            return {"valid": False, "cliente": existing}
-
-    for extra in _load_extra_clients():
-        if _string(extra.get("doc")).lower() == doc.lower() or _string(extra.get("dni")).lower() == doc.lower():
-            return {"valid": False, "cliente": extra}
+    index = _load_client_index()
+    existing = index.find_document(doc) if index is not None else None
+    if existing is None:
+        _extra_clients_ready()
+        existing = database.obtener_cliente_extra_por_documento(doc)
+    if existing is not None:
+        return {"valid": False, "cliente": existing}
 
     return {"valid": True}
 
@@ -687,22 +829,25 @@ def validate_client(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
 # =============================================================================
 # Carrito remoto y sesión
 # =============================================================================
-def _load_carts() -> Dict[str, Any]:
-    data = _read_json(REMOTE_CARTS_FILE, {})
-    return data if isinstance(data, dict) else {}
+def _carts_ready() -> None:
+    """Crea la tabla ``carts`` e importa ``remote_carts.json`` una vez."""
+    _migrate_once(REMOTE_CARTS_FILE, database.migrar_carts_json)
 
 
-def _save_carts(data: Dict[str, Any]) -> None:
-    _write_json(REMOTE_CARTS_FILE, data)
+def _stored_cart(user_id: str) -> Optional[Dict[str, Any]]:
+    stored = database.get_cart(user_id)
+    if not stored or stored.get("timestamp") is None:
+        return None
+    return {"cart": stored.get("cart"), "timestamp": stored.get("timestamp"), "version": stored.get("version", 0)}
 
 
 @app.get("/api/get_user_cart")
 def get_user_cart(user_id: Optional[str] = Query(None)) -> Dict[str, Any]:
-    carts = _load_carts()
-    if user_id and user_id in carts:
-        return carts[user_id]
-    default_user = "anon"
-    return carts.get(default_user, {"lines": [], "meta": {}})
+    _carts_ready()
+    stored = _stored_cart(user_id) if user_id else None
+    if stored is None:
+        stored = _stored_cart("anon")
+    return stored if stored is not None else {"lines": [], "meta": {}}
 
 
 @app.post("/api/save_user_cart")
@@ -710,10 +855,41 @@ def save_user_cart(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
     user_id = _string(payload.get("userId")) or "anon"
     cart = payload.get("cart") or {}
     timestamp = payload.get("timestamp") or datetime.utcnow().isoformat()
-    carts = _load_carts()
-    carts[user_id] = {"cart": cart, "timestamp": timestamp}
-    _save_carts(carts)
-    return {"userId": user_id, "cart": cart, "timestamp": timestamp}
+    _carts_ready()
+    # Una fila por usuario: cada terminal escribe sólo su carrito.
+    version = database.save_cart(user_id, cart, timestamp)
+    if not version:
+        raise HTTPException(status_code=503, detail="No se pudo guardar el carrito")
+    return {"userId": user_id, "cart": cart, "timestamp": timestamp, "version": version}
+
+
+@app.post("/api/patch_user_cart")
+def patch_user_cart(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
+    """Aplica operaciones de línea sobre la versión ``baseVersion`` del carrito.
+
+    Cuerpo: ``{"userId", "baseVersion", "ops": [...], "timestamp"}`` (ver
+    ``cart_patch.apply_operations``). Responde la nueva versión; si el carrito
+    cambió desde ``baseVersion`` responde 409 con el carrito vigente.
+    """
+    user_id = _string(payload.get("userId")) or "anon"
+    operations = payload.get("ops")
+    base_version = payload.get("baseVersion")
+    if not isinstance(operations, list) or isinstance(base_version, bool) or not isinstance(base_version, int):
+        raise HTTPException(status_code=400, detail="Se requieren 'baseVersion' y la lista 'ops'")
+    timestamp = payload.get("timestamp") or datetime.utcnow().isoformat()
+    _carts_ready()
+    try:
+        result = database.actualizar_carrito(
+            user_id, base_version, lambda cart: cart_patch.apply_operations(cart, operations), timestamp
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc)) from exc
+    if not result["ok"]:
+        raise HTTPException(
+            status_code=409,
+            detail={"version": result["version"], "cart": result["cart"], "timestamp": result["timestamp"]},
+        )
+    return {"userId": user_id, "version": result["version"], "timestamp": result["timestamp"]}
 
 
 @app.post("/api/update_last_store")
@@ -753,3 +929,23 @@ def healthcheck() -> Dict[str, Any]:
 @app.get("/api/health")
 def api_healthcheck() -> Dict[str, Any]:
     return {"status": "ok"}
+
+
+@app.get("/api/cache/stats")
+def cache_stats() -> Dict[str, Any]:
+    """Memoria del worker: ``shared_bytes`` es lo que no se copió al heap."""
+    files = parquet_cache.stats()
+    return {
+        "pid": os.getpid(),
+        "mmap": arrow_cache.PARQUET_MMAP,
+        "rss_bytes": arrow_cache.resident_memory(),
+        "heap_bytes": sum(item.get("heap_bytes", 0) for item in files.values()),
+        "shared_bytes": sum(item.get("shared_bytes", 0) for item in files.values()),
+        "files": files,
+    }
+
+
+@app.get("/api/db/stats")
+def db_stats() -> Dict[str, Any]:
+    """Contención de SQLite por operación: reintentos, segundos esperados y agotados."""
+    return {"pid": os.getpid(), "locks": db_retry.estadisticas_bloqueos()}
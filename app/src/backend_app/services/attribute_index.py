@@ -0,0 +1,64 @@
+"""Índice agrupado de ``atributos_cache.parquet`` por ``ProductNumber``.
+
+Al recargar el Parquet la tabla se ordena por producto y se guarda, para cada
+``ProductNumber``, el desplazamiento y la cantidad de filas: los atributos de un
+producto son un ``slice`` sin copia de la tabla ordenada y varios productos se
+resuelven en una sola llamada.
+"""
+from __future__ import annotations
+
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+KEY_COLUMN = "ProductNumber"
+
+
+class AttributeIndex:
+    """Filas de atributos agrupadas por producto (offset, longitud)."""
+
+    def __init__(self, table: pa.Table) -> None:
+        self._groups: Dict[str, Tuple[int, int]] = {}
+        if KEY_COLUMN not in table.column_names:
+            # Sin columna de producto el filtro original devolvía la tabla
+            # completa para cualquier producto.
+            self.table: pa.Table = table
+            self._everything: Optional[pa.Table] = table
+            return
+        self._everything = None
+        keys = pc.cast(table[KEY_COLUMN], pa.string())
+        table = table.set_column(table.column_names.index(KEY_COLUMN), KEY_COLUMN, keys)
+        table = table.filter(pc.is_valid(keys))
+        order = pc.sort_indices(table, sort_keys=[(KEY_COLUMN, "ascending")])
+        self.table = table.take(order)
+
+        sorted_keys = self.table[KEY_COLUMN].combine_chunks()
+        if not len(sorted_keys):
+            return
+        codes = pc.dictionary_encode(sorted_keys).indices.to_numpy(zero_copy_only=False)
+        starts = np.concatenate(([0], np.flatnonzero(codes[1:] != codes[:-1]) + 1))
+        lengths = np.diff(np.concatenate((starts, [len(codes)])))
+        names = sorted_keys.take(pa.array(starts)).to_pylist()
+        self._groups = dict(zip(names, zip(starts.tolist(), lengths.tolist())))
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    def rows(self, product_id: str) -> Optional[pa.Table]:
+        """Filas de ``product_id`` como ``slice`` de la tabla ordenada."""
+        if self._everything is not None:
+            return self._everything
+        group = self._groups.get(product_id)
+        if group is None:
+            return None
+        return self.table.slice(*group)
+
+    def rows_many(self, product_ids: Iterable[str]) -> Dict[str, pa.Table]:
+        result: Dict[str, pa.Table] = {}
+        for product_id in product_ids:
+            rows = self.rows(product_id)
+            if rows is not None:
+                result[product_id] = rows
+        return result
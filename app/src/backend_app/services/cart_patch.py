@@ -0,0 +1,75 @@
+"""Operaciones de línea para sincronizar el carrito remoto por parches.
+
+El front envía sólo los cambios desde la última versión sincronizada en lugar
+del carrito completo. Las operaciones se aplican en orden sobre una copia del
+carrito guardado; cualquier operación inválida cancela el parche completo.
+"""
+from __future__ import annotations
+
+import copy
+from typing import Any, Dict, List, Sequence
+
+OPERATIONS = ("add", "update_quantity", "remove", "set_client", "set")
+
+
+def _lines(cart: Dict[str, Any]) -> List[Dict[str, Any]]:
+    lines = cart.get("lines")
+    if not isinstance(lines, list):
+        lines = []
+        cart["lines"] = lines
+    return lines
+
+
+def _line_position(lines: Sequence[Dict[str, Any]], line_id: Any) -> int:
+    for position, line in enumerate(lines):
+        if isinstance(line, dict) and line.get("lineId") == line_id:
+            return position
+    return -1
+
+
+def apply_operations(cart: Dict[str, Any], operations: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Devuelve ``cart`` con ``operations`` aplicadas; ``ValueError`` si alguna es inválida.
+
+    * ``{"op": "add", "line": {...}}``: agrega la línea (o la reemplaza si su
+      ``lineId`` ya existe).
+    * ``{"op": "update_quantity", "lineId": ..., "quantity": n}``
+    * ``{"op": "remove", "lineId": ...}``
+    * ``{"op": "set_client", "client": {...} | null}``
+    * ``{"op": "set", "field": ..., "value": ...}``: cualquier otro campo de
+      primer nivel (logística, descuentos, pagos, nota...).
+    """
+    cart = copy.deepcopy(cart) if isinstance(cart, dict) else {}
+    for operation in operations:
+        if not isinstance(operation, dict) or operation.get("op") not in OPERATIONS:
+            raise ValueError(f"Operación inválida: {operation!r}")
+        kind = operation["op"]
+        lines = _lines(cart)
+        if kind == "add":
+            line = operation.get("line")
+            if not isinstance(line, dict) or not line.get("lineId"):
+                raise ValueError("'add' requiere una línea con lineId")
+            position = _line_position(lines, line["lineId"])
+            if position >= 0:
+                lines[position] = line
+            else:
+                lines.append(line)
+        elif kind == "update_quantity":
+            position = _line_position(lines, operation.get("lineId"))
+            quantity = operation.get("quantity")
+            if position < 0:
+                raise ValueError(f"Línea inexistente: {operation.get('lineId')!r}")
+            if isinstance(quantity, bool) or not isinstance(quantity, (int, float)):
+                raise ValueError("'update_quantity' requiere una cantidad numérica")
+            lines[position] = {**lines[position], "quantity": quantity}
+        elif kind == "remove":
+            position = _line_position(lines, operation.get("lineId"))
+            if position >= 0:
+                del lines[position]
+        elif kind == "set_client":
+            cart["client"] = operation.get("client")
+        else:
+            field = operation.get("field")
+            if not isinstance(field, str) or not field or field == "lines":
+                raise ValueError("'set' requiere un campo distinto de 'lines'")
+            cart[field] = operation.get("value")
+    return cart
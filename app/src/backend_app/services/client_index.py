@@ -0,0 +1,83 @@
+"""Índices de búsqueda sobre ``clientes_cache.parquet``.
+
+Se construyen una vez por recarga del Parquet:
+
+* mapas exactos de documento (``doc``, ``dni``, ``nif``, ``numero_cliente``) en
+  minúsculas → filas, para búsquedas y validaciones en O(1);
+* un ``TextIndex`` sobre las columnas de búsqueda para la coincidencia por
+  subcadena de ``/api/clientes/search``, de la que sólo se materializan las
+  primeras ``limit`` filas.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .product_search import HAYSTACK_SEPARATOR, text_or_null
+from .text_index import TextIndex, build_postings
+
+SEARCH_COLUMNS = ("nif", "numero_cliente", "nombre_cliente", "nombre_completo", "doc", "dni")
+DOCUMENT_COLUMNS = ("doc", "dni", "nif", "numero_cliente")
+
+_NO_ROWS = np.empty(0, dtype=np.int32)
+
+
+def _lowered(table: pa.Table, name: str) -> pa.Array:
+    return pc.utf8_lower(text_or_null(table[name].combine_chunks()))
+
+
+class ClientIndex:
+    """Clientes indexados por documento y por texto."""
+
+    def __init__(self, table: pa.Table) -> None:
+        self.table = table
+        present = [name for name in DOCUMENT_COLUMNS if name in table.column_names]
+        keys = [_lowered(table, name) for name in present]
+        valid = [pc.is_valid(array) for array in keys]
+        if keys:
+            encoded = pc.dictionary_encode(pa.concat_arrays([array.filter(mask) for array, mask in zip(keys, valid)]))
+            rows = np.concatenate([pc.indices_nonzero(mask).to_numpy() for mask in valid])
+            names = encoded.dictionary.to_pylist()
+            self._doc_offsets, self._doc_rows = build_postings(
+                encoded.indices.to_numpy(zero_copy_only=False), rows, len(names), table.num_rows
+            )
+            self._documents: Dict[str, int] = dict(zip(names, range(len(names))))
+        else:
+            self._documents = {}
+
+        searchable = [name for name in SEARCH_COLUMNS if name in table.column_names]
+        self._text: Optional[TextIndex] = None
+        if searchable:
+            columns = [pc.fill_null(_lowered(table, name), "") for name in searchable]
+            self._text = TextIndex(pc.binary_join_element_wise(*columns, HAYSTACK_SEPARATOR))
+
+    def document_rows(self, document: str) -> np.ndarray:
+        """Filas cuyo documento o número de cliente es ``document`` (sin mayúsculas)."""
+        position = self._documents.get(document.lower())
+        if position is None:
+            return _NO_ROWS
+        return self._doc_rows[self._doc_offsets[position]:self._doc_offsets[position + 1]]
+
+    def find_document(self, document: str) -> Optional[Dict[str, Any]]:
+        rows = self.document_rows(document)
+        if not len(rows):
+            return None
+        return self.table.slice(int(rows[0]), 1).to_pylist()[0]
+
+    def search(self, query: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """Clientes que contienen ``query`` en alguna columna de búsqueda.
+
+        Las coincidencias exactas de documento van primero; el resto sigue el
+        orden de la tabla. Sólo se convierten a diccionarios ``limit`` filas.
+        """
+        query = query.lower()
+        if self._text is None:
+            return self.table.slice(0, limit).to_pylist()
+        exact = self.document_rows(query)
+        rows = self._text.search([query])
+        if len(exact):
+            rows = np.concatenate((exact, rows[~np.isin(rows, exact)]))
+        return self.table.take(pa.array(rows[:limit])).to_pylist()
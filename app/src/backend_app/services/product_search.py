@@ -0,0 +1,436 @@
+"""Motor columnar para ``/api/productos/search``.
+
+Replica la semántica de ``_normalize_product`` / ``_normalize_text`` /
+``_matches_tokens`` de ``backend_app.main`` pero expresada con kernels de
+``pyarrow.compute`` sobre la tabla completa. Las columnas normalizadas se
+calculan una sola vez por recarga del Parquet (ver
+``ParquetCache.load_derived``) y el endpoint sólo materializa en diccionarios
+las filas de la página solicitada.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .text_index import TextIndex, build_postings
+
+# Equivalente a ``ch.isalnum() or ch in {" ", "-", "."}`` tras la
+# descomposición NFD: descarta marcas diacríticas y puntuación.
+_NORMALIZE_DROP_PATTERN = r"[^\p{L}\p{N} .\-]"
+_NUMBER_PATTERN = r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$"
+
+
+@dataclass
+class SearchFilters:
+    tokens: List[str]
+    category: str = ""
+    coverage_group: str = ""
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    stock_positive: bool = True
+    stock_zero: bool = True
+    stock_negative: bool = False
+
+
+# =============================================================================
+# Kernels auxiliares
+# =============================================================================
+def column_or_nulls(table: pa.Table, name: str) -> pa.Array:
+    if name in table.column_names:
+        return table[name].combine_chunks()
+    return pa.nulls(table.num_rows)
+
+
+def _truthy(array: pa.Array) -> pa.Array:
+    """Máscara con la semántica de ``bool(valor)`` de Python (nulos → False)."""
+    kind = array.type
+    if pa.types.is_null(kind):
+        return pa.repeat(False, len(array))
+    if pa.types.is_string(kind) or pa.types.is_large_string(kind):
+        mask = pc.greater(pc.utf8_length(array), 0)
+    elif pa.types.is_boolean(kind):
+        mask = array
+    elif pa.types.is_integer(kind) or pa.types.is_floating(kind) or pa.types.is_decimal(kind):
+        mask = pc.not_equal(array, 0)
+    else:
+        mask = pc.is_valid(array)
+    return pc.fill_null(mask, False)
+
+
+def first_truthy(arrays: Sequence[pa.Array], convert: Callable[[pa.Array], pa.Array], target: pa.DataType) -> pa.Array:
+    """Equivalente vectorizado de ``a or b or c`` convirtiendo el ganador."""
+    length = len(arrays[0]) if arrays else 0
+    result = pa.nulls(length, type=target)
+    for array in reversed(arrays):
+        result = pc.if_else(_truthy(array), convert(array), result)
+    return result
+
+
+def as_text(array: pa.Array) -> pa.Array:
+    """Equivalente de ``_string``: texto recortado, ``""`` para nulos."""
+    if not (pa.types.is_string(array.type) or pa.types.is_large_string(array.type)):
+        array = pc.cast(array, pa.string())
+    return pc.fill_null(pc.utf8_trim_whitespace(array), "")
+
+
+def normalize_text(array: pa.Array) -> pa.Array:
+    """Versión columnar de ``_normalize_text`` (minúsculas, NFD sin acentos)."""
+    text = pc.utf8_lower(as_text(array))
+    text = pc.utf8_normalize(text, form="NFD")
+    text = pc.replace_substring_regex(text, pattern=_NORMALIZE_DROP_PATTERN, replacement="")
+    return pc.utf8_trim_whitespace(text)
+
+
+def coerce_float(array: pa.Array, fallback: float = 0.0) -> pa.Array:
+    """Versión columnar de ``_coerce_float``."""
+    kind = array.type
+    if pa.types.is_null(kind):
+        return pa.repeat(float(fallback), len(array))
+    if pa.types.is_integer(kind) or pa.types.is_floating(kind) or pa.types.is_decimal(kind) or pa.types.is_boolean(kind):
+        return pc.fill_null(pc.cast(array, pa.float64()), fallback)
+    text = as_text(array)
+    thousands = pc.and_(
+        pc.equal(pc.count_substring(text, ","), 1),
+        pc.greater(pc.count_substring(text, "."), 1),
+    )
+    text = pc.if_else(thousands, pc.replace_substring(text, ".", ""), text)
+    text = pc.replace_substring(text, ",", ".")
+    valid = pc.match_substring_regex(text, _NUMBER_PATTERN)
+    parsed = pc.cast(pc.if_else(valid, text, pa.scalar(None, pa.string())), pa.float64())
+    return pc.fill_null(parsed, fallback)
+
+
+def text_or_null(array: pa.Array) -> pa.Array:
+    if pa.types.is_null(array.type):
+        return pa.nulls(len(array), type=pa.string())
+    return pc.cast(array, pa.string())
+
+
+# =============================================================================
+# Columnas de búsqueda precalculadas
+# =============================================================================
+# Las columnas derivadas viajan junto a las originales con este prefijo para
+# no colisionar con campos del Parquet (``precio``, ``stock``, ``categoria``...).
+SEARCH_COLUMN_PREFIX = "__search_"
+COL_CATEGORY = SEARCH_COLUMN_PREFIX + "categoria"
+COL_COVERAGE = SEARCH_COLUMN_PREFIX + "grupo_cobertura"
+COL_PRICE = SEARCH_COLUMN_PREFIX + "precio"
+COL_STOCK = SEARCH_COLUMN_PREFIX + "stock"
+COL_NAME = SEARCH_COLUMN_PREFIX + "n_nombre"
+COL_N_CATEGORY = SEARCH_COLUMN_PREFIX + "n_categoria"
+COL_N_COVERAGE = SEARCH_COLUMN_PREFIX + "n_cobertura"
+COL_HAYSTACK = SEARCH_COLUMN_PREFIX + "haystack"
+COL_CODE_HAYSTACK = SEARCH_COLUMN_PREFIX + "code_haystack"
+
+# Separador imposible en un texto normalizado (no es alfanumérico), de modo
+# que un token nunca puede coincidir "a caballo" entre dos campos.
+HAYSTACK_SEPARATOR = "\x1f"
+
+CODE_COLUMNS = ("numero_producto", "codigo", "nombre_producto", "nombre", "codigo_barras", "barcode")
+
+SORT_KEYS = {
+    "priceAsc": (COL_PRICE, "ascending"),
+    "priceDesc": (COL_PRICE, "descending"),
+    "nameAsc": (COL_NAME, "ascending"),
+    "nameDesc": (COL_NAME, "descending"),
+    "stockDesc": (COL_STOCK, "descending"),
+}
+
+
+def _join(arrays: Sequence[pa.Array]) -> pa.Array:
+    return pc.binary_join_element_wise(*arrays, HAYSTACK_SEPARATOR)
+
+
+def build_search_columns(table: pa.Table) -> Dict[str, pa.Array]:
+    """Calcula las columnas que ``_normalize_product`` derivaría fila a fila.
+
+    ``table`` ya debe tener aplicados los renombres de ``PRODUCT_COLUMN_MAPPING``.
+    """
+    col = lambda name: column_or_nulls(table, name)  # noqa: E731
+
+    codigo = as_text(first_truthy([col("numero_producto"), col("productId"), col("id"), col("codigo")], text_or_null, pa.string()))
+    nombre = as_text(
+        first_truthy(
+            [col("nombre_producto"), col("nombre"), col("productName"), col("descripcion"), codigo],
+            text_or_null,
+            pa.string(),
+        )
+    )
+    nombre = pc.if_else(pc.equal(nombre, ""), "Producto", nombre)
+    descripcion = pc.coalesce(
+        first_truthy([col("descripcion"), col("descripcion_corta")], text_or_null, pa.string()),
+        nombre,
+    )
+    categoria = as_text(first_truthy([col("categoria_producto"), col("categoria")], text_or_null, pa.string()))
+    grupo_cobertura = as_text(col("grupo_cobertura"))
+    barcode = first_truthy([col("barcode"), col("codigo_barras")], text_or_null, pa.string())
+    precio = pc.fill_null(
+        first_truthy(
+            [col("precio_final_con_descuento"), col("precio_final_con_iva"), col("precio")],
+            coerce_float,
+            pa.float64(),
+        ),
+        0.0,
+    )
+    stock = pc.fill_null(
+        first_truthy([col("total_disponible_venta"), col("stock")], coerce_float, pa.float64()),
+        0.0,
+    )
+
+    n_nombre = normalize_text(nombre)
+    n_categoria = normalize_text(categoria)
+    n_cobertura = normalize_text(grupo_cobertura)
+    haystack = _join(
+        [n_nombre, normalize_text(descripcion), n_categoria, n_cobertura, normalize_text(codigo), normalize_text(barcode)]
+    )
+    # ``/api/productos/by_code`` compara en minúsculas sin quitar acentos.
+    code_haystack = _join([pc.utf8_lower(as_text(col(name))) for name in CODE_COLUMNS])
+
+    return {
+        COL_CATEGORY: categoria,
+        COL_COVERAGE: grupo_cobertura,
+        COL_PRICE: precio,
+        COL_STOCK: stock,
+        COL_NAME: n_nombre,
+        COL_N_CATEGORY: n_categoria,
+        COL_N_COVERAGE: n_cobertura,
+        COL_HAYSTACK: haystack,
+        COL_CODE_HAYSTACK: code_haystack,
+    }
+
+
+def with_search_columns(table: pa.Table) -> pa.Table:
+    """Devuelve ``table`` con las columnas de búsqueda agregadas al final."""
+    for name, array in build_search_columns(table).items():
+        table = table.append_column(name, array)
+    return table
+
+
+def raw_column_names(table: pa.Table) -> List[str]:
+    return [name for name in table.column_names if not name.startswith(SEARCH_COLUMN_PREFIX)]
+
+
+# =============================================================================
+# Particiones por tienda
+# =============================================================================
+_NO_ROWS = np.empty(0, dtype=np.int32)
+
+
+def partition_by_store(table: pa.Table, columns: Sequence[str]) -> Optional[Dict[str, np.ndarray]]:
+    """Filas (ordenadas) de cada tienda, con la clave en minúsculas.
+
+    Replica ``_store_mask``: una fila pertenece a una tienda si cualquiera de
+    las ``columns`` coincide en minúsculas. ``None`` si ninguna columna aplica.
+    """
+    keys: List[pa.Array] = []
+    rows: List[np.ndarray] = []
+    found = False
+    for name in columns:
+        if name not in table.column_names:
+            continue
+        try:
+            lowered = pc.cast(pc.utf8_lower(table[name].combine_chunks()), pa.string())
+        except Exception:
+            continue
+        found = True
+        valid = pc.is_valid(lowered)
+        keys.append(lowered.filter(valid))
+        rows.append(pc.indices_nonzero(valid).to_numpy())
+    if not found:
+        return None
+    encoded = pc.dictionary_encode(pa.concat_arrays(keys))
+    names = encoded.dictionary.to_pylist()
+    offsets, members = build_postings(
+        encoded.indices.to_numpy(zero_copy_only=False), np.concatenate(rows), len(names), table.num_rows
+    )
+    return {name: members[offsets[i]:offsets[i + 1]] for i, name in enumerate(names)}
+
+
+@dataclass
+class FacetSet:
+    """Categorías y grupos de cobertura distintos de un conjunto de filas."""
+
+    categories: List[str]
+    coverage_groups: List[str]
+
+
+_NO_FACETS = FacetSet(categories=[], coverage_groups=[])
+
+
+def build_facet_sets(table: pa.Table, stores: Optional[Dict[str, np.ndarray]]) -> Dict[Optional[str], FacetSet]:
+    """Facetas del catálogo completo (clave ``None``) y de cada tienda."""
+    categories = table[COL_CATEGORY].combine_chunks()
+    coverage = table[COL_COVERAGE].combine_chunks()
+    facets: Dict[Optional[str], FacetSet] = {
+        None: FacetSet(distinct_facet_values(categories), distinct_facet_values(coverage)),
+    }
+    for store, rows in (stores or {}).items():
+        indices = pa.array(rows)
+        facets[store] = FacetSet(
+            distinct_facet_values(categories.take(indices)),
+            distinct_facet_values(coverage.take(indices)),
+        )
+    return facets
+
+
+@dataclass
+class ProductCatalog:
+    """Tabla de productos con las columnas e índices de búsqueda de una recarga."""
+
+    table: pa.Table
+    text_index: TextIndex
+    code_index: TextIndex
+    stores: Optional[Dict[str, np.ndarray]] = None
+    facets: Dict[Optional[str], FacetSet] = field(default_factory=dict)
+
+    def store_rows(self, store: Optional[str]) -> Optional[np.ndarray]:
+        """Filas de ``store`` o ``None`` si no corresponde filtrar por tienda."""
+        if not store or self.stores is None:
+            return None
+        return self.stores.get(store.strip().lower(), _NO_ROWS)
+
+    def store_facets(self, store: Optional[str]) -> FacetSet:
+        """Facetas precalculadas de ``store`` (o del catálogo completo)."""
+        if not store or self.stores is None:
+            return self.facets.get(None, _NO_FACETS)
+        return self.facets.get(store.strip().lower(), _NO_FACETS)
+
+
+def build_catalog(table: pa.Table, store_columns: Sequence[str] = ()) -> ProductCatalog:
+    """Agrega las columnas de búsqueda y construye índices y particiones."""
+    table = with_search_columns(table)
+    stores = partition_by_store(table, store_columns)
+    return ProductCatalog(
+        table=table,
+        text_index=TextIndex(table[COL_HAYSTACK]),
+        code_index=TextIndex(table[COL_CODE_HAYSTACK]),
+        stores=stores,
+        facets=build_facet_sets(table, stores),
+    )
+
+
+# =============================================================================
+# Filtros, facetas y orden
+# =============================================================================
+def filter_mask(view: pa.Table, filters: SearchFilters) -> pa.Array:
+    """Máscara booleana con los filtros de categoría, cobertura, precio y stock.
+
+    Los tokens de texto se resuelven con el índice invertido (``select_rows``).
+    """
+    mask = pa.repeat(True, view.num_rows)
+
+    if filters.category:
+        mask = pc.and_(mask, pc.equal(view[COL_N_CATEGORY], filters.category))
+    if filters.coverage_group:
+        mask = pc.and_(mask, pc.equal(view[COL_N_COVERAGE], filters.coverage_group))
+
+    precio = view[COL_PRICE]
+    if filters.min_price is not None:
+        mask = pc.and_(mask, pc.greater_equal(precio, float(filters.min_price)))
+    if filters.max_price is not None:
+        mask = pc.and_(mask, pc.less_equal(precio, float(filters.max_price)))
+
+    if filters.stock_positive or filters.stock_zero or filters.stock_negative:
+        stock = view[COL_STOCK]
+        stock_mask = pa.repeat(False, view.num_rows)
+        if filters.stock_positive:
+            stock_mask = pc.or_(stock_mask, pc.greater(stock, 0))
+        if filters.stock_zero:
+            stock_mask = pc.or_(stock_mask, pc.equal(stock, 0))
+        if filters.stock_negative:
+            stock_mask = pc.or_(stock_mask, pc.less(stock, 0))
+        mask = pc.and_(mask, stock_mask)
+
+    return pc.fill_null(mask, False)
+
+
+def distinct_facet_values(array: pa.Array) -> List[str]:
+    """Valores distintos (sin distinguir mayúsculas) en orden de aparición."""
+    seen = set()
+    values: List[str] = []
+    for value in pc.unique(array).to_pylist():
+        if not value:
+            continue
+        upper = value.upper()
+        if upper in seen:
+            continue
+        seen.add(upper)
+        values.append(value)
+    return sorted(values, key=lambda value: value.lower())
+
+
+def facet_counts(values: pa.Array, names: Sequence[str]) -> List[Dict[str, Any]]:
+    """Cantidad de filas por faceta usando ``pc.value_counts`` sobre ``values``.
+
+    ``names`` son las facetas precalculadas: definen el nombre a mostrar y el
+    orden. Los valores se agrupan sin distinguir mayúsculas, igual que ellas.
+    """
+    totals: Dict[str, int] = {}
+    for entry in pc.value_counts(values).to_pylist():
+        value = entry["values"]
+        if value:
+            key = value.upper()
+            totals[key] = totals.get(key, 0) + entry["counts"]
+    return [{"name": name, "count": totals[name.upper()]} for name in names if name.upper() in totals]
+
+
+def _mask_rows(mask: pa.Array, rows: Optional[np.ndarray] = None) -> np.ndarray:
+    if rows is None:
+        return pc.indices_nonzero(mask).to_numpy().astype(np.int32)
+    return rows[mask.to_numpy(zero_copy_only=False)]
+
+
+_FILTER_COLUMNS = [COL_N_CATEGORY, COL_N_COVERAGE, COL_PRICE, COL_STOCK]
+
+
+def _filter_rows(table: pa.Table, filters: SearchFilters, rows: Optional[np.ndarray]) -> np.ndarray:
+    if rows is None:
+        return _mask_rows(filter_mask(table, filters))
+    return _mask_rows(filter_mask(table.select(_FILTER_COLUMNS).take(rows), filters), rows)
+
+
+def select_rows(
+    catalog: ProductCatalog,
+    filters: SearchFilters,
+    sort: str,
+    base_rows: Optional[np.ndarray] = None,
+) -> pa.Array:
+    """Filas que cumplen ``filters`` dentro de ``base_rows``, ordenadas según ``sort``.
+
+    Con texto libre los candidatos salen del índice invertido; con tienda
+    (``base_rows``) los filtros se evalúan sólo sobre las filas de esa tienda.
+    """
+    rows = base_rows
+    if filters.tokens:
+        rows = catalog.text_index.search(filters.tokens)
+        if base_rows is not None:
+            rows = np.intersect1d(rows, base_rows, assume_unique=True)
+    rows = _filter_rows(catalog.table, filters, rows)
+
+    if sort == "relevance" and filters.tokens:
+        scores = catalog.text_index.score_rows(filters.tokens, rows)
+        return pa.array(rows[np.argsort(-scores, kind="stable")])
+    return sort_indices(catalog.table, pa.array(rows), sort)
+
+
+def select_code_rows(catalog: ProductCatalog, code: str, base_rows: Optional[np.ndarray] = None) -> np.ndarray:
+    """Filas cuyo código, nombre o código de barras contienen ``code``."""
+    rows = catalog.code_index.search([code])
+    if base_rows is not None:
+        rows = np.intersect1d(rows, base_rows, assume_unique=True)
+    return rows
+
+
+def sort_indices(view: pa.Table, indices: pa.Array, sort: str) -> pa.Array:
+    """Ordena de forma estable las filas seleccionadas según ``sort``."""
+    spec = SORT_KEYS.get(sort)
+    if spec is None or len(indices) == 0:
+        return indices
+    column, order = spec
+    keys = pc.take(view[column], indices)
+    order_idx = pc.sort_indices(pa.table({"key": keys}), sort_keys=[("key", order)])
+    return pc.take(indices, order_idx)
@@ -0,0 +1,110 @@
+"""Índice hash de ``stock_cache.parquet`` por (código, almacén).
+
+Reproduce la selección fila a fila de ``/api/stock/{product_code}/{store_id}``:
+el código es el primer valor no vacío de ``codigo`` / ``numero_producto`` /
+``productId`` y una fila pertenece a un almacén si cualquiera de
+``STORE_COLUMNS`` coincide (recortado y en minúsculas). Las filas sin código
+aplican a cualquier producto de su almacén, igual que antes.
+
+El índice se arma una vez por recarga del Parquet y guarda, por cada clave,
+un rango dentro de un arreglo de filas ordenado: una consulta es un acceso a
+diccionario y sólo se convierten a Python las filas encontradas.
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, Iterable, List, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from .product_search import as_text, column_or_nulls, first_truthy, text_or_null
+from .text_index import build_postings
+
+CODE_COLUMNS = ("codigo", "numero_producto", "productId")
+STORE_COLUMNS = ("almacen", "almacen_nombre", "almacen_365", "store")
+KEY_SEPARATOR = "\x1f"
+
+_NO_ROWS = np.empty(0, dtype=np.int32)
+
+
+def _key(code: str, store: str) -> str:
+    return f"{code}{KEY_SEPARATOR}{store}"
+
+
+class StockIndex:
+    """Filas de stock agrupadas por ``(código, almacén)`` normalizados."""
+
+    def __init__(self, table: pa.Table) -> None:
+        self.table = table
+        col = lambda name: column_or_nulls(table, name)  # noqa: E731
+        codes = pc.utf8_lower(as_text(first_truthy([col(name) for name in CODE_COLUMNS], text_or_null, pa.string())))
+
+        keys: List[pa.Array] = []
+        rows: List[np.ndarray] = []
+        for name in STORE_COLUMNS:
+            stores = pc.utf8_lower(as_text(col(name)))
+            present = pc.greater(pc.utf8_length(stores), 0)
+            keys.append(pc.binary_join_element_wise(codes, stores, KEY_SEPARATOR).filter(present))
+            rows.append(pc.indices_nonzero(present).to_numpy())
+        encoded = pc.dictionary_encode(pa.concat_arrays(keys))
+        names = encoded.dictionary.to_pylist()
+        # Una fila aparece una sola vez por clave aunque varias columnas de
+        # almacén tengan el mismo valor.
+        self._offsets, self._rows = build_postings(
+            encoded.indices.to_numpy(zero_copy_only=False),
+            np.concatenate(rows),
+            len(names),
+            table.num_rows,
+        )
+        self._positions: Dict[str, int] = dict(zip(names, range(len(names))))
+
+    def _slice(self, key: str) -> np.ndarray:
+        position = self._positions.get(key)
+        if position is None:
+            return _NO_ROWS
+        return self._rows[self._offsets[position]:self._offsets[position + 1]]
+
+    def rows(self, code: str, store: str) -> np.ndarray:
+        """Filas (en orden de la tabla) de ``code`` en ``store``."""
+        code = code.strip().lower()
+        store = store.strip().lower()
+        if not code or not store:
+            return _NO_ROWS
+        exact = self._slice(_key(code, store))
+        generic = self._slice(_key("", store))
+        if not len(generic):
+            return exact
+        return np.union1d(exact, generic).astype(np.int32)
+
+    def rows_many(self, codes: Iterable[str], stores: Iterable[str]) -> np.ndarray:
+        """Filas de cualquiera de ``codes`` en cualquiera de ``stores``."""
+        found = [self.rows(code, store) for store in dict.fromkeys(stores) for code in codes]
+        found = [rows for rows in found if len(rows)]
+        if not found:
+            return _NO_ROWS
+        return np.unique(np.concatenate(found)).astype(np.int32)
+
+    def records(self, rows: np.ndarray) -> List[Dict[str, Any]]:
+        """Filas como diccionarios, listas para armar la respuesta."""
+        if not len(rows):
+            return []
+        return self.table.take(pa.array(rows)).to_pylist()
+
+    def lookup(self, code: str, store: str) -> List[Dict[str, Any]]:
+        return self.records(self.rows(code, store))
+
+    def lookup_many(self, codes: Iterable[str], stores: Sequence[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Filas de cada código de ``codes`` en cualquiera de ``stores``.
+
+        Todas las filas encontradas se materializan con un único ``take``.
+        """
+        normalized = list(dict.fromkeys(code.strip().lower() for code in codes if code and code.strip()))
+        found = [self.rows_many([code], stores) for code in normalized]
+        records = self.records(np.concatenate(found)) if found else []
+        result: Dict[str, List[Dict[str, Any]]] = {}
+        start = 0
+        for code, rows in zip(normalized, found):
+            result[code] = records[start:start + len(rows)]
+            start += len(rows)
+        return result
@@ -0,0 +1,234 @@
+"""Índice invertido en memoria para búsquedas de texto por subcadena.
+
+El índice se construye sobre los textos *distintos* de una columna (muchas
+filas SKU×tienda comparten el mismo texto) y guarda:
+
+* un vocabulario ordenado de términos con sus postings (término → textos), que
+  resuelve búsquedas por prefijo con ``bisect`` y alimenta la relevancia;
+* postings de trigramas sobre el vocabulario (trigrama → términos), para
+  encontrar los términos que contienen una subcadena sin recorrer la columna.
+
+Un token sin espacios sólo puede aparecer dentro de un único término, así que
+"texto contiene token" equivale a "algún término del texto contiene token".
+Las filas originales se recuperan con una estructura CSR (texto → filas), por
+lo que el costo de una consulta depende de la cantidad de coincidencias y no
+del tamaño del catálogo.
+"""
+from __future__ import annotations
+
+import bisect
+import re
+from typing import Iterable, List, Optional, Sequence
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+NGRAM = 3
+# Espacios ASCII y el separador de campos de los textos concatenados.
+_SEPARATORS = " \t\n\r\f\v\x1f"
+_WORD_PATTERN = "[" + re.escape(_SEPARATORS) + "]+"
+_WORD_SPLIT = re.compile(_WORD_PATTERN)
+_EMPTY = np.empty(0, dtype=np.int32)
+
+# Pesos de relevancia por token: la coincidencia por subcadena suma 1 y se
+# premian términos completos, prefijos de término y el inicio del texto.
+SCORE_SUBSTRING = 1.0
+SCORE_PREFIX = 2.0
+SCORE_TERM = 3.0
+SCORE_LEADING = 1.0
+
+
+def _ngrams(text: str) -> Iterable[str]:
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+def _intersect(postings: Sequence[np.ndarray]) -> np.ndarray:
+    ordered = sorted(postings, key=len)
+    result = ordered[0]
+    for current in ordered[1:]:
+        if not len(result):
+            break
+        result = np.intersect1d(result, current, assume_unique=True)
+    return result
+
+
+def build_postings(keys: np.ndarray, values: np.ndarray, num_keys: int, width: int):
+    """Agrupa pares ``(clave, valor)`` en CSR sin duplicados: ``(offsets, valores)``."""
+    width = max(width, 1)
+    pairs = np.sort(keys.astype(np.int64) * width + values)
+    if len(pairs):
+        pairs = pairs[np.concatenate(([True], pairs[1:] != pairs[:-1]))]
+    offsets = np.searchsorted(pairs // width, np.arange(num_keys + 1))
+    return offsets, (pairs % width).astype(np.int32)
+
+
+def _csr_gather(offsets: np.ndarray, values: np.ndarray, keys: np.ndarray) -> np.ndarray:
+    """Concatena ``values[offsets[k]:offsets[k + 1]]`` para cada ``k`` sin bucles."""
+    starts = offsets[keys]
+    lengths = offsets[keys + 1] - starts
+    total = int(lengths.sum())
+    if not total:
+        return _EMPTY
+    shift = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return values[np.arange(total) + shift]
+
+
+class TextIndex:
+    """Índice de términos y trigramas sobre una columna de texto."""
+
+    def __init__(self, values) -> None:
+        if isinstance(values, pa.ChunkedArray):
+            values = values.combine_chunks()
+        encoded = pc.dictionary_encode(pc.fill_null(values, ""))
+        self._texts: pa.Array = encoded.dictionary
+        self._codes = encoded.indices.to_numpy(zero_copy_only=False).astype(np.int32, copy=False)
+        num_docs = len(self._texts)
+
+        # Filas agrupadas por texto (CSR).
+        counts = np.bincount(self._codes, minlength=num_docs)
+        self._row_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self._rows = np.argsort(self._codes, kind="stable").astype(np.int32)
+
+        # Términos de cada texto, separados con kernels de pyarrow.
+        split = pc.split_pattern_regex(self._texts, _WORD_PATTERN)
+        parents = pc.list_parent_indices(split).to_numpy(zero_copy_only=False)
+        terms = pc.list_flatten(split)
+        keep = pc.greater(pc.utf8_length(terms), 0)
+        terms = terms.filter(keep)
+        parents = parents[keep.to_numpy(zero_copy_only=False)].astype(np.int64)
+
+        encoded_terms = pc.dictionary_encode(terms)
+        order = pc.sort_indices(encoded_terms.dictionary).to_numpy()
+        rank = np.empty(len(order), dtype=np.int64)
+        rank[order] = np.arange(len(order))
+        self._vocabulary: List[str] = encoded_terms.dictionary.take(pa.array(order)).to_pylist()
+        self._vocabulary_array = pa.array(self._vocabulary, type=pa.string())
+
+        # Postings término → textos y trigrama → términos.
+        num_terms = len(self._vocabulary)
+        term_ids = rank[encoded_terms.indices.to_numpy(zero_copy_only=False)]
+        self._term_offsets, self._term_docs = build_postings(term_ids, parents, num_terms, num_docs)
+
+        lengths = pc.utf8_length(self._vocabulary_array).to_numpy(zero_copy_only=False)
+        gram_parts, owners = [], []
+        for start in range(max(int(lengths.max(initial=0)) - NGRAM + 1, 0)):
+            ids = np.flatnonzero(lengths >= start + NGRAM)
+            gram_parts.append(pc.utf8_slice_codeunits(self._vocabulary_array.take(pa.array(ids)), start, start + NGRAM))
+            owners.append(ids)
+        if gram_parts:
+            encoded_grams = pc.dictionary_encode(pa.chunked_array(gram_parts, type=pa.string()).combine_chunks())
+            gram_keys = encoded_grams.indices.to_numpy(zero_copy_only=False)
+            gram_names = encoded_grams.dictionary.to_pylist()
+            self._gram_offsets, self._gram_terms = build_postings(gram_keys, np.concatenate(owners), len(gram_names), num_terms)
+        else:
+            gram_names = []
+            self._gram_offsets, self._gram_terms = np.zeros(1, dtype=np.int64), _EMPTY
+        self._grams = {gram: position for position, gram in enumerate(gram_names)}
+
+    @property
+    def num_rows(self) -> int:
+        return len(self._codes)
+
+    # ------------------------------------------------------------------
+    # Términos
+    # ------------------------------------------------------------------
+    def _terms_containing(self, part: str) -> np.ndarray:
+        postings = []
+        for gram in _ngrams(part):
+            position = self._grams.get(gram)
+            if position is None:
+                return _EMPTY
+            postings.append(self._gram_terms[self._gram_offsets[position]:self._gram_offsets[position + 1]])
+        candidates = _intersect(postings) if postings else None
+        vocabulary = self._vocabulary_array if candidates is None else self._vocabulary_array.take(pa.array(candidates))
+        if not len(vocabulary):
+            return _EMPTY
+        matched = pc.indices_nonzero(pc.match_substring(vocabulary, part)).to_numpy()
+        return matched.astype(np.int64) if candidates is None else candidates[matched].astype(np.int64)
+
+    def _prefix_range(self, prefix: str) -> np.ndarray:
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + "\U0010ffff", lo=start)
+        return np.arange(start, end, dtype=np.int64)
+
+    def _term_id(self, term: str) -> Optional[int]:
+        position = bisect.bisect_left(self._vocabulary, term)
+        if position < len(self._vocabulary) and self._vocabulary[position] == term:
+            return position
+        return None
+
+    def _docs_for_terms(self, term_ids: np.ndarray) -> np.ndarray:
+        if not len(term_ids):
+            return _EMPTY
+        if len(term_ids) == 1:
+            term = int(term_ids[0])
+            return self._term_docs[self._term_offsets[term]:self._term_offsets[term + 1]]
+        return np.unique(_csr_gather(self._term_offsets, self._term_docs, term_ids))
+
+    # ------------------------------------------------------------------
+    # Documentos (textos distintos)
+    # ------------------------------------------------------------------
+    def match_docs(self, tokens: Sequence[str]) -> np.ndarray:
+        """Documentos que contienen todos los ``tokens`` como subcadena."""
+        if not tokens:
+            return np.arange(len(self._texts), dtype=np.int32)
+        docs: Optional[np.ndarray] = None
+        phrases = []
+        for token in tokens:
+            parts = [part for part in _WORD_SPLIT.split(token) if part]
+            if len(parts) != 1 or parts[0] != token:
+                phrases.append(token)
+            for part in parts:
+                current = self._docs_for_terms(self._terms_containing(part))
+                docs = current if docs is None else np.intersect1d(docs, current, assume_unique=True)
+                if not len(docs):
+                    return _EMPTY
+        if docs is None:
+            docs = np.arange(len(self._texts), dtype=np.int32)
+        if phrases:
+            # Tokens con espacios: los términos sólo acotan, se verifica el texto.
+            texts = self._texts.take(pa.array(docs))
+            mask = pc.match_substring(texts, phrases[0])
+            for phrase in phrases[1:]:
+                mask = pc.and_(mask, pc.match_substring(texts, phrase))
+            docs = docs[mask.to_numpy(zero_copy_only=False)]
+        return docs
+
+    def score_docs(self, tokens: Sequence[str], docs: np.ndarray) -> np.ndarray:
+        """Puntaje de relevancia de ``docs`` (que ya contienen los tokens)."""
+        scores = np.full(len(docs), SCORE_SUBSTRING * len(tokens), dtype=np.float64)
+        if not len(docs):
+            return scores
+        texts = self._texts.take(pa.array(docs))
+        for token in tokens:
+            prefixed = self._docs_for_terms(self._prefix_range(token))
+            scores += SCORE_PREFIX * np.isin(docs, prefixed, assume_unique=True)
+            term = self._term_id(token)
+            if term is not None:
+                scores += SCORE_TERM * np.isin(docs, self._docs_for_terms(np.array([term])), assume_unique=True)
+            scores += SCORE_LEADING * pc.starts_with(texts, token).to_numpy(zero_copy_only=False)
+        return scores
+
+    # ------------------------------------------------------------------
+    # Filas
+    # ------------------------------------------------------------------
+    def rows_for_docs(self, docs: np.ndarray) -> np.ndarray:
+        """Filas (ordenadas) cuyo texto pertenece a ``docs``."""
+        if not len(docs):
+            return _EMPTY
+        if len(docs) * 8 > len(self._texts):
+            # Consultas poco selectivas: una pasada vectorizada es más barata.
+            selected = np.zeros(len(self._texts), dtype=bool)
+            selected[docs] = True
+            return np.flatnonzero(selected[self._codes]).astype(np.int32)
+        return np.sort(_csr_gather(self._row_offsets, self._rows, np.asarray(docs, dtype=np.int64)))
+
+    def search(self, tokens: Sequence[str]) -> np.ndarray:
+        """Filas (ordenadas) que contienen todos los ``tokens``."""
+        return self.rows_for_docs(self.match_docs(tokens))
+
+    def score_rows(self, tokens: Sequence[str], rows: np.ndarray) -> np.ndarray:
+        """Puntaje de relevancia por fila para filas que ya coinciden."""
+        docs, inverse = np.unique(self._codes[rows], return_inverse=True)
+        return self.score_docs(tokens, docs)[inverse]
@@ -0,0 +1,100 @@
+"""Compara un ``httpx.AsyncClient`` por operación contra el cliente compartido.
+
+Uso (desde ``app/src``)::
+
+    python scripts/bench_d365_http.py [presupuestos] [latencia_ms]
+
+Levanta un servidor OData falso en localhost que simula la cabecera
+(``POST .../CustomerQuotationHeaders``) y el ``$batch`` de líneas, y agrega
+``latencia_ms`` por cada conexión nueva para aproximar el handshake TCP+TLS
+contra Dynamics. No toca D365.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import http_client  # noqa: E402
+
+LATENCIA_HANDSHAKE = 0.0
+CONEXIONES = 0
+_lock = threading.Lock()
+
+
+class _OData(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        global CONEXIONES
+        super().setup()
+        with _lock:
+            CONEXIONES += 1
+        time.sleep(LATENCIA_HANDSHAKE)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        cuerpo = b'{"QuotationNumber": "Q-1"}'
+        self.send_response(201)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+async def _presupuesto(client, base):
+    await client.post(f"{base}/data/CustomerQuotationHeaders", json={"a": 1}, timeout=http_client.timeout("alta"))
+    await client.post(f"{base}/data/$batch", content=b"--batch\r\n", timeout=http_client.timeout("lote"))
+
+
+async def _cliente_por_operacion(base, cantidad):
+    for _ in range(cantidad):
+        async with httpx.AsyncClient() as client:
+            await client.post(f"{base}/data/CustomerQuotationHeaders", json={"a": 1})
+        async with httpx.AsyncClient() as client:
+            await client.post(f"{base}/data/$batch", content=b"--batch\r\n")
+
+
+async def _cliente_compartido(base, cantidad):
+    try:
+        for _ in range(cantidad):
+            async with http_client.cliente_compartido() as client:
+                await _presupuesto(client, base)
+    finally:
+        await http_client.cerrar_cliente()
+
+
+def _medir(nombre, funcion, base, cantidad):
+    global CONEXIONES
+    CONEXIONES = 0
+    inicio = time.perf_counter()
+    asyncio.run(funcion(base, cantidad))
+    total = (time.perf_counter() - inicio) / cantidad * 1000
+    print(f"{nombre:<24} {total:8.2f} ms/presupuesto  conexiones={CONEXIONES}")
+
+
+def main():
+    global LATENCIA_HANDSHAKE
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    LATENCIA_HANDSHAKE = (float(sys.argv[2]) if len(sys.argv) > 2 else 20.0) / 1000
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _OData)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{servidor.server_address[1]}"
+    try:
+        _medir("cliente por operación", _cliente_por_operacion, base, cantidad)
+        _medir("cliente compartido", _cliente_compartido, base, cantidad)
+    finally:
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Compara ``conectar_db`` con conexión reutilizable contra una conexión por llamada.
+
+Uso (desde ``app/src``)::
+
+    python scripts/bench_sqlite_pool.py [iteraciones]
+
+Mide lecturas cortas como las de ``get_cart``/``obtener_token_d365`` sobre una
+base temporal; no toca las bases reales.
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import database  # noqa: E402
+
+
+def _medir(iteraciones):
+    inicio = time.perf_counter()
+    for _ in range(iteraciones):
+        with database.conectar_db("misc") as conexion:
+            conexion.execute("SELECT cart_json, timestamp FROM carts WHERE user_id = ?", ("bench",)).fetchone()
+    return (time.perf_counter() - inicio) / iteraciones * 1e6
+
+
+def main():
+    iteraciones = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as directorio:
+        database.DB_PATHS["misc"] = os.path.join(directorio, "misc.db")
+        database.init_tabla("misc")
+        database.save_cart("bench", {"lines": [{"lineId": "l1", "quantity": 1}]}, "t")
+        for pool in (False, True):
+            database.SQLITE_POOL = pool
+            _medir(100)
+            etiqueta = "reutilizada" if pool else "por llamada"
+            print(f"conexión {etiqueta:>11}: {_medir(iteraciones):8.1f} µs/lectura")
+        database.cerrar_conexiones()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+# services/arrow_cache.py
+"""
+Lectura de archivos Parquet a través de copias Arrow IPC mapeadas en memoria.
+
+Con ``SERVICES_PARQUET_MMAP=1`` cada Parquet que deja el proceso externo se
+convierte una sola vez a un archivo Arrow IPC sin compresión que luego se abre
+con ``pa.memory_map``. Las tablas resultantes apuntan directamente a las
+páginas del archivo, de modo que todos los workers de uvicorn comparten la
+misma copia en el page cache del sistema en lugar de tener cada uno la tabla
+completa en su heap.
+
+Los archivos IPC se nombran por ``(mtime, tamaño)`` del Parquet de origen y se
+escriben en un temporal que se publica con ``os.replace``: ningún worker ve un
+IPC a medio escribir y los que todavía mapean la versión anterior la siguen
+leyendo hasta soltarla.
+"""
+import glob
+import os
+import threading
+from typing import Any, Dict, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from services.config import ARROW_CACHE_DIR, PARQUET_MMAP
+
+_BATCH_SIZE = 64 * 1024
+
+
+def ipc_path_for(parquet_path: str, stat: os.stat_result, arrow_dir: str = ARROW_CACHE_DIR) -> str:
+    """Ruta del IPC correspondiente a esta versión de ``parquet_path``."""
+    name = os.path.basename(parquet_path)
+    return os.path.join(arrow_dir, f"{name}.{stat.st_mtime_ns}-{stat.st_size}.arrow")
+
+
+def _remove_stale(parquet_path: str, keep: str, arrow_dir: str) -> None:
+    pattern = os.path.join(arrow_dir, glob.escape(os.path.basename(parquet_path)) + ".*.arrow")
+    for path in glob.glob(pattern):
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            # En Windows un archivo mapeado no puede borrarse; queda para la
+            # próxima conversión.
+            pass
+
+
+def convert_to_ipc(parquet_path: str, arrow_dir: str = ARROW_CACHE_DIR) -> str:
+    """Convierte ``parquet_path`` a Arrow IPC (si hace falta) y devuelve su ruta."""
+    with open(parquet_path, "rb") as source:
+        # La versión se toma del descriptor abierto: si el proceso externo
+        # reemplaza el archivo mientras convertimos, el nombre sigue
+        # correspondiendo al contenido leído.
+        target = ipc_path_for(parquet_path, os.fstat(source.fileno()), arrow_dir)
+        if os.path.exists(target):
+            return target
+        os.makedirs(arrow_dir, exist_ok=True)
+        tmp = f"{target}.{os.getpid()}-{threading.get_ident()}.tmp"
+        try:
+            parquet = pq.ParquetFile(source)
+            with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, parquet.schema_arrow) as writer:
+                for batch in parquet.iter_batches(batch_size=_BATCH_SIZE):
+                    writer.write_batch(batch)
+            os.replace(tmp, target)
+        except OSError:
+            # Otro worker publicó la misma versión primero.
+            if not os.path.exists(target):
+                raise
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    _remove_stale(parquet_path, target, arrow_dir)
+    return target
+
+
+def read_table(path: str, mmap: Optional[bool] = None, stats: Optional[Dict[str, Any]] = None) -> pa.Table:
+    """Lee ``path`` como tabla Arrow, mapeada en memoria si ``mmap`` lo indica.
+
+    Si se pasa ``stats`` se completa con el modo de lectura, el tamaño lógico
+    de la tabla y los bytes que la lectura reservó en el heap del proceso.
+    """
+    use_mmap = PARQUET_MMAP if mmap is None else mmap
+    allocated = pa.total_allocated_bytes()
+    if use_mmap:
+        source = convert_to_ipc(path, ARROW_CACHE_DIR)
+        table = pa.ipc.open_file(pa.memory_map(source, "r")).read_all()
+    else:
+        source = path
+        table = pq.read_table(path)
+    if stats is not None:
+        # Aproximado: otras lecturas concurrentes también suman al contador.
+        heap_bytes = max(pa.total_allocated_bytes() - allocated, 0)
+        stats.update(
+            mode="mmap" if use_mmap else "heap",
+            source=source,
+            rows=table.num_rows,
+            nbytes=table.nbytes,
+            heap_bytes=heap_bytes,
+            shared_bytes=max(table.nbytes - heap_bytes, 0),
+        )
+    return table
+
+
+def resident_memory() -> Optional[int]:
+    """Memoria residente (RSS) del proceso en bytes, si el sistema la expone."""
+    try:
+        with open("/proc/self/statm", "r", encoding="ascii") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
@@ -0,0 +1,109 @@
+# services/async_bridge.py
+"""
+Event loop persistente para despachar corrutinas desde código síncrono.
+
+Los wrappers ``run_*`` de ``d365_interface`` usaban ``asyncio.run`` en cada
+llamada: creaban y destruían un loop por operación (sin reutilizar conexiones)
+y fallaban si se llamaban desde un loop ya en ejecución. Aquí un hilo daemon
+mantiene un único loop; ``enviar`` le entrega corrutinas desde cualquier hilo
+y ``ejecutar`` espera el resultado. Las corrutinas corren concurrentemente en
+ese loop y comparten el cliente HTTP de ``services.http_client``.
+
+El código async (endpoints de FastAPI) debe hacer ``await`` directamente.
+"""
+import asyncio
+import atexit
+import concurrent.futures
+import threading
+from typing import Any, Awaitable, Optional
+
+from services.logging_utils import get_module_logger
+
+logger = get_module_logger(__name__)
+
+_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_hilo: Optional[threading.Thread] = None
+
+
+def _correr(loop: asyncio.AbstractEventLoop, listo: threading.Event) -> None:
+    asyncio.set_event_loop(loop)
+    loop.call_soon(listo.set)
+    try:
+        loop.run_forever()
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+def _obtener_loop() -> asyncio.AbstractEventLoop:
+    global _loop, _hilo
+    with _lock:
+        if _loop is None or not _hilo.is_alive():
+            loop = asyncio.new_event_loop()
+            listo = threading.Event()
+            hilo = threading.Thread(target=_correr, args=(loop, listo), name="async-bridge", daemon=True)
+            hilo.start()
+            listo.wait()
+            _loop, _hilo = loop, hilo
+            logger.info("Event loop de fondo iniciado")
+        return _loop
+
+
+def en_loop_de_fondo() -> bool:
+    """``True`` si el hilo actual es el del loop de fondo (no debe bloquear)."""
+    return _hilo is not None and threading.current_thread() is _hilo
+
+
+def enviar(coro: Awaitable[Any]) -> "concurrent.futures.Future[Any]":
+    """Programa ``coro`` en el loop de fondo y devuelve un ``Future`` thread-safe."""
+    return asyncio.run_coroutine_threadsafe(coro, _obtener_loop())
+
+
+def ejecutar(coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+    """Ejecuta ``coro`` en el loop de fondo y bloquea hasta su resultado."""
+    if en_loop_de_fondo():
+        coro.close()
+        raise RuntimeError("ejecutar() no puede llamarse desde el loop de fondo; usar await")
+    futuro = enviar(coro)
+    try:
+        return futuro.result(timeout)
+    except concurrent.futures.TimeoutError:
+        futuro.cancel()
+        raise
+
+
+async def _cancelar_pendientes() -> None:
+    actual = asyncio.current_task()
+    pendientes = [tarea for tarea in asyncio.all_tasks() if tarea is not actual]
+    for tarea in pendientes:
+        tarea.cancel()
+    await asyncio.gather(*pendientes, return_exceptions=True)
+
+
+def detener(timeout: float = 5.0) -> None:
+    """Cierra el cliente HTTP del loop de fondo y detiene el hilo."""
+    global _loop, _hilo
+    with _lock:
+        loop, hilo = _loop, _hilo
+        _loop = _hilo = None
+    if loop is None or not hilo.is_alive():
+        return
+    from services.http_client import cerrar_cliente
+
+    try:
+        asyncio.run_coroutine_threadsafe(cerrar_cliente(), loop).result(timeout)
+    except Exception as e:
+        logger.warning(f"No se pudo cerrar el cliente HTTP del loop de fondo: {e}")
+    # Cancela lo pendiente (refrescos, temporizadores en curso) para que
+    # ningún ``Future`` entregado por ``enviar`` quede sin resolver.
+    try:
+        asyncio.run_coroutine_threadsafe(_cancelar_pendientes(), loop).result(timeout)
+    except Exception as e:
+        logger.warning(f"No se pudieron cancelar las tareas del loop de fondo: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+    hilo.join(timeout)
+    logger.info("Event loop de fondo detenido")
+
+
+atexit.register(detener)
@@ -0,0 +1,79 @@
+# services/cache_ttl.py
+"""
+Caché en memoria con vencimiento por entrada y tamaño acotado.
+
+Pensado para respuestas remotas que se piden varias veces en pocos segundos
+(p. ej. reabrir el mismo presupuesto de D365 durante una venta). Es seguro
+entre hilos y entre event loops; los valores se copian al guardar y al leer
+para que el llamador pueda modificarlos sin alterar la caché.
+
+Para que una lectura remota que empezó antes de un ``invalidar`` no vuelva a
+guardar datos viejos, se toma ``generacion(clave)`` antes de consultar y se
+pasa a ``guardar``: si la clave se invalidó mientras tanto, no se guarda.
+"""
+import copy
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class CacheTTL:
+    def __init__(self, ttl: float, maximo: int = 256):
+        self.ttl = ttl
+        self.maximo = maximo
+        self._lock = threading.Lock()
+        self._entradas: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        # Generación por clave invalidada (contador global, nunca se repite).
+        # Las claves que se descartan por tamaño suben ``_piso``: una lectura
+        # que empezó antes nunca coincide con la generación actual.
+        self._contador = itertools.count(1)
+        self._generaciones: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._piso = 0
+
+    def obtener(self, clave: Hashable) -> Optional[Any]:
+        """Valor vigente de ``clave`` o ``None``."""
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return None
+            vence, valor = entrada
+            if time.monotonic() >= vence:
+                del self._entradas[clave]
+                return None
+            self._entradas.move_to_end(clave)
+        return copy.deepcopy(valor)
+
+    def generacion(self, clave: Hashable) -> int:
+        """Generación actual de ``clave``; tomarla antes de la consulta remota."""
+        with self._lock:
+            return self._generaciones.get(clave, self._piso)
+
+    def guardar(self, clave: Hashable, valor: Any, generacion: Optional[int] = None) -> None:
+        """Guarda ``valor``; con ``generacion`` lo descarta si ``clave`` se invalidó desde entonces."""
+        if self.ttl <= 0:
+            return
+        valor = copy.deepcopy(valor)
+        with self._lock:
+            if generacion is not None and self._generaciones.get(clave, self._piso) != generacion:
+                return
+            self._entradas[clave] = (time.monotonic() + self.ttl, valor)
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, clave: Hashable) -> None:
+        with self._lock:
+            self._entradas.pop(clave, None)
+            self._generaciones[clave] = next(self._contador)
+            self._generaciones.move_to_end(clave)
+            while len(self._generaciones) > self.maximo:
+                _, generacion = self._generaciones.popitem(last=False)
+                self._piso = max(self._piso, generacion)
+
+    def limpiar(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+            self._generaciones.clear()
+            self._piso = next(self._contador)
@@ -10,18 +10,25 @@ from functools import lru_cache
 from services.logging_utils import get_module_logger
 
 import requests
-import pyarrow as pa
 import pyarrow.parquet as pq
 import pandas as pd
 
+from services.arrow_cache import read_table
 from services.email_service import enviar_correo_fallo
 from services.database import (
-    obtener_stock,
-    obtener_empleados,
-    obtener_todos_atributos,
+    iterar_stock,
+    iterar_empleados,
+    iterar_atributos,
 )
 from services.config import CACHE_FILE_CODIGOS_POSTALES
-from services.fabric import obtener_codigos_postales_fabric
+from services.fabric import iterar_codigos_postales_fabric
+from services.parquet_export import (
+    SCHEMA_ATRIBUTOS,
+    SCHEMA_CODIGOS_POSTALES,
+    SCHEMA_EMPLEADOS,
+    SCHEMA_STOCK,
+    write_batches,
+)
 
 logger = get_module_logger(__name__)
 
@@ -91,19 +98,19 @@ def _hoy(dt_path: str) -> bool:
 # ----------------------------------------------------------------------
 @lru_cache(maxsize=1)
 def load_products_to_memory():
-    return pq.read_table(CACHE_FILE_PRODUCTOS)
+    return read_table(CACHE_FILE_PRODUCTOS)
 
 @lru_cache(maxsize=1)
 def load_parquet_to_memory():
-    return pq.read_table(CACHE_FILE_CLIENTES)
+    return read_table(CACHE_FILE_CLIENTES)
 
 @lru_cache(maxsize=1)
 def load_stock_to_memory():
-    return pq.read_table(CACHE_FILE_STOCK)
+    return read_table(CACHE_FILE_STOCK)
 
 @lru_cache(maxsize=1)
 def load_atributos_to_memory():
-    return pq.read_table(CACHE_FILE_ATRIBUTOS)
+    return read_table(CACHE_FILE_ATRIBUTOS)
 
 # ----------------------------------------------------------------------
 # API pública usada por el scheduler
@@ -131,17 +138,14 @@ def actualizar_cache_clientes():
 
 def actualizar_cache_stock():
     try:
-        logger.info("Obteniendo stock (services.database.obtener_stock) para cache...")
-        stock_data = obtener_stock(formateado=False)  # <<< NUMÉRICO
-        if not stock_data:
+        logger.info("Exportando stock (services.database.iterar_stock) a cache...")
+        # Lotes del cursor directo a Arrow/Parquet (numérico, sin dicts intermedios).
+        total = write_batches(iterar_stock(), SCHEMA_STOCK, CACHE_FILE_STOCK)
+        if not total:
             logger.warning("No se encontraron datos de stock para cache.")
             return
-        keys = stock_data[0].keys()
-        data = {k: [row.get(k) for row in stock_data] for k in keys}
-        table = pa.Table.from_pydict(data)
-        pq.write_table(table, CACHE_FILE_STOCK)
         load_stock_to_memory.cache_clear()
-        logger.info("Caché stock actualizada.")
+        logger.info(f"Caché stock actualizada ({total} filas).")
     except Exception as e:
         logger.error(f"Error actualizar_cache_stock: {e}", exc_info=True)
         try:
@@ -153,16 +157,12 @@ def actualizar_cache_stock():
 def actualizar_cache_empleados():
     """Construye el parquet de empleados desde la DB local."""
     try:
-        logger.info("Obteniendo empleados (services.database.obtener_empleados) para cache...")
-        empleados = obtener_empleados()
-        if not empleados:
+        logger.info("Exportando empleados (services.database.iterar_empleados) a cache...")
+        total = write_batches(iterar_empleados(), SCHEMA_EMPLEADOS, CACHE_FILE_EMPLEADOS)
+        if not total:
             logger.warning("No se encontraron empleados para cache.")
             return
-        keys = empleados[0].keys()
-        data = {k: [row.get(k) for row in empleados] for k in keys}
-        table = pa.Table.from_pydict(data)
-        pq.write_table(table, CACHE_FILE_EMPLEADOS)
-        logger.info("Caché empleados actualizada.")
+        logger.info(f"Caché empleados actualizada ({total} filas).")
     except Exception as e:
         logger.error(f"Error actualizar_cache_empleados: {e}", exc_info=True)
         try:
@@ -205,17 +205,13 @@ def reload_parquet_into_memory(path: str):
 def actualizar_cache_atributos():
     """Construye el parquet de atributos desde la DB local."""
     try:
-        logger.info("Obteniendo atributos (services.database.obtener_todos_atributos) para cache...")
-        atributos = obtener_todos_atributos()
-        if not atributos:
+        logger.info("Exportando atributos (services.database.iterar_atributos) a cache...")
+        total = write_batches(iterar_atributos(), SCHEMA_ATRIBUTOS, CACHE_FILE_ATRIBUTOS)
+        if not total:
             logger.warning("No se encontraron atributos para cache.")
             return
-        keys = atributos[0].keys()
-        data = {k: [row.get(k) for row in atributos] for k in keys}
-        table = pa.Table.from_pydict(data)
-        pq.write_table(table, CACHE_FILE_ATRIBUTOS)
         load_atributos_to_memory.cache_clear()
-        logger.info("Caché atributos actualizada.")
+        logger.info(f"Caché atributos actualizada ({total} filas).")
     except Exception as e:
         logger.error(f"Error actualizar_cache_atributos: {e}", exc_info=True)
         try:
@@ -230,17 +226,12 @@ def actualizar_cache_codigos_postales():
     Columnas: AddressZipCode, AddressCountryRegionId, AddressState, AddressCounty, AddressCity, CountyName
     """
     try:
-        logger.info("Obteniendo padrón de códigos postales desde Fabric...")
-        rows = obtener_codigos_postales_fabric() or []
-        if not rows:
+        logger.info("Exportando padrón de códigos postales desde Fabric...")
+        total = write_batches(iterar_codigos_postales_fabric(), SCHEMA_CODIGOS_POSTALES, CACHE_FILE_CODIGOS_POSTALES)
+        if not total:
             logger.warning("No se obtuvieron códigos postales para cache.")
             return
-        # Normalizar a pydict de listas
-        keys = list(rows[0].keys())
-        data = {k: [r.get(k) for r in rows] for k in keys}
-        table = pa.Table.from_pydict(data)
-        pq.write_table(table, CACHE_FILE_CODIGOS_POSTALES)
-        logger.info("Caché de códigos postales actualizada.")
+        logger.info(f"Caché de códigos postales actualizada ({total} filas).")
     except Exception as e:
         logger.error(f"Error actualizar_cache_codigos_postales: {e}", exc_info=True)
         try:
@@ -88,3 +88,64 @@ else:
 
 CACHE_FILE_ATRIBUTOS = _build_cache_path('atributos_cache.parquet')
 CACHE_FILE_CODIGOS_POSTALES = _build_cache_path('codigos_postales_cache.parquet')
+
+# Lectura de Parquet mediante Arrow IPC mapeado en memoria (ver
+# ``services/arrow_cache.py``). Desactivado por defecto; los archivos IPC se
+# guardan en un subdirectorio del caché salvo que se indique otro.
+PARQUET_MMAP = os.environ.get("SERVICES_PARQUET_MMAP", "").strip().lower() in {"1", "true", "yes", "on"}
+ARROW_CACHE_DIR = os.environ.get("SERVICES_ARROW_DIR") or os.path.join(CACHE_DIR, ".arrow")
+
+# Watcher de los Parquet del backend (ver ``ParquetCache`` en
+# ``backend_app/main.py``): cada cuánto se revisan y cuánto tiempo deben estar
+# sin cambios antes de recargarlos, en segundos.
+CACHE_WATCH_INTERVAL = float(os.environ.get("SERVICES_CACHE_WATCH_INTERVAL", "2"))
+CACHE_WATCH_DEBOUNCE = float(os.environ.get("SERVICES_CACHE_WATCH_DEBOUNCE", "3"))
+
+# Conexiones SQLite reutilizables por hilo (ver ``services.database.conectar_db``).
+# ``SERVICES_SQLITE_POOL=0`` vuelve a abrir una conexión por llamada. Los
+# tamaños se aplican como PRAGMA una sola vez por conexión; 0 deja el valor
+# por defecto de SQLite (``cache_size`` negativo = KiB, como en SQLite).
+SQLITE_POOL = os.environ.get("SERVICES_SQLITE_POOL", "1").strip().lower() not in {"0", "false", "no", "off"}
+SQLITE_MMAP_SIZE = int(os.environ.get("SERVICES_SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+SQLITE_CACHE_SIZE = int(os.environ.get("SERVICES_SQLITE_CACHE_SIZE", "-8192"))
+# Espera ante bloqueos de SQLite: ``busy_timeout`` por sentencia y plazo total
+# de reintentos con backoff (ver ``services/db_retry.py``).
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SERVICES_SQLITE_BUSY_TIMEOUT_MS", "1000"))
+SQLITE_LOCK_DEADLINE = float(os.environ.get("SERVICES_SQLITE_LOCK_DEADLINE", "10"))
+
+# Tamaño de lote de la sincronización Fabric → SQLite (``fetchmany`` y
+# ``executemany``): acota la memoria sin importar el tamaño de la tabla.
+SYNC_BATCH_SIZE = max(1, int(os.environ.get("SERVICES_SYNC_BATCH", "5000")))
+
+# Números de presupuesto/PDF que cada proceso reserva por vez en
+# ``secuencias_numericas`` (ver ``AsignadorSecuencia`` en ``services/database.py``).
+SEQUENCE_BLOCK_SIZE = max(1, int(os.environ.get("SERVICES_SEQUENCE_BLOCK", "50")))
+
+# Escritura de los Parquet generados localmente (ver ``services/parquet_export.py``).
+PARQUET_ROW_GROUP_SIZE = max(1, int(os.environ.get("SERVICES_PARQUET_ROW_GROUP", str(128 * 1024))))
+PARQUET_COMPRESSION = os.environ.get("SERVICES_PARQUET_COMPRESSION", "snappy")
+
+# Cliente HTTP compartido para D365 (ver ``services/http_client.py``).
+D365_HTTP2 = os.environ.get("SERVICES_D365_HTTP2", "1").strip().lower() not in {"0", "false", "no", "off"}
+D365_MAX_CONNECTIONS = int(os.environ.get("SERVICES_D365_MAX_CONNECTIONS", "20"))
+D365_MAX_KEEPALIVE = int(os.environ.get("SERVICES_D365_MAX_KEEPALIVE", "10"))
+D365_KEEPALIVE_EXPIRY = float(os.environ.get("SERVICES_D365_KEEPALIVE_EXPIRY", "60"))
+D365_CONNECT_TIMEOUT = float(os.environ.get("SERVICES_D365_CONNECT_TIMEOUT", "10"))
+# Timeouts totales por tipo de operación, en segundos.
+D365_TIMEOUTS = {
+    "consulta": float(os.environ.get("SERVICES_D365_TIMEOUT_CONSULTA", "30")),
+    "alta": float(os.environ.get("SERVICES_D365_TIMEOUT_ALTA", "60")),
+    "lote": float(os.environ.get("SERVICES_D365_TIMEOUT_LOTE", "120")),
+}
+
+# Token OAuth de D365: se renueva en segundo plano este margen (segundos)
+# antes de vencer (ver ``services/token_d365.py``).
+D365_TOKEN_REFRESH_MARGIN = float(os.environ.get("SERVICES_D365_TOKEN_MARGIN", "300"))
+
+# Alta de presupuestos en un único ``$batch`` (cabecera + líneas vía ``$1``);
+# si D365 lo rechaza se vuelve a cabecera y líneas por separado.
+D365_CHANGESET_UNICO = os.environ.get("SERVICES_D365_SINGLE_CHANGESET", "1").strip().lower() not in {"0", "false", "no", "off"}
+D365_NAVEGACION_LINEAS = os.environ.get("SERVICES_D365_LINES_NAVIGATION", "SalesQuotationLines")
+# Vigencia (segundos) de los presupuestos de D365 recién abiertos en memoria;
+# 0 desactiva la caché.
+D365_PRESUPUESTO_TTL = float(os.environ.get("SERVICES_D365_QUOTATION_TTL", "60"))
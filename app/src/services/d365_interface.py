@@ -1,10 +1,13 @@
 import os, httpx, json, uuid, asyncio
 from datetime import datetime, timedelta
-from django.contrib.sessions.backends.base import SessionBase  # opcional
 from services.email_service import enviar_correo_fallo
-from services.database import obtener_contador_presupuesto
+from services.database import obtener_contador_presupuesto_async
 import configparser
 from services.logging_utils import get_module_logger
+from services import async_bridge, odata_batch
+from services.cache_ttl import CacheTTL
+from services.config import D365_CHANGESET_UNICO, D365_NAVEGACION_LINEAS, D365_PRESUPUESTO_TTL
+from services.http_client import cliente_compartido, timeout
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(ROOT_DIR)), 'config.ini')
@@ -15,6 +18,12 @@ config.read(CONFIG_PATH)
 
 logger = get_module_logger(__name__)
 
+# Se apaga si D365 rechaza el changeset único y el mismo presupuesto pasa en dos pasos.
+_changeset_unico_soportado = True
+# Respuestas que indican que D365 no aceptó el changeset (nada quedó aplicado).
+# Cualquier otro error (5xx, 429, respuesta ilegible) deja el resultado incierto.
+_RECHAZOS_CHANGESET = {400, 404, 405, 501}
+
 def load_d365_config():
     if 'd365' not in config:
         raise KeyError("La sección 'd365' no se encuentra en config.ini")
@@ -27,10 +36,11 @@ def load_d365_config():
         "client_secret_qa": config['d365'].get('client_secret_qa', ''),
     }
 
-def generar_referencia_presupuesto():
-    """Genera un número de referencia único en formato BUSCADOR-XXXXXXXXX usando el contador de la tabla misc."""
+async def generar_referencia_presupuesto():
+    """Genera un número de referencia único en formato BUSCADOR-XXXXXXXXX con la secuencia ``presupuesto`` (reservada en bloques en ``secuencias_numericas``)."""
     try:
-        contador = obtener_contador_presupuesto()
+        # Variante async: reservar un bloque nuevo no frena el event loop.
+        contador = await obtener_contador_presupuesto_async()
         referencia = f"BUSCADOR-{str(contador).zfill(9)}"
         logger.info(f"Referencia de presupuesto generada: {referencia}")
         return referencia
@@ -47,16 +57,12 @@ async def crear_presupuesto_batch(datos_cabecera, lineas, access_token):
         enviar_correo_fallo("crear_presupuesto_batch", error)
         return None, error
 
+    global _changeset_unico_soportado
     d365_config = load_d365_config()
-    async with httpx.AsyncClient() as client:
-        # Paso 1: Crear la cabecera individualmente
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {access_token}'
-        }
+    async with cliente_compartido() as client:
         fecha_actual = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
         fecha_expiracion = (datetime.utcnow() + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%SZ")
-        referencia = generar_referencia_presupuesto()
+        referencia = await generar_referencia_presupuesto()
 
         cabecera_payload = {
             "dataAreaId": "uni",
@@ -82,120 +88,192 @@ async def crear_presupuesto_batch(datos_cabecera, lineas, access_token):
             "CustomerRequisitionNumber": referencia,
             "SkipOpportunityCreationPrompt": "Yes"
         }
-        logger.info(f"Enviando cabecera a {d365_config['client_prod']}/data/SalesQuotationHeadersV2: {json.dumps(cabecera_payload)}")
 
-        try:
-            response = await client.post(
-                f"{d365_config['client_prod']}/data/SalesQuotationHeadersV2",
-                headers=headers,
-                json=cabecera_payload,
-                timeout=httpx.Timeout(60)
-            )
-            response.raise_for_status()
-            data = response.json()
-            logger.info(f"Respuesta de cabecera completa: status={response.status_code}, body={response.text}")
-            sales_quotation_number = data.get("SalesQuotationNumber")
-            logger.info(f"Intento de extraer SalesQuotationNumber: {sales_quotation_number}")
-            if not sales_quotation_number:
-                error = "No se obtuvo SalesQuotationNumber en la respuesta de la cabecera."
-                logger.error(f"{error} Respuesta completa: {response.text}")
-                enviar_correo_fallo("crear_presupuesto_batch", f"{error} Respuesta: {response.text}")
+        # Un solo round trip: cabecera y líneas en el mismo changeset (atómico).
+        # Si D365 lo rechaza, nada quedó creado y se usa el camino en dos pasos.
+        if D365_CHANGESET_UNICO and _changeset_unico_soportado:
+            sales_quotation_number, error = await _crear_en_un_changeset(client, d365_config, access_token, cabecera_payload, lineas)
+            if sales_quotation_number:
+                logger.info(f"Presupuesto completo creado exitosamente en un único lote: {sales_quotation_number}")
+                return sales_quotation_number, None
+            if error is not None:
                 return None, error
-            logger.info(f"Cabecera creada exitosamente: {sales_quotation_number}")
-        except httpx.HTTPStatusError as e:
-            error = f"Error HTTP al crear cabecera: {e}, Respuesta: {e.response.text}"
-            logger.error(error)
-            enviar_correo_fallo("crear_presupuesto_batch", error)
-            return None, error
-        except Exception as e:
-            error = f"Error al crear cabecera: {str(e)}, Respuesta: {response.text if 'response' in locals() else 'N/A'}"
-            logger.error(error)
-            enviar_correo_fallo("crear_presupuesto_batch", error)
-            return None, error
+            logger.warning("Changeset único rechazado por D365; se crea el presupuesto en dos pasos.")
+            sales_quotation_number, error = await _crear_en_dos_pasos(client, d365_config, access_token, cabecera_payload, lineas)
+            if not error:
+                # El mismo presupuesto pasó en dos pasos: D365 no admite la
+                # referencia ``$1``; no se vuelve a intentar en este proceso.
+                _changeset_unico_soportado = False
+                logger.warning(f"Se desactiva el changeset único para presupuestos (navegación '{D365_NAVEGACION_LINEAS}').")
+            return sales_quotation_number, error
 
-        # Paso 2: Crear las líneas en un lote
-        batch_url = f"{d365_config['client_prod']}/data/$batch"
-        batch_boundary = f"batch_{uuid.uuid4()}"
-        changeset_boundary = f"changeset_{uuid.uuid4()}"
+        return await _crear_en_dos_pasos(client, d365_config, access_token, cabecera_payload, lineas)
 
-        batch_headers = {
-            'Content-Type': f'multipart/mixed; boundary={batch_boundary}',
-            'Authorization': f'Bearer {access_token}'
-        }
+def _payload_linea(linea, sales_quotation_number=None):
+    payload = {
+        "dataAreaId": "uni",
+        "ItemNumber": linea.get('articulo', ''),
+        "LineDiscountPercentage": 0,
+        "RequestedSalesQuantity": linea.get('cantidad', 0),
+        "SalesPrice": linea.get('precio', 0),
+        "ShippingSiteId": linea.get('sitio', ''),
+        "ShippingWarehouseId": linea.get('almacen_entrega', '')
+    }
+    if sales_quotation_number is not None:
+        payload["SalesQuotationNumber"] = sales_quotation_number
+    return payload
+
+async def _crear_en_un_changeset(client, d365_config, access_token, cabecera_payload, lineas):
+    """Cabecera (``Content-ID`` 1) y líneas vía ``$1/<navegación>`` en un solo ``$batch``.
+
+    Devuelve ``(numero, None)`` si se creó, ``(None, None)`` si D365 rechazó el
+    changeset (``_RECHAZOS_CHANGESET``: se puede reintentar en dos pasos) y
+    ``(None, error)`` si no se sabe si llegó a aplicarse (timeout, red, 5xx,
+    429 o respuesta ilegible): reintentar podría duplicarlo.
+    """
+    base = f"{d365_config['client_prod']}/data"
+    operaciones = [odata_batch.Operacion("POST", f"{base}/SalesQuotationHeadersV2", cabecera_payload, "1")]
+    operaciones.extend(
+        odata_batch.Operacion("POST", f"$1/{D365_NAVEGACION_LINEAS}", _payload_linea(linea), str(i + 2))
+        for i, linea in enumerate(lineas)
+    )
+    content_type, cuerpo = odata_batch.construir_changeset(operaciones)
+    logger.info(f"Cuerpo del lote OData (cabecera + líneas): {cuerpo}")
 
-        batch_body = [
-            f"--{batch_boundary}",
-            f"Content-Type: multipart/mixed; boundary={changeset_boundary}",
-            ""
-        ]
+    try:
+        response = await client.post(
+            f"{base}/$batch",
+            headers={'Content-Type': content_type, 'Authorization': f'Bearer {access_token}'},
+            content=cuerpo,
+            timeout=timeout("lote")
+        )
+    except httpx.HTTPError as e:
+        error = f"Error de red al crear presupuesto en un único lote: {e}"
+        logger.error(error)
+        enviar_correo_fallo("crear_presupuesto_batch", error)
+        return None, error
 
-        for i, linea in enumerate(lineas):
-            content_id_linea = str(uuid.uuid4())
-            linea_payload = {
-                "dataAreaId": "uni",
-                "ItemNumber": linea.get('articulo', ''),
-                "LineDiscountPercentage": 0,
-                "RequestedSalesQuantity": linea.get('cantidad', 0),
-                "SalesPrice": linea.get('precio', 0),
-                "SalesQuotationNumber": sales_quotation_number,
-                "ShippingSiteId": linea.get('sitio', ''),
-                "ShippingWarehouseId": linea.get('almacen_entrega', '')
-            }
-            batch_body.extend([
-                f"--{changeset_boundary}",
-                "Content-Type: application/http",
-                "Content-Transfer-Encoding: binary",
-                f"Content-ID: {content_id_linea}",
-                "",
-                f"POST {d365_config['client_prod']}/data/SalesQuotationLines HTTP/1.1",
-                "Content-Type: application/json",
-                "",
-                json.dumps(linea_payload)
-            ])
+    logger.info(f"Respuesta del lote único: status={response.status_code}, body={response.text}")
+    if response.status_code in _RECHAZOS_CHANGESET:
+        logger.warning(f"Lote único rechazado: HTTP {response.status_code}")
+        return None, None
+    if response.status_code >= 400:
+        # 5xx/429 (p. ej. un gateway): el changeset pudo haberse aplicado.
+        return None, _resultado_incierto(f"HTTP {response.status_code}", response)
+    try:
+        respuestas = odata_batch.parsear_respuesta(response.headers.get("Content-Type", ""), response.content)
+    except ValueError as e:
+        return None, _resultado_incierto(f"respuesta multipart ilegible: {e}", response)
+    if not respuestas:
+        return None, _resultado_incierto("respuesta 2xx sin partes multipart", response)
+    fallidas = [r for r in respuestas if not r.ok]
+    if fallidas:
+        if all(r.status in _RECHAZOS_CHANGESET for r in fallidas):
+            logger.warning(f"Changeset único con errores: {odata_batch.errores(fallidas)}")
+            return None, None
+        return None, _resultado_incierto(f"operaciones fallidas {odata_batch.errores(fallidas)}", response)
+    cabecera = next((r for r in respuestas if r.content_id == "1"), None)
+    if cabecera is None:
+        return None, _resultado_incierto("sin respuesta de la cabecera", response)
+    try:
+        sales_quotation_number = (cabecera.json() or {}).get("SalesQuotationNumber")
+    except ValueError:
+        sales_quotation_number = None
+    if not sales_quotation_number:
+        # El changeset se aplicó: no reintentar en dos pasos.
+        error = f"No se obtuvo SalesQuotationNumber en la respuesta del lote. Respuesta: {response.text}"
+        logger.error(error)
+        enviar_correo_fallo("crear_presupuesto_batch", error)
+        return None, error
+    return sales_quotation_number, None
 
-        batch_body.extend([f"--{changeset_boundary}--", f"--{batch_boundary}--"])
-        batch_body_str = "\r\n".join(batch_body)
-        logger.info(f"Cuerpo del lote OData para líneas: {batch_body_str}")
+def _resultado_incierto(motivo, response):
+    error = f"Resultado incierto del lote único ({motivo}); no se reintenta para no duplicar el presupuesto. Respuesta: {response.text}"
+    logger.error(error)
+    enviar_correo_fallo("crear_presupuesto_batch", error)
+    return error
 
-        try:
-            response = await client.post(
-                batch_url,
-                headers=batch_headers,
-                data=batch_body_str,
-                timeout=httpx.Timeout(120)
-            )
-            logger.info(f"Respuesta del servidor al lote: status={response.status_code}, headers={response.headers}")
-            response.raise_for_status()
+async def _crear_en_dos_pasos(client, d365_config, access_token, cabecera_payload, lineas):
+    # Paso 1: Crear la cabecera individualmente
+    headers = {
+        'Content-Type': 'application/json',
+        'Authorization': f'Bearer {access_token}'
+    }
+    logger.info(f"Enviando cabecera a {d365_config['client_prod']}/data/SalesQuotationHeadersV2: {json.dumps(cabecera_payload)}")
 
-            response_lines = response.text.splitlines()
-            logger.info(f"Respuesta del lote de líneas completa: {response.text}")
-            errores = []
-            for i, line in enumerate(response_lines):
-                if line.startswith("HTTP/1.1"):
-                    status_code = int(line.split(" ")[1])
-                    if status_code >= 400:  # Solo errores 400 o superiores
-                        errores.append(f"Error en operación {i}: {line}")
-                        logger.warning(f"Detectado error real en operación {i}: {line}")
+    try:
+        response = await client.post(
+            f"{d365_config['client_prod']}/data/SalesQuotationHeadersV2",
+            headers=headers,
+            json=cabecera_payload,
+            timeout=timeout("alta")
+        )
+        response.raise_for_status()
+        data = response.json()
+        logger.info(f"Respuesta de cabecera completa: status={response.status_code}, body={response.text}")
+        sales_quotation_number = data.get("SalesQuotationNumber")
+        logger.info(f"Intento de extraer SalesQuotationNumber: {sales_quotation_number}")
+        if not sales_quotation_number:
+            error = "No se obtuvo SalesQuotationNumber en la respuesta de la cabecera."
+            logger.error(f"{error} Respuesta completa: {response.text}")
+            enviar_correo_fallo("crear_presupuesto_batch", f"{error} Respuesta: {response.text}")
+            return None, error
+        logger.info(f"Cabecera creada exitosamente: {sales_quotation_number}")
+    except httpx.HTTPStatusError as e:
+        error = f"Error HTTP al crear cabecera: {e}, Respuesta: {e.response.text}"
+        logger.error(error)
+        enviar_correo_fallo("crear_presupuesto_batch", error)
+        return None, error
+    except Exception as e:
+        error = f"Error al crear cabecera: {str(e)}, Respuesta: {response.text if 'response' in locals() else 'N/A'}"
+        logger.error(error)
+        enviar_correo_fallo("crear_presupuesto_batch", error)
+        return None, error
 
-            if errores:
-                error = f"Errores al crear líneas: {errores}. Respuesta completa: {response.text}"
-                logger.error(error)
-                enviar_correo_fallo("crear_presupuesto_batch", error)
-                return sales_quotation_number, error
-            logger.info(f"Presupuesto completo creado exitosamente: {sales_quotation_number}")
-            session['new_quotation'] = sales_quotation_number
-            return sales_quotation_number, None
+    # Paso 2: Crear las líneas en un lote
+    content_type, batch_body_str = odata_batch.construir_changeset(
+        odata_batch.Operacion("POST", f"{d365_config['client_prod']}/data/SalesQuotationLines", _payload_linea(linea, sales_quotation_number))
+        for linea in lineas
+    )
+    logger.info(f"Cuerpo del lote OData para líneas: {batch_body_str}")
 
-        except httpx.HTTPStatusError as e:
-            error = f"Error HTTP al crear líneas: {e}, Respuesta: {e.response.text}"
-            logger.error(error)
-            enviar_correo_fallo("crear_presupuesto_batch", error)
-            return sales_quotation_number, error
-        except Exception as e:
-            error = f"Error al crear líneas en batch: {str(e)}, Respuesta: {response.text if 'response' in locals() else 'N/A'}"
+    try:
+        response = await client.post(
+            f"{d365_config['client_prod']}/data/$batch",
+            headers={'Content-Type': content_type, 'Authorization': f'Bearer {access_token}'},
+            content=batch_body_str,
+            timeout=timeout("lote")
+        )
+        logger.info(f"Respuesta del servidor al lote: status={response.status_code}, headers={response.headers}")
+        response.raise_for_status()
+
+        logger.info(f"Respuesta del lote de líneas completa: {response.text}")
+        errores = odata_batch.errores(odata_batch.parsear_respuesta(response.headers.get("Content-Type", ""), response.content))
+        if errores:
+            error = f"Errores al crear líneas: {errores}"
             logger.error(error)
             enviar_correo_fallo("crear_presupuesto_batch", error)
             return sales_quotation_number, error
+        logger.info(f"Presupuesto completo creado exitosamente: {sales_quotation_number}")
+        return sales_quotation_number, None
+
+    except httpx.HTTPStatusError as e:
+        error = f"Error HTTP al crear líneas: {e}, Respuesta: {e.response.text}"
+        logger.error(error)
+        enviar_correo_fallo("crear_presupuesto_batch", error)
+        return sales_quotation_number, error
+    except Exception as e:
+        error = f"Error al crear líneas en batch: {str(e)}, Respuesta: {response.text if 'response' in locals() else 'N/A'}"
+        logger.error(error)
+        enviar_correo_fallo("crear_presupuesto_batch", error)
+        return sales_quotation_number, error
+
+# Campos que usa el POS al reabrir un presupuesto (``$select``).
+_CAMPOS_LINEAS = "InventoryLotId,ItemNumber,RequestingCustomerAccountNumber,SalesQuotationNumber,SalesPrice,RequestedSalesQuantity,SalesUnitSymbol,ShippingSiteId,ShippingWarehouseId"
+_CAMPOS_CABECERA = "SalesQuotationNumber,InvoiceCustomerAccountNumber,CustomersReference,SalesOrderOriginCode,ReceiptDateRequested,SalesQuotationStatus,GeneratedSalesOrderNumber"
+
+# Presupuestos abiertos recientemente; ``actualizar_presupuesto_d365`` invalida la entrada.
+_presupuestos_recientes = CacheTTL(D365_PRESUPUESTO_TTL)
 
 async def obtener_presupuesto_d365(quotation_id, access_token):
     """Recupera los datos de un presupuesto existente desde D365."""
@@ -206,17 +284,34 @@ async def obtener_presupuesto_d365(quotation_id, access_token):
         enviar_correo_fallo("obtener_presupuesto_d365", error)
         return None, error
 
+    presupuesto_data = _presupuestos_recientes.obtener(quotation_id)
+    if presupuesto_data is not None:
+        logger.info(f"Presupuesto D365 {quotation_id} servido desde caché")
+        return presupuesto_data, None
+    # Si un ``actualizar_presupuesto_d365`` invalida la entrada mientras se
+    # consulta, lo leído puede ser anterior a la actualización y no se guarda.
+    generacion = _presupuestos_recientes.generacion(quotation_id)
+
     d365_config = load_d365_config()
-    async with httpx.AsyncClient() as client:
+    async with cliente_compartido() as client:
         headers = {
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {access_token}'
         }
 
+        # Líneas y cabecera en paralelo: una sola espera en lugar de dos.
+        lines_url = f"{d365_config['client_prod']}/data/SalesQuotationLines?$filter=SalesQuotationNumber eq '{quotation_id}'&$select={_CAMPOS_LINEAS}"
+        header_url = f"{d365_config['client_prod']}/data/SalesQuotationHeadersV2?$filter=SalesQuotationNumber eq '{quotation_id}'&$select={_CAMPOS_CABECERA}"
+        lines_response, header_response = await asyncio.gather(
+            client.get(lines_url, headers=headers, timeout=timeout("consulta")),
+            client.get(header_url, headers=headers, timeout=timeout("consulta")),
+            return_exceptions=True,
+        )
+
         # Obtener líneas del presupuesto
-        lines_url = f"{d365_config['client_prod']}/data/SalesQuotationLines?$filter=SalesQuotationNumber eq '{quotation_id}'&$select=InventoryLotId,ItemNumber,RequestingCustomerAccountNumber,SalesQuotationNumber,SalesPrice,RequestedSalesQuantity,SalesUnitSymbol,ShippingSiteId,ShippingWarehouseId"
         try:
-            lines_response = await client.get(lines_url, headers=headers, timeout=httpx.Timeout(30))
+            if isinstance(lines_response, BaseException):
+                raise lines_response
             lines_response.raise_for_status()
             lines_data = lines_response.json().get("value", [])
             logger.info(f"Líneas obtenidas para {quotation_id}: {len(lines_data)}")
@@ -237,11 +332,12 @@ async def obtener_presupuesto_d365(quotation_id, access_token):
             return None, error
 
         # Obtener cabecera del presupuesto con campos adicionales
-        header_url = f"{d365_config['client_prod']}/data/SalesQuotationHeadersV2?$filter=SalesQuotationNumber eq '{quotation_id}'&$select=SalesQuotationNumber,InvoiceCustomerAccountNumber,CustomersReference,SalesOrderOriginCode,ReceiptDateRequested,SalesQuotationStatus,GeneratedSalesOrderNumber"
         try:
-            header_response = await client.get(header_url, headers=headers, timeout=httpx.Timeout(30))
+            if isinstance(header_response, BaseException):
+                raise header_response
             header_response.raise_for_status()
-            header_data = header_response.json().get("value", [])[0] if header_response.json().get("value") else {}
+            header_values = header_response.json().get("value", [])
+            header_data = header_values[0] if header_values else {}
             logger.info(f"Cabecera obtenida para {quotation_id}")
         except httpx.HTTPStatusError as e:
             error = f"Error HTTP al obtener cabecera: {e}, Respuesta: {e.response.text}"
@@ -259,11 +355,21 @@ async def obtener_presupuesto_d365(quotation_id, access_token):
             "header": header_data,
             "lines": lines_data
         }
+        _presupuestos_recientes.guardar(quotation_id, presupuesto_data, generacion)
         logger.info(f"Presupuesto D365 {quotation_id} recuperado exitosamente")
         return presupuesto_data, None
 
 async def actualizar_presupuesto_d365(quotation_id, datos_cabecera, lineas_nuevas, lineas_existentes, access_token):
     """Actualiza un presupuesto existente en D365: elimina todas las líneas, agrega las nuevas y actualiza la cabecera."""
+    # Lo aplicado en D365 (aun si falla a mitad) deja obsoleta la copia en caché.
+    # Invalidar sube la generación: las lecturas en curso no la vuelven a guardar.
+    _presupuestos_recientes.invalidar(quotation_id)
+    try:
+        return await _actualizar_presupuesto_d365(quotation_id, datos_cabecera, lineas_nuevas, lineas_existentes, access_token)
+    finally:
+        _presupuestos_recientes.invalidar(quotation_id)
+
+async def _actualizar_presupuesto_d365(quotation_id, datos_cabecera, lineas_nuevas, lineas_existentes, access_token):
     logger.info(f"Actualizando presupuesto D365: {quotation_id}")
     if not quotation_id or not datos_cabecera or not lineas_nuevas or not access_token:
         error = "ID de presupuesto, datos, líneas nuevas o token inválidos."
@@ -272,7 +378,7 @@ async def actualizar_presupuesto_d365(quotation_id, datos_cabecera, lineas_nueva
         return None, error
 
     d365_config = load_d365_config()
-    async with httpx.AsyncClient() as client:
+    async with cliente_compartido() as client:
         headers = {
             'Content-Type': 'application/json',
             'Authorization': f'Bearer {access_token}'
@@ -319,21 +425,14 @@ async def actualizar_presupuesto_d365(quotation_id, datos_cabecera, lineas_nueva
                 response = await client.post(
                     batch_url,
                     headers=batch_headers,
-                    data=batch_body_str,
-                    timeout=httpx.Timeout(120)
+                    content=batch_body_str,
+                    timeout=timeout("lote")
                 )
                 logger.info(f"Respuesta del servidor al lote de eliminación: status={response.status_code}, headers={response.headers}")
                 response.raise_for_status()
 
-                response_lines = response.text.splitlines()
                 logger.info(f"Respuesta del lote de eliminación completa: {response.text}")
-                errores = []
-                for i, line in enumerate(response_lines):
-                    if line.startswith("HTTP/1.1"):
-                        status_code = int(line.split(" ")[1])
-                        if status_code >= 400:
-                            errores.append(f"Error en operación {i}: {line}")
-                            logger.warning(f"Detectado error en operación de eliminación {i}: {line}")
+                errores = odata_batch.errores(odata_batch.parsear_respuesta(response.headers.get("Content-Type", ""), response.content))
 
                 if errores:
                     error = f"Errores al eliminar líneas: {errores}. Respuesta completa: {response.text}"
@@ -424,21 +523,14 @@ async def actualizar_presupuesto_d365(quotation_id, datos_cabecera, lineas_nueva
             response = await client.post(
                 batch_url,
                 headers=batch_headers,
-                data=batch_body_str,
-                timeout=httpx.Timeout(120)
+                content=batch_body_str,
+                timeout=timeout("lote")
             )
             logger.info(f"Respuesta del servidor al lote de creación: status={response.status_code}, headers={response.headers}")
             response.raise_for_status()
 
-            response_lines = response.text.splitlines()
             logger.info(f"Respuesta del lote de creación completa: {response.text}")
-            errores = []
-            for i, line in enumerate(response_lines):
-                if line.startswith("HTTP/1.1"):
-                    status_code = int(line.split(" ")[1])
-                    if status_code >= 400:
-                        errores.append(f"Error en operación {i}: {line}")
-                        logger.warning(f"Detectado error en operación de creación {i}: {line}")
+            errores = odata_batch.errores(odata_batch.parsear_respuesta(response.headers.get("Content-Type", ""), response.content))
 
             if errores:
                 error = f"Errores al crear líneas o actualizar cabecera: {errores}. Respuesta completa: {response.text}"
@@ -446,7 +538,6 @@ async def actualizar_presupuesto_d365(quotation_id, datos_cabecera, lineas_nueva
                 enviar_correo_fallo("actualizar_presupuesto_d365", error)
                 return quotation_id, error
             logger.info(f"Presupuesto {quotation_id} actualizado exitosamente: nuevas líneas creadas y cabecera actualizada")
-            session['updated_quotation'] = quotation_id
             return quotation_id, None
 
         except httpx.HTTPStatusError as e:
@@ -470,9 +561,9 @@ async def validar_cliente_existente(dni, access_token):
         'Content-Type': 'application/json'
     }
 
-    async with httpx.AsyncClient() as client:
+    async with cliente_compartido() as client:
         try:
-            response = await client.get(url, headers=headers, timeout=httpx.Timeout(30))
+            response = await client.get(url, headers=headers, timeout=timeout("consulta"))
             response.raise_for_status()
             data = response.json()
             clientes = data.get("value", [])
@@ -510,9 +601,9 @@ async def alta_cliente_d365(datos_cliente, access_token):
         "Name": f"{datos_cliente['nombre']} {datos_cliente['apellido']}",
         "AxxTaxFiscalIdentificationType_TaxFiscalIdentificationId": "DNI"
     }
-    async with httpx.AsyncClient() as client:
+    async with cliente_compartido() as client:
         try:
-            vat_response = await client.post(vat_url, headers=headers, json=vat_payload, timeout=httpx.Timeout(60))
+            vat_response = await client.post(vat_url, headers=headers, json=vat_payload, timeout=timeout("alta"))
             vat_response.raise_for_status()
             logger.info(f"DNI {datos_cliente['dni']} registrado exitosamente en VATNumTables")
         except httpx.HTTPStatusError as e:
@@ -568,10 +659,10 @@ async def alta_cliente_d365(datos_cliente, access_token):
         "AxxTaxPCGrossIncAgreeType": "NotInscript"
     }
 
-    async with httpx.AsyncClient() as client:
+    async with cliente_compartido() as client:
         try:
             logger.info(customer_payload)
-            response = await client.post(customer_url, headers=headers, json=customer_payload, timeout=httpx.Timeout(60))
+            response = await client.post(customer_url, headers=headers, json=customer_payload, timeout=timeout("alta"))
             response.raise_for_status()
             data = response.json()
             customer_id = data.get("CustomerAccount", None)
@@ -595,18 +686,19 @@ async def alta_cliente_d365(datos_cliente, access_token):
             return None, error
 
 
-# Función síncrona para integrar con Flask
+# Funciones síncronas: despachan al event loop persistente de ``async_bridge``
+# (un loop y un cliente HTTP compartidos; seguras desde cualquier hilo).
 def run_validar_cliente_existente(dni, access_token):
-    return asyncio.run(validar_cliente_existente(dni, access_token))
+    return async_bridge.ejecutar(validar_cliente_existente(dni, access_token))
 
 def run_alta_cliente_d365(datos_cliente, access_token):
-    return asyncio.run(alta_cliente_d365(datos_cliente, access_token))
+    return async_bridge.ejecutar(alta_cliente_d365(datos_cliente, access_token))
 
 def run_crear_presupuesto_batch(datos_cabecera, lineas, access_token):
-    return asyncio.run(crear_presupuesto_batch(datos_cabecera, lineas, access_token))
+    return async_bridge.ejecutar(crear_presupuesto_batch(datos_cabecera, lineas, access_token))
 
 def run_obtener_presupuesto_d365(quotation_id, access_token):
-    return asyncio.run(obtener_presupuesto_d365(quotation_id, access_token))
+    return async_bridge.ejecutar(obtener_presupuesto_d365(quotation_id, access_token))
 
 def run_actualizar_presupuesto_d365(quotation_id, datos_cabecera, lineas_nuevas, lineas_existentes, access_token):
-    return asyncio.run(actualizar_presupuesto_d365(quotation_id, datos_cabecera, lineas_nuevas, lineas_existentes, access_token))
+    return async_bridge.ejecutar(actualizar_presupuesto_d365(quotation_id, datos_cabecera, lineas_nuevas, lineas_existentes, access_token))
@@ -1,17 +1,27 @@
 ﻿import sqlite3
 import os
+import itertools
 import locale
+import threading
 import time
+import zlib
 from contextlib import contextmanager
 import pyarrow.parquet as pq
 import pyarrow.compute as pc
 import pyarrow.dataset as ds
 import pyarrow as pa
+from services.db_retry import reintentar_si_bloqueada
 from services.logging_utils import get_module_logger
 try:
-    from services.config import CACHE_FILE_PRODUCTOS
+    from services.config import (
+        CACHE_FILE_PRODUCTOS, SEQUENCE_BLOCK_SIZE, SQLITE_BUSY_TIMEOUT_MS, SQLITE_CACHE_SIZE, SQLITE_MMAP_SIZE,
+        SQLITE_POOL, SYNC_BATCH_SIZE,
+    )
 except Exception:
-    from config import CACHE_FILE_PRODUCTOS
+    from config import (
+        CACHE_FILE_PRODUCTOS, SEQUENCE_BLOCK_SIZE, SQLITE_BUSY_TIMEOUT_MS, SQLITE_CACHE_SIZE, SQLITE_MMAP_SIZE,
+        SQLITE_POOL, SYNC_BATCH_SIZE,
+    )
 import json
 
 
@@ -31,6 +41,7 @@ DB_PATHS = {
     "tipos_entrega": os.path.join(DB_BASE_DIR, "tipos_entrega.db"),
     "config_impositiva": os.path.join(DB_BASE_DIR, "config_impositiva.db"),
     "payments": os.path.join(DB_BASE_DIR, "payments.db"),
+    "clientes_extra": os.path.join(DB_BASE_DIR, "clientes_extra.db"),
 }
 
 logger = get_module_logger(__name__)
@@ -40,31 +51,108 @@ try:
 except Exception as e:
     logger.warning(f"No se pudo aplicar locale es_AR.UTF-8: {e}")
 
-# Configuración de reintentos
+# Reintentos de lecturas de Parquet. Los bloqueos de SQLite se reintentan con
+# ``reintentar_si_bloqueada`` (backoff con plazo total, ver services/db_retry.py).
 MAX_RETRIES = 5
 RETRY_DELAY = 2.5  # segundos
 
+# Conexiones reutilizables: cada hilo conserva una conexión por archivo de base
+# de datos, así los PRAGMA y el ``makedirs`` se ejecutan una sola vez y las
+# lecturas cortas (token, carrito, secuencias) no pagan el costo de conectar.
+_pool_local = threading.local()
+_pool_lock = threading.Lock()
+_pool_conexiones = set()
+_pool_generacion = 0
+
+
+def _abrir_conexion(db_path, check_same_thread=True):
+    # Asegurar que el directorio de la base de datos exista antes de conectar
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    # ``timeout`` fija el busy_timeout: SQLite espera el lock sin retener el GIL.
+    conexion = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000, check_same_thread=check_same_thread)
+    conexion.execute("PRAGMA journal_mode=WAL;")
+    conexion.execute("PRAGMA synchronous=NORMAL;")
+    conexion.execute("PRAGMA temp_store=MEMORY;")
+    if SQLITE_MMAP_SIZE:
+        conexion.execute(f"PRAGMA mmap_size={int(SQLITE_MMAP_SIZE)};")
+    if SQLITE_CACHE_SIZE:
+        conexion.execute(f"PRAGMA cache_size={int(SQLITE_CACHE_SIZE)};")
+    return conexion
+
+
+def _devolver_conexion(conexion):
+    """Deja la conexión lista para el próximo uso; ``False`` si quedó inutilizable."""
+    try:
+        if conexion.in_transaction:
+            # Igual que al cerrar: lo no confirmado se descarta.
+            conexion.rollback()
+        conexion.row_factory = None
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def cerrar_conexiones():
+    """Cierra todas las conexiones reutilizables (al apagar o en tests)."""
+    global _pool_generacion
+    with _pool_lock:
+        conexiones = list(_pool_conexiones)
+        _pool_conexiones.clear()
+        # Los demás hilos descartan sus conexiones cerradas en el próximo uso.
+        _pool_generacion += 1
+    for conexion in conexiones:
+        try:
+            conexion.close()
+        except sqlite3.Error:
+            pass
+
+
 @contextmanager
 def conectar_db(tabla):
-    """Gestor de conexión optimizado con timeout y configuraciones para una tabla específica."""
+    """Gestor de conexión optimizado con timeout y configuraciones para una tabla específica.
+
+    Con ``SQLITE_POOL`` activo la conexión se reutiliza dentro del mismo hilo;
+    al salir se revierte cualquier transacción no confirmada. Un uso anidado
+    sobre la misma base recibe una conexión propia.
+    """
     db_path = DB_PATHS.get(tabla)
     if not db_path:
         raise ValueError(f"No se encontró una base de datos para la tabla {tabla}")
-    # Asegurar que el directorio de la base de datos exista antes de conectar
-    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    pool = None
+    if SQLITE_POOL:
+        if getattr(_pool_local, "generacion", None) != _pool_generacion:
+            _pool_local.generacion, _pool_local.conexiones = _pool_generacion, {}
+        pool = _pool_local.conexiones
+    entrada = pool.get(db_path) if pool is not None else None
+    reutilizable = pool is not None and not (entrada and entrada[1])
     try:
-        conexion = sqlite3.connect(db_path, timeout=10)
-        conexion.execute("PRAGMA journal_mode=WAL;")
-        conexion.execute("PRAGMA synchronous=NORMAL;")
-        logger.info(f"Conectado a la base de datos: {db_path} para tabla {tabla}")
+        if reutilizable and entrada:
+            conexion = entrada[0]
+        else:
+            conexion = _abrir_conexion(db_path)
+            if reutilizable:
+                entrada = pool[db_path] = [conexion, False]
+                with _pool_lock:
+                    _pool_conexiones.add(conexion)
+                logger.info(f"Conectado a la base de datos: {db_path} para tabla {tabla}")
+        if reutilizable:
+            entrada[1] = True
         yield conexion
     except sqlite3.Error as e:
         logger.error(f"Error al conectar con la base de datos {db_path}: {e}")
         raise
     finally:
         if 'conexion' in locals():
-            conexion.close()
-            logger.debug(f"Conexión cerrada correctamente para {db_path}.")
+            if reutilizable:
+                entrada[1] = False
+                if not _devolver_conexion(conexion):
+                    pool.pop(db_path, None)
+                    with _pool_lock:
+                        _pool_conexiones.discard(conexion)
+                    conexion.close()
+            else:
+                conexion.close()
+                logger.debug(f"Conexión cerrada correctamente para {db_path}.")
 
 def formatear_moneda(valor):
     if valor is None:
@@ -120,737 +208,655 @@ def obtener_equivalencia(codigo):
             logger.error(f"Error al obtener equivalencia desde Parquet tras {MAX_RETRIES} intentos: {e}")
             return []
 
+# Token OAuth de D365 por entorno (``prod``/``qa``) con su vencimiento en
+# segundos epoch (ver ``services/token_d365.py``).
+SCRIPT_TOKENS_D365 = """
+    CREATE TABLE IF NOT EXISTS tokens_d365 (
+        entorno TEXT PRIMARY KEY,
+        token TEXT NOT NULL,
+        expira REAL NOT NULL
+    );
+"""
+
+# Clientes creados desde el POS (antes en ``clientes_extra.json``). Las columnas
+# ``*_norm`` y ``busqueda`` guardan los valores en minúsculas para consultas
+# indexadas por documento y búsquedas por subcadena sin parsear el JSON.
+SCRIPT_CLIENTES_EXTRA = """
+    CREATE TABLE IF NOT EXISTS clientes_extra (
+        numero_cliente TEXT PRIMARY KEY,
+        doc_norm TEXT,
+        dni_norm TEXT,
+        nombre_norm TEXT,
+        busqueda TEXT NOT NULL,
+        cliente_json TEXT NOT NULL,
+        actualizado TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_clientes_extra_doc ON clientes_extra(doc_norm);
+    CREATE INDEX IF NOT EXISTS idx_clientes_extra_dni ON clientes_extra(dni_norm);
+    -- Las búsquedas por nombre son por subcadena (``instr``) y no usan índice.
+    DROP INDEX IF EXISTS idx_clientes_extra_nombre;
+"""
+
+# Scripts de creación por base de datos (clave de ``DB_PATHS``).
+TABLAS_SCRIPTS = {
+    "atributos": """
+        CREATE TABLE IF NOT EXISTS atributos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            product_number TEXT,   
+            product_name TEXT,
+            attribute_name TEXT,
+            attribute_value TEXT
+        );
+    """,
+    "empleados": """
+        CREATE TABLE IF NOT EXISTS empleados (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            empleado_d365 TEXT,   
+            id_puesto TEXT,
+            email TEXT UNIQUE,
+            nombre_completo TEXT,
+            numero_sap TEXT,
+            last_store TEXT
+        );
+    """,
+    "misc": """
+        CREATE TABLE IF NOT EXISTS misc (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            token_d365 TEXT,
+            contador TEXT,
+            contador_pdf TEXT
+        );
+        CREATE TABLE IF NOT EXISTS carts (
+            user_id TEXT PRIMARY KEY,
+            cart_json TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+    """ + SCRIPT_TOKENS_D365,
+    "stock": """
+        CREATE TABLE IF NOT EXISTS stock (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            codigo TEXT,
+            almacen_365 TEXT,
+            stock_fisico REAL,
+            disponible_venta REAL,
+            disponible_entrega REAL,
+            comprometido REAL,
+            UNIQUE(codigo, almacen_365)
+        );
+    """,
+    "store_data": """
+        CREATE TABLE IF NOT EXISTS store_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            almacen_retiro TEXT,
+            sitio_almacen_retiro TEXT,
+            id_tienda TEXT,
+            id_unidad_operativa TEXT,
+            nombre_tienda TEXT,
+            almacen_envio TEXT,
+            sitio_almacen_envio TEXT,
+            direccion_unidad_operativa TEXT,
+            direccion_completa_unidad_operativa TEXT,
+            UNIQUE(id_tienda)
+        );
+    """,
+    "grupos_cumplimiento": """
+        CREATE TABLE IF NOT EXISTS grupos_cumplimiento (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            store_locator_group_name TEXT NOT NULL,
+            invent_location_id TEXT NOT NULL,
+            UNIQUE(store_locator_group_name, invent_location_id)
+        );
+    """,
+    "secuencias_numericas": """
+        CREATE TABLE IF NOT EXISTS secuencias_numericas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT UNIQUE,
+            prefijo TEXT,
+            valor_actual INTEGER,
+            incremento INTEGER
+        );
+    """,
+    "tipos_entrega": """
+        CREATE TABLE IF NOT EXISTS tipos_entrega (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT UNIQUE
+        );
+    """,
+    "config_impositiva": """
+        CREATE TABLE IF NOT EXISTS config_impositiva (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT,
+            codigo_arca TEXT UNIQUE
+        );
+    """,
+    "clientes_extra": SCRIPT_CLIENTES_EXTRA,
+    "payments": """
+        CREATE TABLE IF NOT EXISTS payments_config_payment_methods (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            code TEXT UNIQUE,
+            label TEXT,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            sort_order INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS payments_config_card_brands (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            enabled INTEGER NOT NULL DEFAULT 1
+        );
+        CREATE TABLE IF NOT EXISTS payments_config_credit_plans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            brand_id INTEGER NOT NULL,
+            installments INTEGER NOT NULL,
+            coef_total REAL NOT NULL,
+            coef_cuota REAL,
+            enabled INTEGER NOT NULL DEFAULT 1,
+            valid_from TEXT,
+            valid_to TEXT,
+            FOREIGN KEY (brand_id) REFERENCES payments_config_card_brands(id)
+        );
+        CREATE TABLE IF NOT EXISTS sales_payment_simulations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            cart_id TEXT,
+            amount_total REAL,
+            currency TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            created_by TEXT,
+            status TEXT,
+            change_amount REAL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS sales_payment_simulation_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            simulation_id INTEGER NOT NULL,
+            method_code TEXT NOT NULL,
+            amount_base REAL NOT NULL,
+            card_brand_id INTEGER,
+            installments INTEGER,
+            coef_total REAL,
+            interest_amount REAL NOT NULL,
+            amount_final REAL NOT NULL,
+            reference TEXT,
+            extra_meta TEXT,
+            sort_order INTEGER,
+            FOREIGN KEY (simulation_id) REFERENCES sales_payment_simulations(id),
+            FOREIGN KEY (card_brand_id) REFERENCES payments_config_card_brands(id)
+        );
+        INSERT OR IGNORE INTO payments_config_payment_methods(id, code, label, enabled, sort_order) VALUES
+            (1, 'cash', 'Efectivo', 1, 1),
+            (2, 'debit', 'Tarjeta Débito', 1, 2),
+            (3, 'credit', 'Tarjeta Crédito', 1, 3),
+            (4, 'transfer', 'Transferencia', 1, 4),
+            (5, 'check', 'Cheque', 1, 5);
+        INSERT OR IGNORE INTO payments_config_card_brands(id, name, enabled) VALUES
+            (1, 'Visa', 1),
+            (2, 'Mastercard', 1),
+            (3, 'Amex', 1);
+        INSERT OR IGNORE INTO payments_config_credit_plans(id, brand_id, installments, coef_total, coef_cuota, enabled, valid_from, valid_to) VALUES
+            (1, 1, 1, 1.0, NULL, 1, NULL, NULL),
+            (2, 1, 12, 1.25, NULL, 1, NULL, NULL);
+    """
+}
+
+# Columnas agregadas a tablas existentes: (tabla, columna, definición).
+COLUMNAS_AGREGADAS = {
+    "misc": [("carts", "version", "INTEGER NOT NULL DEFAULT 0")],
+}
+
+def init_tabla(tabla):
+    """Crea (si no existen) las tablas de la base ``tabla``."""
+    with conectar_db(tabla) as conexion:
+        cursor = conexion.cursor()
+        try:
+            cursor.executescript(TABLAS_SCRIPTS[tabla])
+            for nombre, columna, definicion in COLUMNAS_AGREGADAS.get(tabla, []):
+                existentes = {fila[1] for fila in cursor.execute(f"PRAGMA table_info({nombre})")}
+                if columna not in existentes:
+                    cursor.execute(f"ALTER TABLE {nombre} ADD COLUMN {columna} {definicion}")
+            conexion.commit()
+            logger.info(f"Tabla {tabla} verificada/creada exitosamente en {DB_PATHS[tabla]}.")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error al inicializar la base de datos para {tabla}: {e}")
+            return False
+
 def init_db():
     # Inicializar cada base de datos por separado
-    tablas_scripts = {
-        "atributos": """
-            CREATE TABLE IF NOT EXISTS atributos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                product_number TEXT,   
-                product_name TEXT,
-                attribute_name TEXT,
-                attribute_value TEXT
-            );
-        """,
-        "empleados": """
-            CREATE TABLE IF NOT EXISTS empleados (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                empleado_d365 TEXT,   
-                id_puesto TEXT,
-                email TEXT UNIQUE,
-                nombre_completo TEXT,
-                numero_sap TEXT,
-                last_store TEXT
-            );
-        """,
-        "misc": """
-            CREATE TABLE IF NOT EXISTS misc (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                token_d365 TEXT,
-                contador TEXT,
-                contador_pdf TEXT
-            );
-            CREATE TABLE IF NOT EXISTS carts (
-                user_id TEXT PRIMARY KEY,
-                cart_json TEXT NOT NULL,
-                timestamp TEXT NOT NULL
-            );
-        """,
-        "stock": """
-            CREATE TABLE IF NOT EXISTS stock (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                codigo TEXT,
-                almacen_365 TEXT,
-                stock_fisico REAL,
-                disponible_venta REAL,
-                disponible_entrega REAL,
-                comprometido REAL,
-                UNIQUE(codigo, almacen_365)
-            );
-        """,
-        "store_data": """
-            CREATE TABLE IF NOT EXISTS store_data (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                almacen_retiro TEXT,
-                sitio_almacen_retiro TEXT,
-                id_tienda TEXT,
-                id_unidad_operativa TEXT,
-                nombre_tienda TEXT,
-                almacen_envio TEXT,
-                sitio_almacen_envio TEXT,
-                direccion_unidad_operativa TEXT,
-                direccion_completa_unidad_operativa TEXT,
-                UNIQUE(id_tienda)
-            );
-        """,
-        "grupos_cumplimiento": """
-            CREATE TABLE IF NOT EXISTS grupos_cumplimiento (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                store_locator_group_name TEXT NOT NULL,
-                invent_location_id TEXT NOT NULL,
-                UNIQUE(store_locator_group_name, invent_location_id)
-            );
-        """,
-        "secuencias_numericas": """
-            CREATE TABLE IF NOT EXISTS secuencias_numericas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT UNIQUE,
-                prefijo TEXT,
-                valor_actual INTEGER,
-                incremento INTEGER
-            );
-        """,
-        "tipos_entrega": """
-            CREATE TABLE IF NOT EXISTS tipos_entrega (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT UNIQUE
-            );
-        """,
-        "config_impositiva": """
-            CREATE TABLE IF NOT EXISTS config_impositiva (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT,
-                codigo_arca TEXT UNIQUE
-            );
-        """,
-        "payments": """
-            CREATE TABLE IF NOT EXISTS payments_config_payment_methods (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                code TEXT UNIQUE,
-                label TEXT,
-                enabled INTEGER NOT NULL DEFAULT 1,
-                sort_order INTEGER NOT NULL
-            );
-            CREATE TABLE IF NOT EXISTS payments_config_card_brands (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT,
-                enabled INTEGER NOT NULL DEFAULT 1
-            );
-            CREATE TABLE IF NOT EXISTS payments_config_credit_plans (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                brand_id INTEGER NOT NULL,
-                installments INTEGER NOT NULL,
-                coef_total REAL NOT NULL,
-                coef_cuota REAL,
-                enabled INTEGER NOT NULL DEFAULT 1,
-                valid_from TEXT,
-                valid_to TEXT,
-                FOREIGN KEY (brand_id) REFERENCES payments_config_card_brands(id)
-            );
-            CREATE TABLE IF NOT EXISTS sales_payment_simulations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                cart_id TEXT,
-                amount_total REAL,
-                currency TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                created_by TEXT,
-                status TEXT,
-                change_amount REAL DEFAULT 0
-            );
-            CREATE TABLE IF NOT EXISTS sales_payment_simulation_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                simulation_id INTEGER NOT NULL,
-                method_code TEXT NOT NULL,
-                amount_base REAL NOT NULL,
-                card_brand_id INTEGER,
-                installments INTEGER,
-                coef_total REAL,
-                interest_amount REAL NOT NULL,
-                amount_final REAL NOT NULL,
-                reference TEXT,
-                extra_meta TEXT,
-                sort_order INTEGER,
-                FOREIGN KEY (simulation_id) REFERENCES sales_payment_simulations(id),
-                FOREIGN KEY (card_brand_id) REFERENCES payments_config_card_brands(id)
-            );
-            INSERT OR IGNORE INTO payments_config_payment_methods(id, code, label, enabled, sort_order) VALUES
-                (1, 'cash', 'Efectivo', 1, 1),
-                (2, 'debit', 'Tarjeta Débito', 1, 2),
-                (3, 'credit', 'Tarjeta Crédito', 1, 3),
-                (4, 'transfer', 'Transferencia', 1, 4),
-                (5, 'check', 'Cheque', 1, 5);
-            INSERT OR IGNORE INTO payments_config_card_brands(id, name, enabled) VALUES
-                (1, 'Visa', 1),
-                (2, 'Mastercard', 1),
-                (3, 'Amex', 1);
-            INSERT OR IGNORE INTO payments_config_credit_plans(id, brand_id, installments, coef_total, coef_cuota, enabled, valid_from, valid_to) VALUES
-                (1, 1, 1, 1.0, NULL, 1, NULL, NULL),
-                (2, 1, 12, 1.25, NULL, 1, NULL, NULL);
-        """
-    }
-
-    for tabla, script in tablas_scripts.items():
-        with conectar_db(tabla) as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.executescript(script)
-                conexion.commit()
-                logger.info(f"Tabla {tabla} verificada/creada exitosamente en {DB_PATHS[tabla]}.")
-            except sqlite3.Error as e:
-                logger.error(f"Error al inicializar la base de datos para {tabla}: {e}")
+    for tabla in TABLAS_SCRIPTS:
+        init_tabla(tabla)
+
+# Bases ya inicializadas en este proceso: ``(tabla, ruta)``. Las operaciones
+# frecuentes (tokens, secuencias) no repiten el DDL en cada llamada.
+_tablas_inicializadas = set()
 
+def _asegurar_tabla(tabla):
+    """Ejecuta ``init_tabla(tabla)`` una sola vez por proceso y archivo de base."""
+    clave = (tabla, DB_PATHS[tabla])
+    if clave not in _tablas_inicializadas and init_tabla(tabla):
+        _tablas_inicializadas.add(clave)
+
+@reintentar_si_bloqueada("guardar token D365")
 def guardar_token_d365(token):
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("misc") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("BEGIN TRANSACTION;")
-                cursor.execute("SELECT COUNT(*) FROM misc WHERE id = 1")
-                exists = cursor.fetchone()[0] > 0
-                if exists:
-                    cursor.execute("UPDATE misc SET token_d365 = ? WHERE id = 1", (token,))
-                else:
-                    cursor.execute("INSERT INTO misc (id, token_d365, contador) VALUES (1, ?, NULL)", (token,))
-                conexion.commit()
-                logger.info("Token D365 guardado/actualizado exitosamente.")
-                return
-            except sqlite3.OperationalError as e:
-                conexion.rollback()
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error al guardar token D365 tras {MAX_RETRIES} intentos: {e}")
-                raise
-            except sqlite3.Error as e:
-                conexion.rollback()
-                logger.error(f"Error inesperado al guardar token D365: {e}")
-                raise
+    with conectar_db("misc") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("BEGIN IMMEDIATE;")
+        cursor.execute("SELECT COUNT(*) FROM misc WHERE id = 1")
+        exists = cursor.fetchone()[0] > 0
+        if exists:
+            cursor.execute("UPDATE misc SET token_d365 = ? WHERE id = 1", (token,))
+        else:
+            cursor.execute("INSERT INTO misc (id, token_d365, contador) VALUES (1, ?, NULL)", (token,))
+        conexion.commit()
+        logger.info("Token D365 guardado/actualizado exitosamente.")
+        return
 
+@reintentar_si_bloqueada("obtener token D365", por_defecto=None)
 def obtener_token_d365():
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("misc") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("SELECT token_d365 FROM misc WHERE id = 1")
-                token = cursor.fetchone()
-                if token and token[0]:
-                    logger.info("Token D365 obtenido desde la base de datos.")
-                    return token[0]
-                logger.warning("No se encontró token D365 en la base de datos.")
-                return None
-            except sqlite3.OperationalError as e:
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error al obtener token D365 tras {MAX_RETRIES} intentos: {e}")
-                return None
-            except sqlite3.Error as e:
-                logger.error(f"Error inesperado al obtener token D365: {e}")
-                return None
+    with conectar_db("misc") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("SELECT token_d365 FROM misc WHERE id = 1")
+        token = cursor.fetchone()
+        if token and token[0]:
+            logger.info("Token D365 obtenido desde la base de datos.")
+            return token[0]
+        logger.warning("No se encontró token D365 en la base de datos.")
+        return None
+
+@reintentar_si_bloqueada("guardar token D365 por entorno")
+def guardar_token_entorno(entorno, token, expira):
+    _asegurar_tabla("misc")
+    with conectar_db("misc") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("""
+            INSERT INTO tokens_d365 (entorno, token, expira) VALUES (?, ?, ?)
+            ON CONFLICT(entorno) DO UPDATE SET token = excluded.token, expira = excluded.expira
+        """, (entorno, token, expira))
+        conexion.commit()
+        logger.info(f"Token D365 ({entorno}) guardado; vence en {int(expira - time.time())} s.")
+
+@reintentar_si_bloqueada("obtener token D365 por entorno", por_defecto=None)
+def obtener_token_entorno(entorno):
+    """``(token, expira)`` guardado para ``entorno`` o ``None``."""
+    _asegurar_tabla("misc")
+    with conectar_db("misc") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("SELECT token, expira FROM tokens_d365 WHERE entorno = ?", (entorno,))
+        fila = cursor.fetchone()
+        return (fila[0], fila[1]) if fila else None
+
+# Cargas masivas (sincronización desde Fabric). Las filas pueden llegar como
+# lista o como iterador (p. ej. ``fetchmany`` de pyodbc): se insertan en lotes
+# de ``SYNC_BATCH_SIZE`` dentro de una única transacción, así la memoria queda
+# acotada al lote y las tablas que se reemplazan nunca se ven a medio cargar.
+def _en_lotes(filas, tamano):
+    iterador = iter(filas)
+    while True:
+        lote = list(itertools.islice(iterador, tamano))
+        if not lote:
+            return
+        yield lote
+
+
+@reintentar_si_bloqueada("iniciar carga masiva")
+def _iniciar_carga(conexion):
+    # Sólo se reintenta la toma del lock: las filas de un iterador no se
+    # pueden volver a leer.
+    conexion.execute("BEGIN IMMEDIATE;")
 
-def obtener_contador_presupuesto():
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("misc") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("BEGIN TRANSACTION;")
-                cursor.execute("SELECT contador FROM misc WHERE id = 1")
-                contador = cursor.fetchone()
-                nuevo_contador = int(contador[0]) + 1 if contador and contador[0] else 1
-                cursor.execute("SELECT COUNT(*) FROM misc WHERE id = 1")
-                exists = cursor.fetchone()[0] > 0
-                if exists:
-                    cursor.execute("UPDATE misc SET contador = ? WHERE id = 1", (str(nuevo_contador),))
-                else:
-                    cursor.execute("INSERT INTO misc (id, token_d365, contador) VALUES (1, NULL, ?)", (str(nuevo_contador),))
-                conexion.commit()
-                logger.info(f"Contador de presupuestos actualizado: {nuevo_contador}")
-                return nuevo_contador
-            except sqlite3.OperationalError as e:
-                conexion.rollback()
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error al actualizar contador tras {MAX_RETRIES} intentos: {e}")
-                raise
-            except sqlite3.Error as e:
-                conexion.rollback()
-                logger.error(f"Error inesperado al obtener/incrementar contador: {e}")
-                raise
 
-def agregar_atributos_masivo(lista_atributos):
-    if not lista_atributos:
-        logger.info("Lista de atributos vacía, no se insertó nada.")
+def _cargar_por_lotes(tabla, descripcion, filas, insercion, previa=None, filtro=None, progreso=None):
+    """Inserta ``filas`` con ``insercion``; devuelve la cantidad (0 si no hay filas).
+
+    Si SQLite falla se revierte la transacción (la tabla queda como estaba) y
+    se relanza el error, para no confundir una carga fallida con una fuente vacía.
+
+    ``previa`` se ejecuta al inicio de la transacción (p. ej. ``DELETE``),
+    ``filtro(lote)`` permite descartar filas y ``progreso(total)`` se llama
+    tras cada lote.
+    """
+    lotes = _en_lotes(filas, SYNC_BATCH_SIZE)
+    primero = next(lotes, None)
+    if not primero:
+        logger.info(f"Lista de {descripcion} vacía, no se insertó nada.")
         return 0
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("atributos") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("PRAGMA synchronous = OFF;")
-                cursor.execute("BEGIN TRANSACTION;")
-                cursor.execute("DELETE FROM atributos;")
-                cursor.executemany("""
-                    INSERT INTO atributos (product_number, product_name, attribute_name, attribute_value)
-                    VALUES (?, ?, ?, ?);
-                """, lista_atributos)
-                conexion.commit()
-                logger.info(f"Se insertaron {len(lista_atributos)} atributos en SQLite.")
-                return len(lista_atributos)
-            except sqlite3.OperationalError as e:
-                conexion.rollback()
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error en inserción masiva de atributos tras {MAX_RETRIES} intentos: {e}")
-                return 0
-            except sqlite3.Error as e:
+    total = 0
+    with conectar_db(tabla) as conexion:
+        cursor = conexion.cursor()
+        try:
+            cursor.execute("PRAGMA synchronous = OFF;")
+            _iniciar_carga(conexion)
+            if previa:
+                cursor.execute(previa)
+            for lote in itertools.chain([primero], lotes):
+                if filtro:
+                    lote = filtro(lote)
+                cursor.executemany(insercion, lote)
+                total += len(lote)
+                if progreso:
+                    progreso(total)
+            conexion.commit()
+        except sqlite3.Error as e:
+            conexion.rollback()
+            logger.error(f"Error en inserción masiva de {descripcion}: {e}")
+            raise
+        finally:
+            # La conexión vuelve al pool: no debe quedar con ``synchronous = OFF``
+            # (no se puede cambiar dentro de una transacción).
+            if conexion.in_transaction:
                 conexion.rollback()
-                logger.error(f"Error inesperado en inserción masiva de atributos: {e}")
-                return 0
+            cursor.execute("PRAGMA synchronous = NORMAL;")
+    logger.info(f"Se insertaron/actualizaron {total} registros de {descripcion} en SQLite.")
+    return total
 
+
+def agregar_atributos_masivo(lista_atributos, progreso=None):
+    return _cargar_por_lotes("atributos", "atributos", lista_atributos, """
+        INSERT INTO atributos (product_number, product_name, attribute_name, attribute_value)
+        VALUES (?, ?, ?, ?);
+    """, previa="DELETE FROM atributos;", progreso=progreso)
+
+@reintentar_si_bloqueada("obtener atributos", por_defecto=list)
 def obtener_atributos(product_number):
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("atributos") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("""
-                    SELECT product_number, product_name, attribute_name, attribute_value
-                    FROM atributos WHERE product_number = ?
-                """, (product_number,))
-                atributos = [
-                    {"ProductNumber": row[0], "ProductName": row[1], "AttributeName": row[2], "AttributeValue": row[3]}
-                    for row in cursor.fetchall()
-                ]
-                logger.info(f"Se obtuvieron {len(atributos)} atributos para el producto {product_number}.")
-                return atributos
-            except sqlite3.OperationalError as e:
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error al obtener atributos tras {MAX_RETRIES} intentos: {e}")
-                return []
-            except sqlite3.Error as e:
-                logger.error(f"Error inesperado al obtener atributos para {product_number}: {e}")
-                return []
+    with conectar_db("atributos") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("""
+            SELECT product_number, product_name, attribute_name, attribute_value
+            FROM atributos WHERE product_number = ?
+        """, (product_number,))
+        atributos = [
+            {"ProductNumber": row[0], "ProductName": row[1], "AttributeName": row[2], "AttributeValue": row[3]}
+            for row in cursor.fetchall()
+        ]
+        logger.info(f"Se obtuvieron {len(atributos)} atributos para el producto {product_number}.")
+        return atributos
 
+@reintentar_si_bloqueada("obtener stock", por_defecto=list, errores=(sqlite3.OperationalError,))
 def obtener_stock(formateado=True):
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("stock") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("""
-                    SELECT codigo, almacen_365, stock_fisico, disponible_venta, disponible_entrega, comprometido
-                    FROM stock
-                """)
-                rows = cursor.fetchall()
-                if formateado:
-                    to_row = lambda r: {
-                        "codigo": r[0], "almacen_365": r[1],
-                        "stock_fisico": formatear_moneda(r[2]),
-                        "disponible_venta": formatear_moneda(r[3]),
-                        "disponible_entrega": formatear_moneda(r[4]),
-                        "comprometido": formatear_moneda(r[5]),
-                    }
-                else:
-                    to_row = lambda r: {
-                        "codigo": r[0], "almacen_365": r[1],
-                        "stock_fisico": float(r[2]) if r[2] is not None else None,
-                        "disponible_venta": float(r[3]) if r[3] is not None else None,
-                        "disponible_entrega": float(r[4]) if r[4] is not None else None,
-                        "comprometido": float(r[5]) if r[5] is not None else None,
-                    }
-                stock_data = [to_row(r) for r in rows]
-                logger.info(f"Se obtuvieron {len(stock_data)} registros de stock.")
-                return stock_data
-            except sqlite3.OperationalError as e:
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error al obtener stock tras {MAX_RETRIES} intentos: {e}")
-                return []
+    with conectar_db("stock") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("""
+            SELECT codigo, almacen_365, stock_fisico, disponible_venta, disponible_entrega, comprometido
+            FROM stock
+        """)
+        rows = cursor.fetchall()
+        if formateado:
+            to_row = lambda r: {
+                "codigo": r[0], "almacen_365": r[1],
+                "stock_fisico": formatear_moneda(r[2]),
+                "disponible_venta": formatear_moneda(r[3]),
+                "disponible_entrega": formatear_moneda(r[4]),
+                "comprometido": formatear_moneda(r[5]),
+            }
+        else:
+            to_row = lambda r: {
+                "codigo": r[0], "almacen_365": r[1],
+                "stock_fisico": float(r[2]) if r[2] is not None else None,
+                "disponible_venta": float(r[3]) if r[3] is not None else None,
+                "disponible_entrega": float(r[4]) if r[4] is not None else None,
+                "comprometido": float(r[5]) if r[5] is not None else None,
+            }
+        stock_data = [to_row(r) for r in rows]
+        logger.info(f"Se obtuvieron {len(stock_data)} registros de stock.")
+        return stock_data
 
 
+@reintentar_si_bloqueada("guardar simulación de pagos", por_defecto=None)
 def guardar_simulacion_pago(cart_id, amount_total, currency, items, created_by, status="draft", change_amount=0):
     """Guarda una simulación de pagos con sus ítems asociados."""
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("payments") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("BEGIN TRANSACTION;")
-                cursor.execute(
-                    """
-                    INSERT INTO sales_payment_simulations (
-                        cart_id, amount_total, currency, created_by, status, change_amount
-                    ) VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                    (cart_id, amount_total, currency, created_by, status, change_amount),
+    with conectar_db("payments") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("BEGIN IMMEDIATE;")
+        cursor.execute(
+            """
+            INSERT INTO sales_payment_simulations (
+                cart_id, amount_total, currency, created_by, status, change_amount
+            ) VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (cart_id, amount_total, currency, created_by, status, change_amount),
+        )
+        simulation_id = cursor.lastrowid
+        registros = []
+        for orden, item in enumerate(items, start=1):
+            registros.append(
+                (
+                    simulation_id,
+                    item.get("method_code"),
+                    item.get("amount_base"),
+                    item.get("card_brand_id"),
+                    item.get("installments"),
+                    item.get("coef_total"),
+                    item.get("interest_amount", 0),
+                    item.get("amount_final"),
+                    item.get("reference"),
+                    json.dumps(item.get("extra_meta")) if item.get("extra_meta") is not None else None,
+                    orden,
                 )
-                simulation_id = cursor.lastrowid
-                registros = []
-                for orden, item in enumerate(items, start=1):
-                    registros.append(
-                        (
-                            simulation_id,
-                            item.get("method_code"),
-                            item.get("amount_base"),
-                            item.get("card_brand_id"),
-                            item.get("installments"),
-                            item.get("coef_total"),
-                            item.get("interest_amount", 0),
-                            item.get("amount_final"),
-                            item.get("reference"),
-                            json.dumps(item.get("extra_meta")) if item.get("extra_meta") is not None else None,
-                            orden,
-                        )
-                    )
-                cursor.executemany(
-                    """
-                    INSERT INTO sales_payment_simulation_items (
-                        simulation_id, method_code, amount_base, card_brand_id,
-                        installments, coef_total, interest_amount, amount_final,
-                        reference, extra_meta, sort_order
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """,
-                    registros,
-                )
-                conexion.commit()
-                logger.info(f"Simulación de pagos guardada con ID {simulation_id}")
-                return simulation_id
-            except sqlite3.OperationalError as e:
-                conexion.rollback()
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error al guardar simulación de pagos tras {MAX_RETRIES} intentos: {e}")
-                return None
-            except sqlite3.Error as e:
-                conexion.rollback()
-                logger.error(f"Error inesperado al guardar simulación de pagos: {e}")
-                return None
+            )
+        cursor.executemany(
+            """
+            INSERT INTO sales_payment_simulation_items (
+                simulation_id, method_code, amount_base, card_brand_id,
+                installments, coef_total, interest_amount, amount_final,
+                reference, extra_meta, sort_order
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            registros,
+        )
+        conexion.commit()
+        logger.info(f"Simulación de pagos guardada con ID {simulation_id}")
+        return simulation_id
 
 
+@reintentar_si_bloqueada("obtener simulación de pagos", por_defecto=None)
 def obtener_simulacion_pago(simulation_id):
     """Recupera una simulación de pagos completa."""
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("payments") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute(
-                    """
-                    SELECT id, cart_id, amount_total, currency, created_at,
-                           created_by, status, change_amount
-                    FROM sales_payment_simulations
-                    WHERE id = ?
-                    """,
-                    (simulation_id,),
-                )
-                simulacion = cursor.fetchone()
-                if not simulacion:
-                    logger.info(f"No se encontró simulación con ID {simulation_id}")
-                    return None
-                cursor.execute(
-                    """
-                    SELECT method_code, amount_base, card_brand_id, installments,
-                           coef_total, interest_amount, amount_final, reference,
-                           extra_meta, sort_order
-                    FROM sales_payment_simulation_items
-                    WHERE simulation_id = ?
-                    ORDER BY sort_order
-                    """,
-                    (simulation_id,),
-                )
-                items = []
-                for row in cursor.fetchall():
-                    items.append(
-                        {
-                            "method_code": row[0],
-                            "amount_base": row[1],
-                            "card_brand_id": row[2],
-                            "installments": row[3],
-                            "coef_total": row[4],
-                            "interest_amount": row[5],
-                            "amount_final": row[6],
-                            "reference": row[7],
-                            "extra_meta": json.loads(row[8]) if row[8] else None,
-                            "sort_order": row[9],
-                        }
-                    )
-                return {
-                    "id": simulacion[0],
-                    "cart_id": simulacion[1],
-                    "amount_total": simulacion[2],
-                    "currency": simulacion[3],
-                    "created_at": simulacion[4],
-                    "created_by": simulacion[5],
-                    "status": simulacion[6],
-                    "change_amount": simulacion[7],
-                    "items": items,
+    with conectar_db("payments") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute(
+            """
+            SELECT id, cart_id, amount_total, currency, created_at,
+                   created_by, status, change_amount
+            FROM sales_payment_simulations
+            WHERE id = ?
+            """,
+            (simulation_id,),
+        )
+        simulacion = cursor.fetchone()
+        if not simulacion:
+            logger.info(f"No se encontró simulación con ID {simulation_id}")
+            return None
+        cursor.execute(
+            """
+            SELECT method_code, amount_base, card_brand_id, installments,
+                   coef_total, interest_amount, amount_final, reference,
+                   extra_meta, sort_order
+            FROM sales_payment_simulation_items
+            WHERE simulation_id = ?
+            ORDER BY sort_order
+            """,
+            (simulation_id,),
+        )
+        items = []
+        for row in cursor.fetchall():
+            items.append(
+                {
+                    "method_code": row[0],
+                    "amount_base": row[1],
+                    "card_brand_id": row[2],
+                    "installments": row[3],
+                    "coef_total": row[4],
+                    "interest_amount": row[5],
+                    "amount_final": row[6],
+                    "reference": row[7],
+                    "extra_meta": json.loads(row[8]) if row[8] else None,
+                    "sort_order": row[9],
                 }
-            except sqlite3.OperationalError as e:
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error al obtener simulación de pagos tras {MAX_RETRIES} intentos: {e}")
-                return None
-            except sqlite3.Error as e:
-                logger.error(f"Error inesperado al obtener simulación de pagos: {e}")
-                return None
+            )
+        return {
+            "id": simulacion[0],
+            "cart_id": simulacion[1],
+            "amount_total": simulacion[2],
+            "currency": simulacion[3],
+            "created_at": simulacion[4],
+            "created_by": simulacion[5],
+            "status": simulacion[6],
+            "change_amount": simulacion[7],
+            "items": items,
+        }
 
+@reintentar_si_bloqueada("obtener grupos de cumplimiento", por_defecto=list)
 def obtener_grupos_cumplimiento(store):
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("grupos_cumplimiento") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("SELECT invent_location_id FROM grupos_cumplimiento WHERE store_locator_group_name = ?", (store,))
-                almacenes_asignados = [row[0] for row in cursor.fetchall()]
-                logger.info(f"Se obtuvieron {len(almacenes_asignados)} almacenes para la tienda {store}.")
-                return almacenes_asignados
-            except sqlite3.OperationalError as e:
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error al obtener grupos tras {MAX_RETRIES} intentos: {e}")
-                return []
-            except sqlite3.Error as e:
-                logger.error(f"Error inesperado al obtener grupos de cumplimiento: {e}")
-                return []
+    with conectar_db("grupos_cumplimiento") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("SELECT invent_location_id FROM grupos_cumplimiento WHERE store_locator_group_name = ?", (store,))
+        almacenes_asignados = [row[0] for row in cursor.fetchall()]
+        logger.info(f"Se obtuvieron {len(almacenes_asignados)} almacenes para la tienda {store}.")
+        return almacenes_asignados
 
-def agregar_stock_masivo(lista_stock):
-    if not lista_stock:
-        logger.info("Lista de stock vacía, no se insertó nada.")
-        return 0
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("stock") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("BEGIN TRANSACTION;")
-                cursor.executemany("""
-                    INSERT INTO stock (codigo, almacen_365, stock_fisico, disponible_venta, disponible_entrega, comprometido)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    ON CONFLICT(codigo, almacen_365) DO UPDATE SET
-                        stock_fisico=excluded.stock_fisico,
-                        disponible_venta=excluded.disponible_venta,
-                        disponible_entrega=excluded.disponible_entrega,
-                        comprometido=excluded.comprometido;
-                """, lista_stock)
-                conexion.commit()
-                logger.info(f"Se insertaron/actualizaron {len(lista_stock)} registros de stock.")
-                return len(lista_stock)
-            except sqlite3.OperationalError as e:
-                conexion.rollback()
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error en inserción de stock tras {MAX_RETRIES} intentos: {e}")
-                return 0
-            except sqlite3.Error as e:
-                conexion.rollback()
-                logger.error(f"Error inesperado en inserción de stock: {e}")
-                return 0
+def agregar_stock_masivo(lista_stock, progreso=None):
+    return _cargar_por_lotes("stock", "stock", lista_stock, """
+        INSERT INTO stock (codigo, almacen_365, stock_fisico, disponible_venta, disponible_entrega, comprometido)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(codigo, almacen_365) DO UPDATE SET
+            stock_fisico=excluded.stock_fisico,
+            disponible_venta=excluded.disponible_venta,
+            disponible_entrega=excluded.disponible_entrega,
+            comprometido=excluded.comprometido;
+    """, progreso=progreso)
 
-def agregar_grupos_cumplimiento_masivo(lista_grupos):
-    if not lista_grupos:
-        logger.info("Lista de grupos de cumplimiento vacía, no se insertó nada.")
-        return 0
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("grupos_cumplimiento") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("BEGIN TRANSACTION;")
-                cursor.executemany("""
-                    INSERT INTO grupos_cumplimiento (store_locator_group_name, invent_location_id)
-                    VALUES (?, ?)
-                    ON CONFLICT(store_locator_group_name, invent_location_id) DO UPDATE SET
-                        store_locator_group_name=excluded.store_locator_group_name,
-                        invent_location_id=excluded.invent_location_id;
-                """, lista_grupos)
-                conexion.commit()
-                logger.info(f"Se insertaron/actualizaron {len(lista_grupos)} registros en `grupos_cumplimiento`.")
-                return len(lista_grupos)
-            except sqlite3.OperationalError as e:
-                conexion.rollback()
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error en inserción de grupos tras {MAX_RETRIES} intentos: {e}")
-                return 0
-            except sqlite3.Error as e:
-                conexion.rollback()
-                logger.error(f"Error inesperado en inserción/actualización de grupos: {e}")
-                return 0
+def agregar_grupos_cumplimiento_masivo(lista_grupos, progreso=None):
+    return _cargar_por_lotes("grupos_cumplimiento", "grupos de cumplimiento", lista_grupos, """
+        INSERT INTO grupos_cumplimiento (store_locator_group_name, invent_location_id)
+        VALUES (?, ?)
+        ON CONFLICT(store_locator_group_name, invent_location_id) DO UPDATE SET
+            store_locator_group_name=excluded.store_locator_group_name,
+            invent_location_id=excluded.invent_location_id;
+    """, progreso=progreso)
 
-def agregar_empleados_masivo(lista_empleados):
-    if not lista_empleados:
-        logger.info("Lista de empleados vacía, no se insertó nada.")
-        return 0
-    dedup = {}
-    for emp in lista_empleados:
-        email = emp[2]
-        if email not in dedup:
-            dedup[email] = emp
-    lista_empleados_unicos = list(dedup.values())
-    if not lista_empleados_unicos:
-        logger.warning("Todos los empleados tienen emails duplicados, no se insertó nada.")
-        return 0
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("empleados") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("PRAGMA synchronous = OFF;")
-                cursor.execute("BEGIN TRANSACTION;")
-                cursor.executemany("""
-                    INSERT INTO empleados (empleado_d365, id_puesto, email, nombre_completo, numero_sap)
-                    VALUES (?, ?, ?, ?, ?)
-                    ON CONFLICT(email) DO UPDATE SET
-                        empleado_d365=excluded.empleado_d365,
-                        id_puesto=excluded.id_puesto,
-                        nombre_completo=excluded.nombre_completo,
-                        numero_sap=excluded.numero_sap;
-                """, lista_empleados_unicos)
-                conexion.commit()
-                logger.info(f"Se insertaron/actualizaron {len(lista_empleados_unicos)} empleados en SQLite.")
-                return len(lista_empleados_unicos)
-            except sqlite3.OperationalError as e:
-                conexion.rollback()
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error en inserción masiva de empleados tras {MAX_RETRIES} intentos: {e}")
-                return 0
-            except sqlite3.Error as e:
-                conexion.rollback()
-                logger.error(f"Error inesperado en inserción masiva de empleados: {e}")
-                return 0
+def agregar_empleados_masivo(lista_empleados, progreso=None):
+    # Ante emails repetidos se conserva el primer registro, también entre lotes.
+    vistos = set()
 
+    def primeros_por_email(lote):
+        unicos = []
+        for emp in lote:
+            if emp[2] not in vistos:
+                vistos.add(emp[2])
+                unicos.append(emp)
+        return unicos
+
+    return _cargar_por_lotes("empleados", "empleados", lista_empleados, """
+        INSERT INTO empleados (empleado_d365, id_puesto, email, nombre_completo, numero_sap)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(email) DO UPDATE SET
+            empleado_d365=excluded.empleado_d365,
+            id_puesto=excluded.id_puesto,
+            nombre_completo=excluded.nombre_completo,
+            numero_sap=excluded.numero_sap;
+    """, filtro=primeros_por_email, progreso=progreso)
+
+@reintentar_si_bloqueada("obtener empleados", por_defecto=list)
 def obtener_empleados():
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("empleados") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("""
-                    SELECT empleado_d365, id_puesto, email, nombre_completo, numero_sap
-                    FROM empleados
-                """)
-                filas = cursor.fetchall()
-                if not filas:
-                    logger.warning("No se encontraron empleados en la base de datos.")
-                    return []
-                claves = ["empleado_d365", "id_puesto", "email", "nombre_completo", "numero_sap"]
-                empleados = [dict(zip(claves, fila)) for fila in filas]
-                logger.info(f"Se obtuvieron {len(empleados)} empleados.")
-                return empleados
-            except sqlite3.OperationalError as e:
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error al obtener empleados tras {MAX_RETRIES} intentos: {e}")
-                return []
-            except sqlite3.Error as e:
-                logger.error(f"Error inesperado al obtener empleados: {e}")
-                return []
+    with conectar_db("empleados") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("""
+            SELECT empleado_d365, id_puesto, email, nombre_completo, numero_sap
+            FROM empleados
+        """)
+        filas = cursor.fetchall()
+        if not filas:
+            logger.warning("No se encontraron empleados en la base de datos.")
+            return []
+        claves = ["empleado_d365", "id_puesto", "email", "nombre_completo", "numero_sap"]
+        empleados = [dict(zip(claves, fila)) for fila in filas]
+        logger.info(f"Se obtuvieron {len(empleados)} empleados.")
+        return empleados
 
+@reintentar_si_bloqueada("obtener empleado", por_defecto=dict)
 def obtener_empleados_by_email(email):
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("empleados") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("""
-                    SELECT empleado_d365, id_puesto, email, nombre_completo, numero_sap, last_store
-                    FROM empleados WHERE email = ?
-                """, (email,))
-                filas = cursor.fetchall()
-                if not filas:
-                    logger.warning(f"No se encontraron empleados con el email {email}.")
-                    return {}
-                claves = ["empleado_d365", "id_puesto", "email", "nombre_completo", "numero_sap", "last_store"]
-                empleado = dict(zip(claves, filas[0]))
-                logger.info(f"Se obtuvo un empleado con email {email}.")
-                return empleado
-            except sqlite3.OperationalError as e:
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error al obtener empleado tras {MAX_RETRIES} intentos: {e}")
-                return {}
-            except sqlite3.Error as e:
-                logger.error(f"Error inesperado al obtener empleado con email {email}: {e}")
-                return {}
+    with conectar_db("empleados") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("""
+            SELECT empleado_d365, id_puesto, email, nombre_completo, numero_sap, last_store
+            FROM empleados WHERE email = ?
+        """, (email,))
+        filas = cursor.fetchall()
+        if not filas:
+            logger.warning(f"No se encontraron empleados con el email {email}.")
+            return {}
+        claves = ["empleado_d365", "id_puesto", "email", "nombre_completo", "numero_sap", "last_store"]
+        empleado = dict(zip(claves, filas[0]))
+        logger.info(f"Se obtuvo un empleado con email {email}.")
+        return empleado
 
+@reintentar_si_bloqueada("obtener todos los atributos", por_defecto=list)
 def obtener_todos_atributos():
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("atributos") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("""
-                    SELECT product_number, product_name, attribute_name, attribute_value
-                    FROM atributos
-                """)
-                filas = cursor.fetchall()
-                if not filas:
-                    logger.warning("No se encontraron atributos en la base de datos.")
-                    return []
-                atributos = [{"ProductNumber": row[0], "ProductName": row[1], "AttributeName": row[2], "AttributeValue": row[3]}
-                             for row in filas]
-                logger.info(f"Se obtuvieron {len(atributos)} atributos en una sola consulta.")
-                return atributos
-            except sqlite3.OperationalError as e:
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error al obtener atributos tras {MAX_RETRIES} intentos: {e}")
-                return []
-            except sqlite3.Error as e:
-                logger.error(f"Error inesperado al obtener todos los atributos: {e}")
-                return []
+    with conectar_db("atributos") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("""
+            SELECT product_number, product_name, attribute_name, attribute_value
+            FROM atributos
+        """)
+        filas = cursor.fetchall()
+        if not filas:
+            logger.warning("No se encontraron atributos en la base de datos.")
+            return []
+        atributos = [{"ProductNumber": row[0], "ProductName": row[1], "AttributeName": row[2], "AttributeValue": row[3]}
+                     for row in filas]
+        logger.info(f"Se obtuvieron {len(atributos)} atributos en una sola consulta.")
+        return atributos
 
-def agregar_datos_tienda_masivo(lista_tiendas):
-    if not lista_tiendas:
-        logger.warning("Lista de tiendas vacía, no se insertó nada.")
-        return 0
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("store_data") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("PRAGMA synchronous = OFF;")
-                cursor.execute("BEGIN TRANSACTION;")
-                cursor.execute("DELETE FROM store_data;")
-                query = """
-                    INSERT INTO store_data (
-                        almacen_retiro, sitio_almacen_retiro, id_tienda, id_unidad_operativa, 
-                        nombre_tienda, almacen_envio, sitio_almacen_envio, direccion_unidad_operativa, 
-                        direccion_completa_unidad_operativa
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ON CONFLICT(id_tienda) DO UPDATE SET
-                        almacen_retiro=excluded.almacen_retiro,
-                        sitio_almacen_retiro=excluded.sitio_almacen_retiro,
-                        id_unidad_operativa=excluded.id_unidad_operativa,
-                        nombre_tienda=excluded.nombre_tienda,
-                        almacen_envio=excluded.almacen_envio,
-                        sitio_almacen_envio=excluded.sitio_almacen_envio,
-                        direccion_unidad_operativa=excluded.direccion_unidad_operativa,
-                        direccion_completa_unidad_operativa=excluded.direccion_completa_unidad_operativa;
-                """
-                cursor.executemany(query, lista_tiendas)
-                conexion.commit()
-                logger.info(f"Se insertaron/actualizaron {len(lista_tiendas)} registros de tiendas en SQLite.")
-                return len(lista_tiendas)
-            except sqlite3.OperationalError as e:
-                conexion.rollback()
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error en inserción masiva de tiendas tras {MAX_RETRIES} intentos: {e}")
-                return 0
-            except sqlite3.Error as e:
-                conexion.rollback()
-                logger.error(f"Error inesperado en inserción masiva de datos de tiendas: {e}")
-                return 0
+def agregar_datos_tienda_masivo(lista_tiendas, progreso=None):
+    return _cargar_por_lotes("store_data", "tiendas", lista_tiendas, """
+        INSERT INTO store_data (
+            almacen_retiro, sitio_almacen_retiro, id_tienda, id_unidad_operativa, 
+            nombre_tienda, almacen_envio, sitio_almacen_envio, direccion_unidad_operativa, 
+            direccion_completa_unidad_operativa
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id_tienda) DO UPDATE SET
+            almacen_retiro=excluded.almacen_retiro,
+            sitio_almacen_retiro=excluded.sitio_almacen_retiro,
+            id_unidad_operativa=excluded.id_unidad_operativa,
+            nombre_tienda=excluded.nombre_tienda,
+            almacen_envio=excluded.almacen_envio,
+            sitio_almacen_envio=excluded.sitio_almacen_envio,
+            direccion_unidad_operativa=excluded.direccion_unidad_operativa,
+            direccion_completa_unidad_operativa=excluded.direccion_completa_unidad_operativa;
+    """, previa="DELETE FROM store_data;", progreso=progreso)
+
+def iterar_consulta(tabla, consulta, parametros=(), tamano=None):
+    """Ejecuta ``consulta`` y entrega las filas en lotes de ``fetchmany``.
+
+    La conexión queda tomada mientras se consume el generador.
+    """
+    with conectar_db(tabla) as conexion:
+        cursor = conexion.execute(consulta, parametros)
+        while True:
+            lote = cursor.fetchmany(tamano or SYNC_BATCH_SIZE)
+            if not lote:
+                return
+            yield lote
+
+
+# Lotes en el orden de columnas de los Parquet de caché (services/parquet_export.py).
+def iterar_stock(tamano=None):
+    return iterar_consulta("stock", """
+        SELECT codigo, almacen_365, stock_fisico, disponible_venta, disponible_entrega, comprometido
+        FROM stock
+    """, tamano=tamano)
+
+
+def iterar_empleados(tamano=None):
+    return iterar_consulta("empleados", """
+        SELECT empleado_d365, id_puesto, email, nombre_completo, numero_sap
+        FROM empleados
+    """, tamano=tamano)
+
+
+def iterar_atributos(tamano=None):
+    return iterar_consulta("atributos", """
+        SELECT product_number, product_name, attribute_name, attribute_value
+        FROM atributos
+    """, tamano=tamano)
 
 def limpiar_direccion(direccion):
     if not direccion:
@@ -863,155 +869,385 @@ def limpiar_direccion(direccion):
         direccion = direccion[:-2].strip()
     return direccion
 
+@reintentar_si_bloqueada("obtener tienda", por_defecto=dict)
 def obtener_datos_tienda_por_id(id_tienda):
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("store_data") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("""
-                    SELECT 
-                        almacen_retiro, sitio_almacen_retiro, id_tienda, id_unidad_operativa, 
-                        nombre_tienda, almacen_envio, sitio_almacen_envio, direccion_unidad_operativa, 
-                        direccion_completa_unidad_operativa
-                    FROM store_data WHERE id_tienda = ?
-                """, (id_tienda,))
-                tienda = cursor.fetchone()
-                if tienda:
-                    claves = ["almacen_retiro", "sitio_almacen_retiro", "id_tienda", "id_unidad_operativa",
-                              "nombre_tienda", "almacen_envio", "sitio_almacen_envio", "direccion_unidad_operativa",
-                              "direccion_completa_unidad_operativa"]
-                    resultado = dict(zip(claves, tienda))
-                    resultado["direccion_completa_unidad_operativa"] = limpiar_direccion(resultado["direccion_completa_unidad_operativa"])
-                    logger.info(f"Se encontraron datos para la tienda con id_tienda {id_tienda}.")
-                    return resultado
-                logger.warning(f"No se encontraron datos para la tienda con id_tienda {id_tienda}.")
-                return {}
-            except sqlite3.OperationalError as e:
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error al obtener tienda tras {MAX_RETRIES} intentos: {e}")
-                return {}
-            except sqlite3.Error as e:
-                logger.error(f"Error inesperado al obtener datos de la tienda con id_tienda {id_tienda}: {e}")
-                return {}
+    with conectar_db("store_data") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("""
+            SELECT 
+                almacen_retiro, sitio_almacen_retiro, id_tienda, id_unidad_operativa, 
+                nombre_tienda, almacen_envio, sitio_almacen_envio, direccion_unidad_operativa, 
+                direccion_completa_unidad_operativa
+            FROM store_data WHERE id_tienda = ?
+        """, (id_tienda,))
+        tienda = cursor.fetchone()
+        if tienda:
+            claves = ["almacen_retiro", "sitio_almacen_retiro", "id_tienda", "id_unidad_operativa",
+                      "nombre_tienda", "almacen_envio", "sitio_almacen_envio", "direccion_unidad_operativa",
+                      "direccion_completa_unidad_operativa"]
+            resultado = dict(zip(claves, tienda))
+            resultado["direccion_completa_unidad_operativa"] = limpiar_direccion(resultado["direccion_completa_unidad_operativa"])
+            logger.info(f"Se encontraron datos para la tienda con id_tienda {id_tienda}.")
+            return resultado
+        logger.warning(f"No se encontraron datos para la tienda con id_tienda {id_tienda}.")
+        return {}
 
+@reintentar_si_bloqueada("actualizar last_store")
 def actualizar_last_store(email, store_id):
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("empleados") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("BEGIN TRANSACTION;")
-                cursor.execute("UPDATE empleados SET last_store = ? WHERE email = ?", (store_id, email))
-                if cursor.rowcount == 0:
-                    logger.warning(f"No se encontró empleado con email {email} para actualizar last_store.")
-                conexion.commit()
-                logger.info(f"Last_store actualizado a {store_id} para el empleado con email {email}.")
-                return
-            except sqlite3.OperationalError as e:
-                conexion.rollback()
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error al actualizar last_store tras {MAX_RETRIES} intentos: {e}")
-                raise
-            except sqlite3.Error as e:
-                conexion.rollback()
-                logger.error(f"Error inesperado al actualizar last_store para {email}: {e}")
-                raise
+    with conectar_db("empleados") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("BEGIN IMMEDIATE;")
+        cursor.execute("UPDATE empleados SET last_store = ? WHERE email = ?", (store_id, email))
+        if cursor.rowcount == 0:
+            logger.warning(f"No se encontró empleado con email {email} para actualizar last_store.")
+        conexion.commit()
+        logger.info(f"Last_store actualizado a {store_id} para el empleado con email {email}.")
+        return
+
+# Secuencias numéricas (presupuestos, PDFs). Cada reserva es un único UPSERT
+# ``... RETURNING`` sobre ``secuencias_numericas.valor_actual`` (INTEGER), así
+# dos workers nunca reciben el mismo número. Para ráfagas cada proceso reserva
+# bloques de ``SEQUENCE_BLOCK_SIZE`` números y los entrega desde memoria; los
+# números no usados de un bloque se pierden al reiniciar (quedan huecos, nunca
+# duplicados).
+
+
+@reintentar_si_bloqueada("leer contador heredado")
+def _contador_heredado(columna):
+    """Último valor del contador TEXT histórico de ``misc`` (0 si no hay)."""
+    with conectar_db("misc") as conexion:
+        fila = conexion.execute(f"SELECT {columna} FROM misc WHERE id = 1").fetchone()
+        return int(fila[0]) if fila and fila[0] else 0
+
+
+@reintentar_si_bloqueada("reservar secuencia")
+def reservar_secuencia(nombre, cantidad=1, inicial=None):
+    """Reserva ``cantidad`` números consecutivos de ``nombre``: ``(primero, ultimo)``.
+
+    ``inicial`` es el último número ya emitido cuando la secuencia todavía no
+    existe (por ejemplo, el contador heredado); puede ser un invocable.
+    """
+    _asegurar_tabla("secuencias_numericas")
+    with conectar_db("secuencias_numericas") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("SELECT 1 FROM secuencias_numericas WHERE nombre = ?", (nombre,))
+        base = 0
+        if cursor.fetchone() is None and inicial is not None:
+            base = inicial() if callable(inicial) else int(inicial)
+        cursor.execute("""
+            INSERT INTO secuencias_numericas (nombre, prefijo, valor_actual, incremento)
+            VALUES (?, NULL, ?, 1)
+            ON CONFLICT(nombre) DO UPDATE SET
+                valor_actual = COALESCE(secuencias_numericas.valor_actual, 0) + ?
+            RETURNING valor_actual;
+        """, (nombre, base + cantidad, cantidad))
+        ultimo = cursor.fetchone()[0]
+        conexion.commit()
+        logger.info(f"Secuencia {nombre}: reservados {ultimo - cantidad + 1}..{ultimo}")
+        return ultimo - cantidad + 1, ultimo
+
+
+class AsignadorSecuencia:
+    """Entrega números de una secuencia reservándolos en bloques."""
+
+    def __init__(self, nombre, bloque=None, inicial=None):
+        self.nombre = nombre
+        self.bloque = bloque
+        self.inicial = inicial
+        self._lock = threading.Lock()
+        self._rangos = []
+
+    def _tomar(self):
+        while self._rangos:
+            rango = self._rangos[0]
+            if rango[0] <= rango[1]:
+                numero = rango[0]
+                rango[0] += 1
+                return numero
+            self._rangos.pop(0)
+        return None
+
+    def _tamano(self):
+        return self.bloque or SEQUENCE_BLOCK_SIZE
+
+    def siguiente(self):
+        with self._lock:
+            numero = self._tomar()
+            if numero is None:
+                self._rangos.append(list(reservar_secuencia(self.nombre, self._tamano(), self.inicial)))
+                numero = self._tomar()
+            return numero
+
+    async def siguiente_async(self):
+        """Como ``siguiente`` pero la reserva de un bloque nuevo no bloquea el event loop."""
+        with self._lock:
+            numero = self._tomar()
+        if numero is not None:
+            return numero
+        rango = await reservar_secuencia.aio(self.nombre, self._tamano(), self.inicial)
+        with self._lock:
+            self._rangos.append(list(rango))
+            return self._tomar()
+
+    def descartar(self):
+        """Olvida los números reservados en memoria (p. ej. al cambiar de base)."""
+        with self._lock:
+            self._rangos.clear()
+
+
+_contador_presupuesto = AsignadorSecuencia("presupuesto", inicial=lambda: _contador_heredado("contador"))
+_contador_pdf = AsignadorSecuencia("pdf", inicial=lambda: _contador_heredado("contador_pdf"))
+
+
+def obtener_contador_presupuesto():
+    nuevo_contador = _contador_presupuesto.siguiente()
+    logger.info(f"Contador de presupuestos asignado: {nuevo_contador}")
+    return nuevo_contador
+
+
+async def obtener_contador_presupuesto_async():
+    nuevo_contador = await _contador_presupuesto.siguiente_async()
+    logger.info(f"Contador de presupuestos asignado: {nuevo_contador}")
+    return nuevo_contador
+
 
 def obtener_contador_pdf():
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("misc") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("BEGIN TRANSACTION;")
-                cursor.execute("SELECT contador_pdf FROM misc WHERE id = 1")
-                contador = cursor.fetchone()
-                nuevo_contador = int(contador[0]) + 1 if contador and contador[0] else 1
-                cursor.execute("SELECT COUNT(*) FROM misc WHERE id = 1")
-                exists = cursor.fetchone()[0] > 0
-                if exists:
-                    cursor.execute("UPDATE misc SET contador_pdf = ? WHERE id = 1", (str(nuevo_contador),))
-                else:
-                    cursor.execute("INSERT INTO misc (id, token_d365, contador, contador_pdf) VALUES (1, NULL, NULL, ?)", (str(nuevo_contador),))
-                conexion.commit()
-                logger.info(f"Contador de PDFs actualizado: {nuevo_contador}")
-                return nuevo_contador
-            except sqlite3.OperationalError as e:
-                conexion.rollback()
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error al actualizar contador_pdf tras {MAX_RETRIES} intentos: {e}")
-                raise
-            except sqlite3.Error as e:
-                conexion.rollback()
-                logger.error(f"Error inesperado al obtener/incrementar contador_pdf: {e}")
-                raise
+    nuevo_contador = _contador_pdf.siguiente()
+    logger.info(f"Contador de PDFs asignado: {nuevo_contador}")
+    return nuevo_contador
+
+def _comprimir_carrito(cart):
+    return zlib.compress(json.dumps(cart, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
 
+def _leer_carrito(valor):
+    # Filas anteriores guardan el JSON como texto; las nuevas, comprimido.
+    if isinstance(valor, (bytes, bytearray, memoryview)):
+        return json.loads(zlib.decompress(bytes(valor)).decode("utf-8"))
+    return json.loads(valor)
+
+
+@reintentar_si_bloqueada("guardar carrito", por_defecto=False)
 def save_cart(user_id, cart, timestamp):
-    """Guarda o actualiza el carrito de un usuario en la tabla carts."""
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("misc") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("BEGIN TRANSACTION;")
-                cart_json = json.dumps(cart, ensure_ascii=False)
-                cursor.execute("""
-                    INSERT INTO carts (user_id, cart_json, timestamp)
-                    VALUES (?, ?, ?)
-                    ON CONFLICT(user_id) DO UPDATE SET
-                        cart_json = excluded.cart_json,
-                        timestamp = excluded.timestamp;
-                """, (user_id, cart_json, timestamp))
-                conexion.commit()
-                logger.info(f"Carrito guardado para user_id {user_id} con timestamp {timestamp}")
-                return True
-            except sqlite3.OperationalError as e:
-                conexion.rollback()
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error al guardar carrito tras {MAX_RETRIES} intentos: {e}")
-                return False
-            except sqlite3.Error as e:
-                conexion.rollback()
-                logger.error(f"Error inesperado al guardar carrito: {e}")
-                return False
+    """Guarda o actualiza el carrito de un usuario en la tabla carts.
+
+    El JSON se guarda comprimido con zlib y cada escritura incrementa la
+    versión del carrito, que se devuelve (``False`` si no pudo guardarse).
+    """
+    with conectar_db("misc") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("BEGIN IMMEDIATE;")
+        cursor.execute("""
+            INSERT INTO carts (user_id, cart_json, timestamp, version)
+            VALUES (?, ?, ?, 1)
+            ON CONFLICT(user_id) DO UPDATE SET
+                cart_json = excluded.cart_json,
+                timestamp = excluded.timestamp,
+                version = carts.version + 1
+            RETURNING version;
+        """, (user_id, _comprimir_carrito(cart), timestamp))
+        version = cursor.fetchone()[0]
+        conexion.commit()
+        logger.info(f"Carrito guardado para user_id {user_id} con timestamp {timestamp} (versión {version})")
+        return version
+
+@reintentar_si_bloqueada("actualizar carrito")
+def actualizar_carrito(user_id, version_base, transformar, timestamp):
+    """Aplica ``transformar(carrito)`` si la versión guardada es ``version_base``.
+
+    Concurrencia optimista: lectura y escritura ocurren en la misma
+    transacción ``BEGIN IMMEDIATE``. Devuelve ``{"ok", "version", "cart",
+    "timestamp"}``; con ``ok=False`` se informa el estado vigente para que el
+    cliente se resincronice. Los errores de ``transformar`` (``ValueError``)
+    se propagan sin modificar el carrito.
+    """
+    with conectar_db("misc") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("BEGIN IMMEDIATE;")
+        cursor.execute("SELECT cart_json, timestamp, version FROM carts WHERE user_id = ?", (user_id,))
+        fila = cursor.fetchone()
+        cart, actual, version = (_leer_carrito(fila[0]), fila[1], fila[2]) if fila else ({}, None, 0)
+        if version != version_base:
+            conexion.rollback()
+            return {"ok": False, "version": version, "cart": cart, "timestamp": actual}
+        cart = transformar(cart)
+        cursor.execute("""
+            INSERT INTO carts (user_id, cart_json, timestamp, version)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                cart_json = excluded.cart_json,
+                timestamp = excluded.timestamp,
+                version = excluded.version;
+        """, (user_id, _comprimir_carrito(cart), timestamp, version + 1))
+        conexion.commit()
+        return {"ok": True, "version": version + 1, "cart": cart, "timestamp": timestamp}
+
+@reintentar_si_bloqueada("migrar carritos", errores=(sqlite3.Error, OSError))
+def migrar_carts_json(json_path):
+    """Crea la tabla ``carts`` e importa una única vez ``remote_carts.json``.
+
+    El JSON guarda ``{user_id: {"cart": ..., "timestamp": ...}}``; tras
+    importarlo se renombra a ``<nombre>.migrado``.
+    """
+    init_tabla("misc")
+    if not json_path or not os.path.exists(json_path):
+        return 0
+    try:
+        with open(json_path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+    except (OSError, ValueError) as e:
+        logger.error(f"No se pudo leer {json_path} para migrar carritos: {e}")
+        return 0
+    filas = [
+        (str(user_id), _comprimir_carrito(entry.get("cart") or {}), str(entry.get("timestamp") or ""))
+        for user_id, entry in (data.items() if isinstance(data, dict) else [])
+        if isinstance(entry, dict)
+    ]
+    with conectar_db("misc") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("BEGIN IMMEDIATE;")
+        cursor.executemany("""
+            INSERT INTO carts (user_id, cart_json, timestamp)
+            VALUES (?, ?, ?)
+            ON CONFLICT(user_id) DO NOTHING;
+        """, filas)
+        conexion.commit()
+        os.replace(json_path, json_path + ".migrado")
+        logger.info(f"Se migraron {len(filas)} carritos desde {json_path}.")
+        return len(filas)
+
+
+def _carrito_vacio():
+    return {"cart": {"items": [], "client": None, "quotation_id": None, "type": "new", "observations": ""}, "timestamp": None}
 
+
+@reintentar_si_bloqueada("recuperar carrito", por_defecto=_carrito_vacio)
 def get_cart(user_id):
-    for attempt in range(MAX_RETRIES):
-        with conectar_db("misc") as conexion:
-            cursor = conexion.cursor()
-            try:
-                cursor.execute("""
-                    SELECT cart_json, timestamp
-                    FROM carts WHERE user_id = ?
-                """, (user_id,))
-                result = cursor.fetchone()
-                if result:
-                    cart = json.loads(result[0])
-                    timestamp = result[1]
-                    logger.info(f"Carrito recuperado para user_id {user_id} con timestamp {timestamp}")
-                    return {"cart": cart, "timestamp": timestamp}
-                logger.info(f"No se encontró carrito para user_id {user_id}")
-                return {"cart": {"items": [], "client": None, "quotation_id": None, "type": "new", "observations": ""}, "timestamp": None}
-            except sqlite3.OperationalError as e:
-                if "database is locked" in str(e) and attempt < MAX_RETRIES - 1:
-                    logger.warning(f"Base de datos bloqueada, reintentando ({attempt + 1}/{MAX_RETRIES})...")
-                    time.sleep(RETRY_DELAY)
-                    continue
-                logger.error(f"Error al recuperar carrito tras {MAX_RETRIES} intentos: {e}")
-                return {"cart": {"items": [], "client": None, "quotation_id": None, "type": "new", "observations": ""}, "timestamp": None}
-            except sqlite3.Error as e:
-                logger.error(f"Error inesperado al recuperar carrito: {e}")
-                return {"cart": {"items": [], "client": None, "quotation_id": None, "type": "new", "observations": ""}, "timestamp": None}
+    with conectar_db("misc") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("""
+            SELECT cart_json, timestamp, version
+            FROM carts WHERE user_id = ?
+        """, (user_id,))
+        result = cursor.fetchone()
+        if result:
+            cart = _leer_carrito(result[0])
+            timestamp = result[1]
+            logger.info(f"Carrito recuperado para user_id {user_id} con timestamp {timestamp}")
+            return {"cart": cart, "timestamp": timestamp, "version": result[2]}
+        logger.info(f"No se encontró carrito para user_id {user_id}")
+        return _carrito_vacio()
+
+
+def _fila_cliente_extra(cliente):
+    texto = lambda clave: str(cliente.get(clave) or "").strip().lower()  # noqa: E731
+    busqueda = " ".join(str(cliente.get(clave, "")) for clave in ("numero_cliente", "doc", "dni", "nombre", "nombre_completo"))
+    return (
+        str(cliente["numero_cliente"]),
+        texto("doc") or None,
+        texto("dni") or None,
+        texto("nombre_completo") or texto("nombre") or None,
+        busqueda.lower(),
+        json.dumps(cliente, ensure_ascii=False),
+    )
+
 
+def _upsert_clientes_extra(cursor, clientes):
+    cursor.executemany("""
+        INSERT INTO clientes_extra (numero_cliente, doc_norm, dni_norm, nombre_norm, busqueda, cliente_json)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT(numero_cliente) DO UPDATE SET
+            doc_norm = excluded.doc_norm,
+            dni_norm = excluded.dni_norm,
+            nombre_norm = excluded.nombre_norm,
+            busqueda = excluded.busqueda,
+            cliente_json = excluded.cliente_json,
+            actualizado = CURRENT_TIMESTAMP;
+    """, [_fila_cliente_extra(cliente) for cliente in clientes])
 
 
+@reintentar_si_bloqueada("migrar clientes extra", errores=(sqlite3.Error, OSError, ValueError))
+def migrar_clientes_extra_json(json_path):
+    """Crea la tabla ``clientes_extra`` e importa una única vez el JSON histórico.
 
+    Tras importarlo el archivo se renombra a ``<nombre>.migrado`` para que no
+    vuelva a procesarse.
+    """
+    with conectar_db("clientes_extra") as conexion:
+        cursor = conexion.cursor()
+        cursor.executescript(SCRIPT_CLIENTES_EXTRA)
+        if not json_path or not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError) as e:
+            logger.error(f"No se pudo leer {json_path} para migrar clientes extra: {e}")
+            return 0
+        clientes = [c for c in data if isinstance(c, dict) and c.get("numero_cliente")] if isinstance(data, list) else []
+        cursor.execute("BEGIN IMMEDIATE;")
+        _upsert_clientes_extra(cursor, clientes)
+        conexion.commit()
+        os.replace(json_path, json_path + ".migrado")
+        logger.info(f"Se migraron {len(clientes)} clientes desde {json_path}.")
+        return len(clientes)
+
+
+@reintentar_si_bloqueada("guardar cliente extra")
+def guardar_cliente_extra(cliente):
+    """Inserta o actualiza (por ``numero_cliente``) un cliente creado en el POS."""
+    with conectar_db("clientes_extra") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("BEGIN IMMEDIATE;")
+        _upsert_clientes_extra(cursor, [cliente])
+        conexion.commit()
+        logger.info(f"Cliente extra {cliente.get('numero_cliente')} guardado.")
+        return True
+
+
+@reintentar_si_bloqueada("contar clientes extra", por_defecto=0)
+def contar_clientes_extra():
+    with conectar_db("clientes_extra") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("SELECT COUNT(*) FROM clientes_extra")
+        return cursor.fetchone()[0]
+
+
+@reintentar_si_bloqueada("buscar cliente extra", por_defecto=None)
+def obtener_cliente_extra_por_documento(documento):
+    """Primer cliente extra cuyo ``doc`` o ``dni`` coincide (sin mayúsculas)."""
+    documento = str(documento or "").strip().lower()
+    if not documento:
+        return None
+    with conectar_db("clientes_extra") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("""
+            SELECT cliente_json FROM clientes_extra
+            WHERE doc_norm = ? OR dni_norm = ?
+            ORDER BY rowid LIMIT 1
+        """, (documento, documento))
+        fila = cursor.fetchone()
+        return json.loads(fila[0]) if fila else None
+
+
+@reintentar_si_bloqueada("buscar clientes extra", por_defecto=list)
+def buscar_clientes_extra(consulta, limite=50):
+    """Clientes extra que contienen ``consulta``; las coincidencias de documento primero."""
+    consulta = str(consulta or "").strip().lower()
+    if not consulta or limite <= 0:
+        return []
+    with conectar_db("clientes_extra") as conexion:
+        cursor = conexion.cursor()
+        cursor.execute("""
+            SELECT cliente_json FROM (
+                SELECT cliente_json, 0 AS prioridad, rowid AS orden FROM clientes_extra
+                WHERE doc_norm = ? OR dni_norm = ?
+                UNION
+                SELECT cliente_json, 1 AS prioridad, rowid AS orden FROM clientes_extra
+                WHERE instr(busqueda, ?) > 0
+            )
+            GROUP BY orden
+            ORDER BY MIN(prioridad), orden
+            LIMIT ?
+        """, (consulta, consulta, consulta, limite))
+        return [json.loads(fila[0]) for fila in cursor.fetchall()]
@@ -0,0 +1,132 @@
+"""Reintentos ante ``database is locked`` compartidos por ``services.database``.
+
+Cada intento ya espera hasta ``busy_timeout`` dentro de SQLite; si aun así la
+base sigue bloqueada se reintenta con backoff exponencial con jitter hasta un
+plazo total (``SQLITE_LOCK_DEADLINE``), en lugar de dormir 2,5 s fijos cinco
+veces. Las funciones decoradas exponen ``.aio``: la misma operación ejecutada
+en un hilo y con esperas ``asyncio.sleep``, para llamarla desde código async
+sin bloquear el event loop.
+
+Las esperas se cuentan por operación (``estadisticas_bloqueos``) para poder
+medir la contención.
+"""
+import asyncio
+import functools
+import random
+import sqlite3
+import threading
+import time
+
+from services.logging_utils import get_module_logger
+
+try:
+    from services.config import SQLITE_LOCK_DEADLINE
+except Exception:
+    from config import SQLITE_LOCK_DEADLINE
+
+logger = get_module_logger(__name__)
+
+BACKOFF_INICIAL = 0.05  # segundos
+BACKOFF_MAXIMO = 1.0
+
+_PROPAGAR = object()
+_estadisticas_lock = threading.Lock()
+_estadisticas = {}
+
+
+def es_bloqueo(error):
+    """``True`` si ``error`` es un bloqueo transitorio de SQLite."""
+    mensaje = str(error).lower()
+    return isinstance(error, sqlite3.OperationalError) and ("database is locked" in mensaje or "database is busy" in mensaje)
+
+
+def _registrar(accion, clave, valor=1):
+    with _estadisticas_lock:
+        contadores = _estadisticas.setdefault(accion, {"esperas": 0, "segundos_espera": 0.0, "agotados": 0})
+        contadores[clave] += valor
+
+
+def estadisticas_bloqueos():
+    """Copia de los contadores por operación: esperas, segundos esperados y agotados."""
+    with _estadisticas_lock:
+        return {accion: dict(contadores) for accion, contadores in _estadisticas.items()}
+
+
+def reiniciar_estadisticas():
+    with _estadisticas_lock:
+        _estadisticas.clear()
+
+
+def _espera(intento, limite):
+    """Backoff con jitter completo; ``None`` si ya no hay tiempo antes de ``limite``."""
+    espera = random.uniform(0, min(BACKOFF_MAXIMO, BACKOFF_INICIAL * 2 ** intento))
+    if time.monotonic() + espera > limite:
+        return None
+    return espera
+
+
+def reintentar_si_bloqueada(accion, por_defecto=_PROPAGAR, errores=(sqlite3.Error,), plazo=None):
+    """Decorador de operaciones SQLite.
+
+    Los bloqueos se reintentan hasta ``plazo`` segundos. Al agotarse, o ante
+    otro error de ``errores``, se registra en el log y se devuelve
+    ``por_defecto`` (si es invocable, su resultado) o se propaga la excepción
+    cuando no se indicó. La transacción pendiente la revierte ``conectar_db``.
+    """
+
+    def resolver_error(error, intentos):
+        if es_bloqueo(error):
+            _registrar(accion, "agotados")
+            logger.error(f"Error al {accion} tras {intentos} intentos: {error}")
+        else:
+            logger.error(f"Error inesperado al {accion}: {error}")
+        if por_defecto is _PROPAGAR:
+            raise error
+        return por_defecto() if callable(por_defecto) else por_defecto
+
+    def siguiente_espera(error, intento, limite):
+        if not es_bloqueo(error):
+            return None
+        espera = _espera(intento, limite)
+        if espera is not None:
+            _registrar(accion, "esperas")
+            _registrar(accion, "segundos_espera", espera)
+            logger.warning(f"Base de datos bloqueada al {accion}, reintentando en {espera:.2f}s (intento {intento + 1})...")
+        return espera
+
+    def decorador(func):
+        @functools.wraps(func)
+        def envoltura(*args, **kwargs):
+            limite = time.monotonic() + (SQLITE_LOCK_DEADLINE if plazo is None else plazo)
+            intento = 0
+            while True:
+                try:
+                    return func(*args, **kwargs)
+                except errores as error:
+                    espera = siguiente_espera(error, intento, limite)
+                    if espera is None:
+                        return resolver_error(error, intento + 1)
+                intento += 1
+                time.sleep(espera)
+
+        async def envoltura_async(*args, **kwargs):
+            limite = time.monotonic() + (SQLITE_LOCK_DEADLINE if plazo is None else plazo)
+            intento = 0
+            while True:
+                try:
+                    if asyncio.iscoroutinefunction(func):
+                        return await func(*args, **kwargs)
+                    return await asyncio.to_thread(func, *args, **kwargs)
+                except errores as error:
+                    espera = siguiente_espera(error, intento, limite)
+                    if espera is None:
+                        return resolver_error(error, intento + 1)
+                intento += 1
+                await asyncio.sleep(espera)
+
+        if asyncio.iscoroutinefunction(func):
+            return functools.wraps(func)(envoltura_async)
+        envoltura.aio = envoltura_async
+        return envoltura
+
+    return decorador
@@ -8,6 +8,10 @@ from requests import RequestException
 from services.database import agregar_atributos_masivo, agregar_stock_masivo, \
     agregar_grupos_cumplimiento_masivo, agregar_empleados_masivo, agregar_datos_tienda_masivo
 from services.logging_utils import get_module_logger
+try:
+    from services.config import SYNC_BATCH_SIZE
+except Exception:
+    from config import SYNC_BATCH_SIZE
 
 # Obtén la ruta absoluta a la raíz del proyecto
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))  # Carpeta donde está fabric.py
@@ -124,6 +128,21 @@ def obtener_parquet_productos(timeout: float | None = 60):
         logger.error("Error descargando Parquet de productos desde Fabric: %s", exc)
         return None
 
+def _filas_por_lotes(cursor, tamano=None):
+    """Itera las filas de ``cursor`` trayéndolas con ``fetchmany`` (memoria acotada)."""
+    tamano = tamano or SYNC_BATCH_SIZE
+    cursor.arraysize = tamano
+    while True:
+        filas = cursor.fetchmany(tamano)
+        if not filas:
+            return
+        yield from filas
+
+
+def _progreso(descripcion):
+    return lambda total: logger.info(f"Sincronizando {descripcion} desde Fabric: {total} registros insertados...")
+
+
 def obtener_atributos_fabric():
     """
     Obtains attributes from the Fabric database and inserts them into another system in bulk.
@@ -138,13 +157,10 @@ def obtener_atributos_fabric():
 
     try:
         cursor_fabric.execute(query)
-        atributos = cursor_fabric.fetchall()
+        total_insertados = agregar_atributos_masivo(_filas_por_lotes(cursor_fabric), progreso=_progreso("atributos"))
 
-        if not atributos:
+        if not total_insertados:
             logger.info("No se encontraron atributos en Fabric.")
-            return 0
-
-        total_insertados = agregar_atributos_masivo(atributos)
         return total_insertados
 
     except Exception as e:
@@ -172,13 +188,10 @@ def obtener_stock_fabric():
     try:
         cursor = conexion_fabric.cursor()
         cursor.execute(query)
-        stock_data = cursor.fetchall()
+        total_insertados = agregar_stock_masivo(_filas_por_lotes(cursor), progreso=_progreso("stock"))
 
-        if not stock_data:
+        if not total_insertados:
             logger.info("No se encontraron datos de stock en Fabric.")
-            return 0
-
-        total_insertados = agregar_stock_masivo(stock_data)
         return total_insertados
 
     except Exception as e:
@@ -206,13 +219,10 @@ def obtener_grupos_cumplimiento_fabric():
     try:
         cursor = conexion_fabric.cursor()
         cursor.execute(query)
-        grupos_data = cursor.fetchall()
+        total_insertados = agregar_grupos_cumplimiento_masivo(_filas_por_lotes(cursor), progreso=_progreso("grupos de cumplimiento"))
 
-        if not grupos_data:
+        if not total_insertados:
             logger.info("No se encontraron datos de grupos de cumplimiento en Fabric.")
-            return 0
-
-        total_insertados = agregar_grupos_cumplimiento_masivo(grupos_data)
         return total_insertados
 
     except Exception as e:
@@ -248,13 +258,10 @@ def obtener_empleados_fabric():
 
     try:
         cursor_fabric.execute(query)
-        empleados = cursor_fabric.fetchall()
+        total_insertados = agregar_empleados_masivo(_filas_por_lotes(cursor_fabric), progreso=_progreso("empleados"))
 
-        if not empleados:
+        if not total_insertados:
             logger.info("No se encontraron empleados en Fabric.")
-            return 0
-
-        total_insertados = agregar_empleados_masivo(empleados)
         return total_insertados
 
     except Exception as e:
@@ -268,7 +275,7 @@ def obtener_empleados_fabric():
 def obtener_datos_tiendas():
     """
     Obtiene los datos de productos desde la base de datos Fabric y los almacena localmente.
-    Usa fetchall() para recuperar todos los datos en una sola llamada.
+    Las filas se leen con fetchmany() y se insertan por lotes a medida que llegan.
     """
     query = """
     SELECT
@@ -303,15 +310,13 @@ def obtener_datos_tiendas():
         cursor_fabric.execute(query)
         logger.info("Consulta ejecutada con éxito.")
 
-        logger.info("Recuperando los datos de tiendas con fetchall()...")
-        productos = cursor_fabric.fetchall()
-        logger.info(f"Número de registros recuperados: {len(productos)}")
+        logger.info("Recuperando los datos de tiendas por lotes con fetchmany()...")
+        total_insertados = agregar_datos_tienda_masivo(_filas_por_lotes(cursor_fabric), progreso=_progreso("tiendas"))
 
-        if not productos:
+        if not total_insertados:
             logger.info("No se encontraron datos en Fabric.")
             return 0
 
-        total_insertados = agregar_datos_tienda_masivo(productos)
         logger.info(f"Total de datos de tiendas insertados: {total_insertados}")
 
         return total_insertados
@@ -325,63 +330,70 @@ def obtener_datos_tiendas():
             conexion_fabric.close()
             logger.info("Conexión con Fabric cerrada.")
 
+_CONSULTA_CODIGOS_POSTALES = """
+SELECT
+    AD.[value.ZipCode] AS AddressZipCode,
+    AD.[value.CountryRegionId] AS AddressCountryRegionId,
+    AD.[value.StateId] AS AddressState,
+    AD.[value.CountyId] AS AddressCounty,
+    AD.[value.CityAlias] AS AddressCity,
+    AC.[value.Description] AS CountyName
+FROM [DataStagingWarehouse].[dbo].[AddressPostalCodesV3] AD
+INNER JOIN [DataStagingWarehouse].[dbo].[AddressCounties] AC
+    ON AD.[value.CountyId]=AC.[value.CountyId]
+WHERE
+    AD.[value.ZipCode] <> ''
+    AND AD.[value.ZipCode] LIKE '%[0-9]%'
+    AND AD.[value.ZipCode] NOT LIKE '%[^0-9]%'
+    AND AD.[value.StateId] <> ''
+    AND AD.[value.CountyId] <> ''
+    AND AD.[value.CountryRegionId] = 'ARG';
+"""
+
+_COLUMNAS_CODIGOS_POSTALES = (
+    "AddressZipCode", "AddressCountryRegionId", "AddressState", "AddressCounty", "AddressCity", "CountyName",
+)
+
+def iterar_codigos_postales_fabric(tamano=None):
+    """Padrón de códigos postales en lotes de ``fetchmany`` (tuplas en el orden de la consulta).
+
+    Sin conexión no entrega filas; los errores de la consulta se propagan.
+    """
+    conexion_fabric = conectar_fabric_db()
+    if not conexion_fabric:
+        logger.error("No se pudo conectar a Fabric.")
+        return
+    try:
+        cursor = conexion_fabric.cursor()
+        cursor.execute(_CONSULTA_CODIGOS_POSTALES)
+        tamano = tamano or SYNC_BATCH_SIZE
+        cursor.arraysize = tamano
+        while True:
+            filas = cursor.fetchmany(tamano)
+            if not filas:
+                return
+            yield [tuple(fila) for fila in filas]
+    finally:
+        conexion_fabric.close()
+
 def obtener_codigos_postales_fabric():
     """Obtiene el padrón de códigos postales para Argentina desde Fabric.
 
     Devuelve una lista de dict con claves:
     - AddressZipCode, AddressCountryRegionId, AddressState, AddressCounty, AddressCity, CountyName
+    Ante un error lo registra y devuelve ``[]``.
     """
-    query = """
-    SELECT
-        AD.[value.ZipCode] AS AddressZipCode,
-        AD.[value.CountryRegionId] AS AddressCountryRegionId,
-        AD.[value.StateId] AS AddressState,
-        AD.[value.CountyId] AS AddressCounty,
-        AD.[value.CityAlias] AS AddressCity,
-        AC.[value.Description] AS CountyName
-    FROM [DataStagingWarehouse].[dbo].[AddressPostalCodesV3] AD
-    INNER JOIN [DataStagingWarehouse].[dbo].[AddressCounties] AC
-        ON AD.[value.CountyId]=AC.[value.CountyId]
-    WHERE
-        AD.[value.ZipCode] <> ''
-        AND AD.[value.ZipCode] LIKE '%[0-9]%'
-        AND AD.[value.ZipCode] NOT LIKE '%[^0-9]%'
-        AND AD.[value.StateId] <> ''
-        AND AD.[value.CountyId] <> ''
-        AND AD.[value.CountryRegionId] = 'ARG';
-    """
-
-    conexion_fabric = conectar_fabric_db()
-    if not conexion_fabric:
-        logger.error("No se pudo conectar a Fabric.")
-        return []
     try:
-        cursor = conexion_fabric.cursor()
-        cursor.execute(query)
-        filas = cursor.fetchall()
-        out = []
-        for row in filas:
-            try:
-                out.append({
-                    "AddressZipCode": row.AddressZipCode,
-                    "AddressCountryRegionId": row.AddressCountryRegionId,
-                    "AddressState": row.AddressState,
-                    "AddressCounty": row.AddressCounty,
-                    "AddressCity": row.AddressCity,
-                    "CountyName": row.CountyName,
-                })
-            except Exception:
-                continue
-        logger.info(f"obtener_codigos_postales_fabric: {len(out)} registros")
-        return out
+        out = [
+            dict(zip(_COLUMNAS_CODIGOS_POSTALES, fila))
+            for lote in iterar_codigos_postales_fabric()
+            for fila in lote
+        ]
     except Exception as e:
         logger.error(f"Error obtener_codigos_postales_fabric: {e}\n{traceback.format_exc()}")
         return []
-    finally:
-        try:
-            conexion_fabric.close()
-        except Exception:
-            pass
+    logger.info(f"obtener_codigos_postales_fabric: {len(out)} registros")
+    return out
 
 async def obtener_datos_codigo_postal(codigo_postal):
     """Consulta Fabric para obtener datos de dirección basados en el código postal."""
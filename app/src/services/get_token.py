@@ -1,17 +1,12 @@
-import requests
-import configparser
 import os
 from django.http import JsonResponse
 from services.logging_utils import get_module_logger
+from services.token_d365 import ErrorTokenD365, load_d365_config, obtener_token  # noqa: F401
 
 # Obtén la ruta absoluta a la raíz del proyecto
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 CONFIG_PATH = os.path.join(os.path.dirname(ROOT_DIR), 'config.ini')  # Config.ini en la raíz del proyecto
 
-# Cargar la configuración
-config = configparser.ConfigParser()
-config.read(CONFIG_PATH)
-
 logger = get_module_logger(__name__)
 
 
@@ -23,74 +18,18 @@ class TokenRetrievalError(Exception):
         self.response = JsonResponse({"error": message}, status=500)
         super().__init__(message)
 
-def load_d365_config():
-
-    if 'd365' not in config:
-        raise KeyError("La sección 'd365' no se encuentra en config.ini")
-
-    return {
-        "resource": config['d365'].get('resource', ''),
-        "token_client": config['d365'].get('token_client', ''),
-        "client_prod": config['d365'].get('client_prod', ''),
-        "client_qa": config['d365'].get('client_qa', ''),
-        "client_id_prod": config['d365'].get('client_id_prod', ''),
-        "client_id_qa": config['d365'].get('client_id_qa', ''),
-        "client_secret_prod": config['d365'].get('client_secret_prod', ''),
-        "client_secret_qa": config['d365'].get('client_secret_qa', ''),
-    }
-
 
+# El token se cachea por entorno y se renueva en segundo plano antes de vencer
+# (ver ``services/token_d365.py``); estas funciones solo esperan la red en frío.
 def get_access_token_d365():
-
-    d365_config = load_d365_config()
-    client_id_prod = d365_config["client_id_prod"]
-    client_secret_prod = d365_config["client_secret_prod"]
-    token_url = d365_config["token_client"]
-    resource = d365_config["resource"]
-    token_params = {
-        "grant_type": "client_credentials",
-        "client_id": client_id_prod,
-        "client_secret": client_secret_prod,
-        "resource": resource
-    }
-
     try:
-        response = requests.post(token_url, data=token_params, timeout=60)
-        response.raise_for_status()  # Verificar si hay errores en la respuesta
-
-        token_data = response.json()
-        access_token = token_data['access_token']
-        logger.info("Consulta token a D365 OK")
-        return access_token
-
-    except requests.RequestException as e:
-        logger.error(f"Consulta token a D365 FALLO. {e}")
+        return obtener_token("prod")
+    except ErrorTokenD365 as e:
         raise TokenRetrievalError("No se pudo obtener el token de acceso") from e
 
 
 def get_access_token_d365_qa():
-
-    d365_config = load_d365_config()
-    client_id_qa = d365_config["client_id_qa"]
-    client_secret_qa = d365_config["client_secret_qa"]
-    token_url = d365_config["token_client"]
-    resource = d365_config["resource"]
-    token_params = {
-        "grant_type": "client_credentials",
-        "client_id": client_id_qa,
-        "client_secret": client_secret_qa,
-        "resource": resource
-    }
-
     try:
-        response = requests.post(token_url, data=token_params, timeout=60)
-        response.raise_for_status()  # Verificar si hay errores en la respuesta
-
-        token_data = response.json()
-        access_token = token_data['access_token']
-        logger.info("Consulta token a D365 OK")
-        return access_token
-
-    except requests.RequestException as e:
-        logger.error(f"Consulta token a D365 FALLO. {e}")
+        return obtener_token("qa")
+    except ErrorTokenD365 as e:
         raise TokenRetrievalError("No se pudo obtener el token de acceso") from e
@@ -0,0 +1,81 @@
+# services/http_client.py
+"""
+Cliente ``httpx.AsyncClient`` compartido para las llamadas OData a D365.
+
+Antes cada operación abría su propio cliente y cada presupuesto pagaba un
+handshake TCP+TLS nuevo contra Dynamics. Aquí se mantiene un cliente por event
+loop con conexiones keep-alive (y HTTP/2 si el paquete ``h2`` está instalado),
+límites de pool configurables y timeouts por tipo de operación.
+
+Un ``AsyncClient`` queda ligado al loop donde abrió sus conexiones, por eso se
+guarda uno por loop. El lifespan de FastAPI lo cierra con ``cerrar_cliente``;
+los wrappers síncronos que crean un loop por llamada lo cierran al terminar.
+"""
+import asyncio
+import threading
+import weakref
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+
+from services.config import (
+    D365_CONNECT_TIMEOUT,
+    D365_HTTP2,
+    D365_KEEPALIVE_EXPIRY,
+    D365_MAX_CONNECTIONS,
+    D365_MAX_KEEPALIVE,
+    D365_TIMEOUTS,
+)
+from services.logging_utils import get_module_logger
+
+try:  # HTTP/2 es opcional: httpx lo necesita a través del paquete ``h2``.
+    import h2  # noqa: F401
+    HTTP2_DISPONIBLE = True
+except ImportError:  # pragma: no cover - depende del entorno
+    HTTP2_DISPONIBLE = False
+
+logger = get_module_logger(__name__)
+
+_lock = threading.Lock()
+_clientes: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def timeout(operacion: str) -> httpx.Timeout:
+    """Timeout de ``operacion`` (``consulta``, ``alta`` o ``lote``)."""
+    return httpx.Timeout(D365_TIMEOUTS[operacion], connect=D365_CONNECT_TIMEOUT)
+
+
+def _nuevo_cliente() -> httpx.AsyncClient:
+    http2 = D365_HTTP2 and HTTP2_DISPONIBLE
+    limites = httpx.Limits(
+        max_connections=D365_MAX_CONNECTIONS,
+        max_keepalive_connections=D365_MAX_KEEPALIVE,
+        keepalive_expiry=D365_KEEPALIVE_EXPIRY,
+    )
+    logger.info(f"Creando cliente HTTP compartido para D365 (http2={http2}, conexiones={D365_MAX_CONNECTIONS})")
+    return httpx.AsyncClient(http2=http2, limits=limites, timeout=timeout("consulta"))
+
+
+def obtener_cliente() -> httpx.AsyncClient:
+    """Cliente compartido del event loop en ejecución."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        cliente = _clientes.get(loop)
+        if cliente is None or cliente.is_closed:
+            cliente = _clientes[loop] = _nuevo_cliente()
+        return cliente
+
+
+async def cerrar_cliente() -> None:
+    """Cierra el cliente del loop en ejecución (si existe)."""
+    with _lock:
+        cliente: Optional[httpx.AsyncClient] = _clientes.pop(asyncio.get_running_loop(), None)
+    if cliente is not None and not cliente.is_closed:
+        await cliente.aclose()
+
+
+@asynccontextmanager
+async def cliente_compartido():
+    """``async with`` que entrega el cliente compartido sin cerrarlo al salir."""
+    yield obtener_cliente()
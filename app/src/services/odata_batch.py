@@ -0,0 +1,107 @@
+# services/odata_batch.py
+"""
+Armado y lectura de lotes OData ``$batch`` (``multipart/mixed``) para D365.
+
+``construir_changeset`` arma un lote con un único changeset: D365 lo aplica de
+forma atómica y las operaciones pueden referenciar el resultado de una anterior
+por su ``Content-ID`` (``$1/...``). ``parsear_respuesta`` lee la respuesta
+multipart con el parser MIME de la biblioteca estándar (incluidos changesets
+anidados) y devuelve el status, el ``Content-ID`` y el cuerpo de cada operación,
+en lugar de buscar líneas ``HTTP/1.1`` en el texto.
+"""
+import json
+import uuid
+from dataclasses import dataclass, field
+from email import policy
+from email.parser import BytesParser
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+@dataclass
+class Operacion:
+    metodo: str
+    url: str
+    cuerpo: Optional[Dict[str, Any]] = None
+    content_id: Optional[str] = None
+
+
+@dataclass
+class RespuestaOperacion:
+    status: int
+    content_id: Optional[str] = None
+    headers: Dict[str, str] = field(default_factory=dict)
+    cuerpo: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.status < 400
+
+    def json(self) -> Any:
+        return json.loads(self.cuerpo) if self.cuerpo.strip() else None
+
+
+def construir_changeset(operaciones: Iterable[Operacion]) -> Tuple[str, str]:
+    """Devuelve ``(content_type, cuerpo)`` de un ``$batch`` con un único changeset."""
+    batch_boundary = f"batch_{uuid.uuid4()}"
+    changeset_boundary = f"changeset_{uuid.uuid4()}"
+    partes = [
+        f"--{batch_boundary}",
+        f"Content-Type: multipart/mixed; boundary={changeset_boundary}",
+        "",
+    ]
+    for indice, operacion in enumerate(operaciones, start=1):
+        partes.extend([
+            f"--{changeset_boundary}",
+            "Content-Type: application/http",
+            "Content-Transfer-Encoding: binary",
+            f"Content-ID: {operacion.content_id or indice}",
+            "",
+            f"{operacion.metodo} {operacion.url} HTTP/1.1",
+            "Accept: application/json",
+        ])
+        if operacion.cuerpo is not None:
+            partes.extend(["Content-Type: application/json", "", json.dumps(operacion.cuerpo)])
+        else:
+            partes.append("")
+    partes.extend([f"--{changeset_boundary}--", f"--{batch_boundary}--", ""])
+    return f"multipart/mixed; boundary={batch_boundary}", "\r\n".join(partes)
+
+
+def _respuesta_http(crudo: bytes, content_id: Optional[str]) -> RespuestaOperacion:
+    texto = crudo.decode("utf-8", errors="replace")
+    encabezado, _, cuerpo = texto.replace("\r\n", "\n").partition("\n\n")
+    linea_estado, *lineas = encabezado.split("\n")
+    headers = {}
+    for linea in lineas:
+        nombre, separador, valor = linea.partition(":")
+        if separador:
+            headers[nombre.strip()] = valor.strip()
+    try:
+        status = int(linea_estado.split(" ")[1])
+    except (IndexError, ValueError):
+        raise ValueError(f"Línea de estado inválida en respuesta de $batch: {linea_estado!r}") from None
+    return RespuestaOperacion(status, content_id or headers.get("Content-ID"), headers, cuerpo.strip())
+
+
+def parsear_respuesta(content_type: str, contenido: bytes) -> List[RespuestaOperacion]:
+    """Respuestas de cada operación de un ``$batch`` (vacío si no es multipart).
+
+    Lanza ``ValueError`` si una parte no tiene una línea de estado HTTP válida.
+    """
+    mensaje = BytesParser(policy=policy.HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + contenido
+    )
+    respuestas = []
+    for parte in mensaje.walk():
+        if parte.get_content_type() == "application/http":
+            respuestas.append(_respuesta_http(parte.get_payload(decode=True), parte.get("Content-ID")))
+    return respuestas
+
+
+def errores(respuestas: Iterable[RespuestaOperacion]) -> List[str]:
+    """Descripción de las operaciones fallidas, para logs y correos de fallo."""
+    return [
+        f"Operación {respuesta.content_id or '?'}: HTTP {respuesta.status} {respuesta.cuerpo[:500]}"
+        for respuesta in respuestas
+        if not respuesta.ok
+    ]
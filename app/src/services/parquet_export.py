@@ -0,0 +1,124 @@
+# services/parquet_export.py
+"""
+Exportación de cursores (SQLite o ODBC) a Parquet sin pasar por dicts.
+
+Las filas llegan en lotes de ``fetchmany`` y cada lote se traspone a columnas
+Arrow con un esquema fijo, se escribe con ``pq.ParquetWriter`` y se descarta:
+en memoria hay a lo sumo un lote, en lugar de la lista de dicts, el dict de
+listas y la tabla completa.
+
+El archivo se escribe en un temporal del mismo directorio y se publica con
+``os.replace``, así el watcher y los lectores nunca ven un Parquet a medio
+escribir.
+"""
+import os
+import threading
+from typing import Iterable, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from services.config import PARQUET_COMPRESSION, PARQUET_ROW_GROUP_SIZE
+
+SCHEMA_STOCK = pa.schema([
+    ("codigo", pa.string()),
+    ("almacen_365", pa.string()),
+    ("stock_fisico", pa.float64()),
+    ("disponible_venta", pa.float64()),
+    ("disponible_entrega", pa.float64()),
+    ("comprometido", pa.float64()),
+])
+
+SCHEMA_EMPLEADOS = pa.schema([
+    ("empleado_d365", pa.string()),
+    ("id_puesto", pa.string()),
+    ("email", pa.string()),
+    ("nombre_completo", pa.string()),
+    ("numero_sap", pa.string()),
+])
+
+SCHEMA_ATRIBUTOS = pa.schema([
+    ("ProductNumber", pa.string()),
+    ("ProductName", pa.string()),
+    ("AttributeName", pa.string()),
+    ("AttributeValue", pa.string()),
+])
+
+SCHEMA_CODIGOS_POSTALES = pa.schema([
+    ("AddressZipCode", pa.string()),
+    ("AddressCountryRegionId", pa.string()),
+    ("AddressState", pa.string()),
+    ("AddressCounty", pa.string()),
+    ("AddressCity", pa.string()),
+    ("CountyName", pa.string()),
+])
+
+
+def _column(values: Sequence, field: pa.Field) -> pa.Array:
+    try:
+        return pa.array(values, type=field.type)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        if not pa.types.is_string(field.type):
+            raise
+        # Orígenes ODBC pueden devolver números en columnas de texto.
+        return pa.array([None if value is None else str(value) for value in values], type=field.type)
+
+
+def record_batch(rows: Sequence[Sequence], schema: pa.Schema) -> pa.RecordBatch:
+    """Traspone filas (tuplas en el orden de ``schema``) a un ``RecordBatch``."""
+    columns = list(zip(*rows)) if rows else [()] * len(schema)
+    return pa.RecordBatch.from_arrays([_column(list(values), field) for values, field in zip(columns, schema)], schema=schema)
+
+
+def write_batches(
+    batches: Iterable[Sequence[Sequence]],
+    schema: pa.Schema,
+    path: str,
+    row_group_size: Optional[int] = None,
+    compression: Optional[str] = None,
+) -> int:
+    """Escribe los lotes de filas en ``path`` de forma atómica; devuelve las filas.
+
+    Los lotes se acumulan (ya en Arrow) hasta completar ``row_group_size``
+    filas para no generar un row group por lote. Si no llega ninguna fila no
+    se escribe nada y ``path`` queda intacto.
+    """
+    row_group_size = row_group_size or PARQUET_ROW_GROUP_SIZE
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    total, pending, pending_rows = 0, [], 0
+    writer = None
+
+    def flush(final: bool = False) -> None:
+        # Se escriben sólo row groups completos; el resto queda pendiente.
+        nonlocal writer, pending, pending_rows
+        table = pa.Table.from_batches(pending, schema=schema)
+        size = table.num_rows if final else table.num_rows - table.num_rows % row_group_size
+        if writer is None:
+            writer = pq.ParquetWriter(tmp, schema, compression=compression or PARQUET_COMPRESSION)
+        writer.write_table(table.slice(0, size), row_group_size=row_group_size)
+        pending = table.slice(size).to_batches()
+        pending_rows = table.num_rows - size
+
+    try:
+        for rows in batches:
+            if not rows:
+                continue
+            pending.append(record_batch(rows, schema))
+            pending_rows += len(rows)
+            total += len(rows)
+            if pending_rows >= row_group_size:
+                flush()
+        if pending_rows:
+            flush(final=True)
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.replace(tmp, path)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return total
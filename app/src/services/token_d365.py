@@ -0,0 +1,209 @@
+# services/token_d365.py
+"""
+Token OAuth de D365 cacheado por entorno (``prod``/``qa``) con refresco anticipado.
+
+``get_access_token_d365`` hacía un POST síncrono al endpoint OAuth (timeout de
+60 s) en cada llamada. ``GestorToken`` guarda el token en memoria y en
+``misc.db`` (tabla ``tokens_d365``) junto con su vencimiento, lo renueva en el
+loop de ``async_bridge`` ``D365_TOKEN_REFRESH_MARGIN`` segundos antes de que
+venza y hace que los llamadores concurrentes compartan un único refresco en
+curso. Solo el primer pedido en frío (sin token válido en memoria ni en la
+base) espera el round trip de autenticación.
+"""
+import asyncio
+import concurrent.futures
+import configparser
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+
+from services import async_bridge, http_client
+from services.config import D365_TOKEN_REFRESH_MARGIN
+from services.database import guardar_token_entorno, obtener_token_entorno
+from services.logging_utils import get_module_logger
+
+logger = get_module_logger(__name__)
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.ini")
+
+ENTORNOS = ("prod", "qa")
+# Vigencia asumida si el endpoint no informa ``expires_in`` (Azure AD: 1 h).
+EXPIRACION_POR_DEFECTO = 3599.0
+# Por debajo de este resto de vida el token ya no se entrega: se espera el refresco.
+RESERVA_MINIMA = 30.0
+# Reintento del refresco en segundo plano cuando falla y el token sigue vigente.
+REINTENTO_REFRESCO = 30.0
+
+_ahora = time.time
+
+SolicitarToken = Callable[[str], Awaitable[Tuple[str, float]]]
+
+
+class ErrorTokenD365(Exception):
+    """No se pudo obtener un token de D365."""
+
+
+def load_d365_config():
+    config = configparser.ConfigParser()
+    config.read(CONFIG_PATH)
+    if 'd365' not in config:
+        raise KeyError("La sección 'd365' no se encuentra en config.ini")
+
+    return {
+        "resource": config['d365'].get('resource', ''),
+        "token_client": config['d365'].get('token_client', ''),
+        "client_prod": config['d365'].get('client_prod', ''),
+        "client_qa": config['d365'].get('client_qa', ''),
+        "client_id_prod": config['d365'].get('client_id_prod', ''),
+        "client_id_qa": config['d365'].get('client_id_qa', ''),
+        "client_secret_prod": config['d365'].get('client_secret_prod', ''),
+        "client_secret_qa": config['d365'].get('client_secret_qa', ''),
+    }
+
+
+async def solicitar_token(entorno: str) -> Tuple[str, float]:
+    """Pide un token ``client_credentials`` para ``entorno``; devuelve ``(token, expires_in)``."""
+    d365_config = load_d365_config()
+    token_params = {
+        "grant_type": "client_credentials",
+        "client_id": d365_config[f"client_id_{entorno}"],
+        "client_secret": d365_config[f"client_secret_{entorno}"],
+        "resource": d365_config["resource"],
+    }
+    try:
+        response = await http_client.obtener_cliente().post(
+            d365_config["token_client"], data=token_params, timeout=http_client.timeout("consulta")
+        )
+        response.raise_for_status()
+        token_data = response.json()
+        access_token = token_data['access_token']
+        expires_in = float(token_data.get('expires_in') or EXPIRACION_POR_DEFECTO)
+    except (httpx.HTTPError, KeyError, ValueError) as e:
+        logger.error(f"Consulta token a D365 ({entorno}) FALLO. {e}")
+        raise ErrorTokenD365("No se pudo obtener el token de acceso") from e
+    logger.info(f"Consulta token a D365 ({entorno}) OK")
+    return access_token, expires_in
+
+
+class GestorToken:
+    """Token de un entorno: caché en memoria + ``misc.db`` y refresco anticipado.
+
+    Los refrescos corren en el loop de ``async_bridge``; ``obtener`` (síncrono) y
+    ``obtener_async`` esperan el mismo ``Future`` si no hay token utilizable.
+    """
+
+    def __init__(self, entorno: str, solicitar: Optional[SolicitarToken] = None, margen: Optional[float] = None):
+        if entorno not in ENTORNOS:
+            raise ValueError(f"Entorno D365 desconocido: {entorno!r}")
+        self.entorno = entorno
+        self.margen = D365_TOKEN_REFRESH_MARGIN if margen is None else margen
+        self._solicitar = solicitar or solicitar_token
+        self._lock = threading.RLock()
+        self._token: Optional[str] = None
+        self._expira = 0.0
+        self._cargado = False
+        self._refresco: Optional[concurrent.futures.Future] = None
+        self._temporizador: Optional[asyncio.TimerHandle] = None
+
+    def obtener(self, timeout: Optional[float] = None) -> str:
+        token = self._token_vigente()
+        if token:
+            return token
+        if async_bridge.en_loop_de_fondo():
+            raise RuntimeError("Dentro del loop de fondo usar 'await obtener_async()'")
+        return self._iniciar_refresco().result(timeout)
+
+    async def obtener_async(self) -> str:
+        token = self._token_vigente()
+        if token:
+            return token
+        return await asyncio.wrap_future(self._iniciar_refresco())
+
+    def invalidar(self) -> None:
+        """Descarta el token en memoria (p. ej. tras un 401); el próximo pedido lo renueva."""
+        with self._lock:
+            self._token, self._expira = None, 0.0
+
+    def _token_vigente(self) -> Optional[str]:
+        """Token utilizable; si está dentro del margen dispara el refresco en segundo plano."""
+        if not self._cargado:
+            self._cargar()
+        with self._lock:
+            token, expira = self._token, self._expira
+        restante = expira - _ahora()
+        if not token or restante <= RESERVA_MINIMA:
+            return None
+        if restante <= self.margen:
+            self._iniciar_refresco()
+        return token
+
+    def _cargar(self) -> None:
+        """Publica el token guardado en ``misc.db`` (leído fuera del lock) si es más nuevo."""
+        guardado = obtener_token_entorno(self.entorno)
+        with self._lock:
+            if self._cargado:
+                return
+            self._cargado = True
+            if not guardado or guardado[1] <= self._expira:
+                return
+            self._token, self._expira = guardado
+            expira = self._expira
+        if expira - _ahora() > self.margen:
+            async_bridge.enviar(self._programar(expira))
+
+    def _iniciar_refresco(self) -> concurrent.futures.Future:
+        with self._lock:
+            if self._refresco is None or self._refresco.done():
+                self._refresco = async_bridge.enviar(self._refrescar())
+            return self._refresco
+
+    async def _refrescar(self) -> str:
+        try:
+            token, expira_en = await self._solicitar(self.entorno)
+        except Exception as e:
+            with self._lock:
+                vigente = self._expira - _ahora() > RESERVA_MINIMA
+            if vigente:
+                logger.warning(f"Refresco del token D365 ({self.entorno}) fallido; se reintenta: {e}")
+                self._reprogramar(REINTENTO_REFRESCO)
+            raise
+        expira = _ahora() + expira_en
+        with self._lock:
+            self._token, self._expira = token, expira
+        try:
+            # Persistir es best-effort: el token ya es válido en memoria.
+            await guardar_token_entorno.aio(self.entorno, token, expira)
+        except Exception as e:
+            logger.error(f"No se pudo guardar el token D365 ({self.entorno}) en SQLite: {e}")
+        await self._programar(expira)
+        return token
+
+    async def _programar(self, expira: float) -> None:
+        self._reprogramar(max(expira - self.margen - _ahora(), 1.0))
+
+    def _reprogramar(self, demora: float) -> None:
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+        self._temporizador = asyncio.get_running_loop().call_later(demora, self._iniciar_refresco)
+
+
+_gestores: Dict[str, GestorToken] = {}
+_gestores_lock = threading.Lock()
+
+
+def gestor(entorno: str = "prod") -> GestorToken:
+    with _gestores_lock:
+        if entorno not in _gestores:
+            _gestores[entorno] = GestorToken(entorno)
+        return _gestores[entorno]
+
+
+def obtener_token(entorno: str = "prod", timeout: Optional[float] = None) -> str:
+    return gestor(entorno).obtener(timeout)
+
+
+async def obtener_token_async(entorno: str = "prod") -> str:
+    return await gestor(entorno).obtener_async()
@@ -0,0 +1,33 @@
+"""Lectura de Parquet mediante Arrow IPC mapeado en memoria."""
+from __future__ import annotations
+
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from services import arrow_cache
+
+
+def test_mmap_read_matches_parquet_and_replaces_versions(tmp_path, monkeypatch):
+    monkeypatch.setattr(arrow_cache, "ARROW_CACHE_DIR", str(tmp_path / ".arrow"))
+    path = tmp_path / "stock_cache.parquet"
+    first = pa.table({"codigo": ["A", "B"], "stock": [1.0, 2.5]})
+    pq.write_table(first, path)
+
+    stats = {}
+    table = arrow_cache.read_table(str(path), mmap=True, stats=stats)
+    assert table.equals(first)
+    assert stats["mode"] == "mmap"
+    assert stats["heap_bytes"] < stats["nbytes"]
+    assert stats["source"].endswith(".arrow")
+
+    # El proceso externo reemplaza el archivo: se publica una versión nueva y
+    # la anterior se descarta.
+    second = pa.table({"codigo": ["C"], "stock": [7.0]})
+    tmp = tmp_path / "stock_cache.parquet.tmp"
+    pq.write_table(second, tmp)
+    os.replace(tmp, path)
+    os.utime(path, ns=(1, 2_000_000_000))
+    assert arrow_cache.read_table(str(path), mmap=True).equals(second)
+    assert len(os.listdir(tmp_path / ".arrow")) == 1
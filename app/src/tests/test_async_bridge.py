@@ -0,0 +1,55 @@
+"""Event loop persistente para los wrappers síncronos de D365."""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services import async_bridge, http_client
+
+
+@pytest.fixture(autouse=True)
+def _detener():
+    yield
+    async_bridge.detener()
+
+
+def test_calls_share_one_loop_and_client():
+    async def cliente():
+        return asyncio.get_running_loop(), http_client.obtener_cliente()
+
+    loop, primero = async_bridge.ejecutar(cliente())
+    assert async_bridge.ejecutar(cliente()) == (loop, primero)
+    async_bridge.detener()
+    assert primero.is_closed
+
+
+def test_concurrent_submissions_overlap():
+    async def esperar():
+        await asyncio.sleep(0.2)
+        return threading.current_thread().name
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(8) as pool:
+        nombres = list(pool.map(lambda _: async_bridge.ejecutar(esperar()), range(8)))
+    assert time.perf_counter() - inicio < 1.0
+    assert set(nombres) == {"async-bridge"}
+
+
+def test_callable_from_a_running_loop():
+    async def dentro_de_fastapi():
+        return async_bridge.ejecutar(asyncio.sleep(0, result=42))
+
+    assert asyncio.run(dentro_de_fastapi()) == 42
+
+
+def test_rejects_blocking_call_from_bridge_thread():
+    async def reentrante():
+        with pytest.raises(RuntimeError):
+            async_bridge.ejecutar(asyncio.sleep(0))
+        return True
+
+    assert async_bridge.ejecutar(reentrante())
@@ -0,0 +1,40 @@
+"""Atributos de producto desde el índice agrupado por ``ProductNumber``."""
+from __future__ import annotations
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+
+from backend_app import main
+
+
+@pytest.fixture()
+def attributes(tmp_path, monkeypatch):
+    table = pa.table({
+        "ProductNumber": ["200", "100", "200", None, "100", "300"],
+        "AttributeName": ["Color", "Marca", "Medida", "Color", "Color", None],
+        "AttributeValue": ["Blanco", "Acme", "20x20", "Negro", "Gris", "x"],
+    })
+    path = tmp_path / "atributos_cache.parquet"
+    pq.write_table(table, path)
+    monkeypatch.setattr(main, "CACHE_FILE_ATRIBUTOS", str(path))
+    monkeypatch.setattr(main, "parquet_cache", main.ParquetCache())
+    return table
+
+
+def test_single_product_attributes(attributes):
+    client = TestClient(main.app)
+    assert client.get("/producto/atributos/200").json() == {"Color": "Blanco", "Medida": "20x20"}
+    assert client.get("/producto/atributos/100").json() == {"Marca": "Acme", "Color": "Gris"}
+    assert client.get("/producto/atributos/300").json() == {}
+    assert client.get("/producto/atributos/999").json() == {}
+
+
+def test_multi_product_attributes(attributes):
+    response = TestClient(main.app).get("/producto/atributos", params=[("ids", "100,200"), ("ids", "999")])
+    assert response.json() == {
+        "100": {"Marca": "Acme", "Color": "Gris"},
+        "200": {"Color": "Blanco", "Medida": "20x20"},
+        "999": {},
+    }
@@ -0,0 +1,57 @@
+"""Caché en memoria con vencimiento."""
+from __future__ import annotations
+
+from services import cache_ttl
+from services.cache_ttl import CacheTTL
+
+
+def test_entries_expire_and_are_copied(monkeypatch):
+    ahora = [100.0]
+    monkeypatch.setattr(cache_ttl.time, "monotonic", lambda: ahora[0])
+    cache = CacheTTL(ttl=60)
+    valor = {"lines": [{"ItemNumber": "P1"}]}
+    cache.guardar("Q-1", valor)
+    valor["lines"].clear()
+
+    leido = cache.obtener("Q-1")
+    assert leido == {"lines": [{"ItemNumber": "P1"}]}
+    leido["lines"].append("x")
+    assert cache.obtener("Q-1") == {"lines": [{"ItemNumber": "P1"}]}
+
+    ahora[0] += 61
+    assert cache.obtener("Q-1") is None
+
+
+def test_invalidate_and_size_bound():
+    cache = CacheTTL(ttl=60, maximo=2)
+    for clave in ("a", "b", "c"):
+        cache.guardar(clave, clave)
+    assert cache.obtener("a") is None and cache.obtener("c") == "c"
+    cache.invalidar("c")
+    assert cache.obtener("c") is None
+    assert cache.obtener("b") == "b"
+
+
+def test_zero_ttl_disables_cache():
+    cache = CacheTTL(ttl=0)
+    cache.guardar("a", 1)
+    assert cache.obtener("a") is None
+
+
+def test_read_started_before_invalidation_is_not_stored():
+    cache = CacheTTL(ttl=60, maximo=2)
+    antes = cache.generacion("Q-1")
+    cache.invalidar("Q-1")
+    cache.guardar("Q-1", "viejo", antes)
+    assert cache.obtener("Q-1") is None
+
+    cache.guardar("Q-1", "nuevo", cache.generacion("Q-1"))
+    assert cache.obtener("Q-1") == "nuevo"
+
+    # Aunque la generación de la clave se descarte por tamaño, la lectura vieja no coincide.
+    antes = cache.generacion("Q-2")
+    cache.invalidar("Q-2")
+    cache.invalidar("a")
+    cache.invalidar("b")
+    cache.guardar("Q-2", "viejo", antes)
+    assert cache.obtener("Q-2") is None
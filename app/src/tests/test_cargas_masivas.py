@@ -0,0 +1,79 @@
+"""Cargas masivas por lotes de ``services.database`` (sincronización Fabric)."""
+from __future__ import annotations
+
+import pytest
+
+from services import database
+
+
+@pytest.fixture()
+def dbs(tmp_path, monkeypatch):
+    for tabla in ("atributos", "empleados"):
+        monkeypatch.setitem(database.DB_PATHS, tabla, str(tmp_path / f"{tabla}.db"))
+        database.init_tabla(tabla)
+    monkeypatch.setattr(database, "SYNC_BATCH_SIZE", 4)
+    yield
+    database.cerrar_conexiones()
+
+
+def _atributos(n, nombre="A"):
+    for index in range(n):
+        yield (f"P{index}", f"Producto {index}", nombre, str(index))
+
+
+def _contar(tabla):
+    with database.conectar_db(tabla) as conexion:
+        return conexion.execute(f"SELECT COUNT(*) FROM {tabla}").fetchone()[0]
+
+
+def test_iterators_are_loaded_in_batches_with_progress(dbs):
+    progreso = []
+    assert database.agregar_atributos_masivo(_atributos(10), progreso=progreso.append) == 10
+    assert progreso == [4, 8, 10]
+    assert _contar("atributos") == 10
+    # Una fuente vacía no borra lo cargado.
+    assert database.agregar_atributos_masivo(iter([])) == 0
+    assert _contar("atributos") == 10
+
+
+def test_failed_stream_keeps_previous_table(dbs):
+    database.agregar_atributos_masivo(_atributos(3))
+
+    def rota():
+        yield from _atributos(6, "B")
+        raise RuntimeError("se cortó Fabric")
+
+    with pytest.raises(RuntimeError):
+        database.agregar_atributos_masivo(rota())
+    with database.conectar_db("atributos") as conexion:
+        assert conexion.execute("SELECT DISTINCT attribute_name FROM atributos").fetchall() == [("A",)]
+
+
+def test_employee_duplicates_are_dropped_across_batches(dbs):
+    empleados = [(f"E{index}", "P", f"user{index % 5}@pos", f"Nombre {index}", "S") for index in range(9)]
+    assert database.agregar_empleados_masivo(iter(empleados)) == 5
+    assert database.obtener_empleados_by_email("user1@pos")["empleado_d365"] == "E1"
+
+
+def test_bulk_load_restores_synchronous_on_pooled_connection(dbs):
+    def rota():
+        yield from _atributos(2)
+        raise RuntimeError("se cortó Fabric")
+
+    database.agregar_atributos_masivo(_atributos(3))
+    with pytest.raises(RuntimeError):
+        database.agregar_atributos_masivo(rota())
+    with database.conectar_db("atributos") as conexion:
+        # 1 = NORMAL
+        assert conexion.execute("PRAGMA synchronous").fetchone()[0] == 1
+
+
+def test_sqlite_failure_is_raised_not_reported_as_empty(dbs):
+    database.agregar_atributos_masivo(_atributos(3))
+    with database.conectar_db("atributos") as conexion:
+        conexion.execute("CREATE TRIGGER falla BEFORE INSERT ON atributos BEGIN SELECT RAISE(ABORT, 'disco lleno'); END")
+        conexion.commit()
+
+    with pytest.raises(database.sqlite3.Error):
+        database.agregar_atributos_masivo(_atributos(5, "B"))
+    assert _contar("atributos") == 3
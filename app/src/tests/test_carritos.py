@@ -0,0 +1,80 @@
+"""Carrito remoto por usuario persistido en la tabla ``carts``."""
+from __future__ import annotations
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend_app import main
+from services import database
+
+
+@pytest.fixture()
+def carts(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "REMOTE_CARTS_FILE", str(tmp_path / "remote_carts.json"))
+    monkeypatch.setitem(database.DB_PATHS, "misc", str(tmp_path / "misc.db"))
+    return tmp_path
+
+
+def test_save_and_get_user_cart(carts):
+    client = TestClient(main.app)
+    assert client.get("/api/get_user_cart", params={"user_id": "a@pos"}).json() == {"lines": [], "meta": {}}
+
+    cart = {"items": [{"code": "P1", "quantity": 2}], "client": None}
+    saved = client.post("/api/save_user_cart", json={"userId": "a@pos", "cart": cart, "timestamp": "t1"}).json()
+    assert saved == {"userId": "a@pos", "cart": cart, "timestamp": "t1", "version": 1}
+    assert client.get("/api/get_user_cart", params={"user_id": "a@pos"}).json() == {"cart": cart, "timestamp": "t1", "version": 1}
+
+    # Sin usuario (o sin carrito propio) se devuelve el carrito anónimo.
+    client.post("/api/save_user_cart", json={"cart": {"items": []}, "timestamp": "t2"})
+    assert client.get("/api/get_user_cart", params={"user_id": "b@pos"}).json() == {"cart": {"items": []}, "timestamp": "t2", "version": 1}
+
+
+def test_remote_carts_json_is_migrated(carts):
+    legacy = {"a@pos": {"cart": {"items": [{"code": "P9"}]}, "timestamp": "old"}}
+    (carts / "remote_carts.json").write_text(json.dumps(legacy), encoding="utf-8")
+    response = TestClient(main.app).get("/api/get_user_cart", params={"user_id": "a@pos"})
+    assert response.json() == {**legacy["a@pos"], "version": 0}
+    assert (carts / "remote_carts.json.migrado").exists()
+
+
+def test_patch_user_cart_with_optimistic_versions(carts):
+    client = TestClient(main.app)
+    line = {"lineId": "l1", "code": "P1", "quantity": 1}
+    saved = client.post("/api/save_user_cart", json={"userId": "a@pos", "cart": {"lines": [line]}, "timestamp": "t1"}).json()
+    assert saved["version"] == 1
+
+    ops = [
+        {"op": "add", "line": {"lineId": "l2", "code": "P2", "quantity": 3}},
+        {"op": "update_quantity", "lineId": "l1", "quantity": 5},
+        {"op": "set_client", "client": {"numero_cliente": "CL-1"}},
+    ]
+    response = client.post("/api/patch_user_cart", json={"userId": "a@pos", "baseVersion": 1, "ops": ops, "timestamp": "t2"})
+    assert response.json() == {"userId": "a@pos", "version": 2, "timestamp": "t2"}
+
+    # Otra terminal con una versión vieja recibe el carrito vigente.
+    stale = client.post("/api/patch_user_cart", json={"userId": "a@pos", "baseVersion": 1, "ops": [{"op": "remove", "lineId": "l1"}]})
+    assert stale.status_code == 409
+    assert stale.json()["detail"]["version"] == 2
+
+    invalid = client.post("/api/patch_user_cart", json={"userId": "a@pos", "baseVersion": 2, "ops": [{"op": "update_quantity", "lineId": "zz", "quantity": 1}]})
+    assert invalid.status_code == 400
+
+    client.post("/api/patch_user_cart", json={"userId": "a@pos", "baseVersion": 2, "ops": [{"op": "remove", "lineId": "l1"}], "timestamp": "t3"})
+    stored = client.get("/api/get_user_cart", params={"user_id": "a@pos"}).json()
+    assert stored == {
+        "cart": {"lines": [{"lineId": "l2", "code": "P2", "quantity": 3}], "client": {"numero_cliente": "CL-1"}},
+        "timestamp": "t3",
+        "version": 3,
+    }
+
+
+def test_cart_snapshots_are_compressed_at_rest(carts):
+    client = TestClient(main.app)
+    cart = {"lines": [{"lineId": f"l{index}", "name": "Porcelanato 60x60 blanco"} for index in range(50)]}
+    client.post("/api/save_user_cart", json={"userId": "a@pos", "cart": cart, "timestamp": "t"})
+    with database.conectar_db("misc") as conexion:
+        stored = conexion.execute("SELECT cart_json FROM carts WHERE user_id = 'a@pos'").fetchone()[0]
+    assert isinstance(stored, bytes)
+    assert len(stored) * 5 < len(json.dumps(cart))
@@ -0,0 +1,115 @@
+"""Búsqueda y validación de clientes con los índices de ``ClientIndex``."""
+from __future__ import annotations
+
+import json
+import random
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+
+from backend_app import main
+from services import database
+
+NAMES = ["Juan Pérez", "María GÓMEZ", "Ana Pereyra", "Pedro Juárez", "Lucía Fernández"]
+
+
+def _clients(rows: int = 240) -> pa.Table:
+    rng = random.Random(5)
+    return pa.table({
+        "numero_cliente": [f"CL-{index:05d}" for index in range(rows)],
+        "nombre_cliente": [f"{rng.choice(NAMES)} {index}" for index in range(rows)],
+        "nif": [f"20{30000000 + index * 7}1" for index in range(rows)],
+        "dni": [f"{30000000 + index * 7}" for index in range(rows)],
+        "email": [f"cliente{index}@mail.com" for index in range(rows)],
+    })
+
+
+def _legacy(table, query):
+    df = table.to_pandas()
+    mask = None
+    for column in ("nif", "numero_cliente", "nombre_cliente", "nombre_completo", "doc", "dni"):
+        if column in df.columns:
+            current = df[column].astype(str).str.lower().str.contains(query, na=False, regex=False)
+            mask = current if mask is None else (mask | current)
+    return df[mask]["numero_cliente"].tolist()
+
+
+@pytest.fixture()
+def clients(tmp_path, monkeypatch):
+    table = _clients()
+    path = tmp_path / "clientes_cache.parquet"
+    pq.write_table(table, path)
+    monkeypatch.setattr(main, "CACHE_FILE_CLIENTES", str(path))
+    monkeypatch.setattr(main, "CLIENTS_EXTRA_FILE", str(tmp_path / "clientes_extra.json"))
+    monkeypatch.setitem(database.DB_PATHS, "clientes_extra", str(tmp_path / "clientes_extra.db"))
+    monkeypatch.setattr(main, "parquet_cache", main.ParquetCache())
+    return table
+
+
+@pytest.mark.parametrize("query", ["pérez", "juan pé", "cl-0001", "3000", "MARÍA", "ez 1", "zzz"])
+def test_search_matches_substring_scan(clients, query):
+    response = TestClient(main.app).get("/api/clientes/search", params={"query": query})
+    assert response.status_code == 200
+    found = [item["numero_cliente"] for item in response.json()]
+    expected = _legacy(clients, query.lower())
+    assert found == expected[:50]
+
+
+def test_search_puts_exact_document_first(tmp_path, monkeypatch):
+    table = pa.table({
+        "numero_cliente": ["CL-1", "CL-2", "CL-3"],
+        "nombre_cliente": ["Cliente 1234", "Otro", "Tercero"],
+        "dni": ["51234", "1234", "91234"],
+    })
+    path = tmp_path / "clientes_cache.parquet"
+    pq.write_table(table, path)
+    monkeypatch.setattr(main, "CACHE_FILE_CLIENTES", str(path))
+    monkeypatch.setattr(main, "CLIENTS_EXTRA_FILE", str(tmp_path / "clientes_extra.json"))
+    monkeypatch.setitem(database.DB_PATHS, "clientes_extra", str(tmp_path / "clientes_extra.db"))
+    monkeypatch.setattr(main, "parquet_cache", main.ParquetCache())
+
+    response = TestClient(main.app).get("/api/clientes/search", params={"query": "1234"})
+    assert [item["numero_cliente"] for item in response.json()] == ["CL-2", "CL-1", "CL-3"]
+
+
+def test_validate_uses_document_indexes(clients):
+    client = TestClient(main.app)
+    assert client.post("/api/clientes/validate", json={"doc": "30000007"}).json()["cliente"]["numero_cliente"] == "CL-00001"
+    assert client.post("/api/clientes/validate", json={"dni": "cl-00002"}).json()["valid"] is False
+    assert client.post("/api/clientes/validate", json={"doc": "99999999"}).json() == {"valid": True}
+
+    payload = {
+        "nombre": "Nuevo", "apellido": "Cliente", "dni": "99999999", "email": "n@c.com", "telefono": "1",
+        "codigo_postal": "1000", "ciudad": "CABA", "estado": "BA", "condado": "CABA", "calle": "Calle", "altura": "1",
+    }
+    assert client.post("/api/clientes/create", json=payload).status_code == 201
+    response = client.post("/api/clientes/validate", json={"doc": "99999999"}).json()
+    assert response["valid"] is False
+    assert response["cliente"]["nombre_completo"] == "Nuevo Cliente"
+
+
+def test_extra_clients_are_migrated_from_json(clients, tmp_path):
+    legacy = [
+        {"numero_cliente": "40111222", "doc": "40111222", "dni": "40111222", "nombre_completo": "Rosa Extra"},
+        {"numero_cliente": "40333444", "doc": "40333444", "dni": "40333444", "nombre_completo": "Raúl Extra"},
+    ]
+    (tmp_path / "clientes_extra.json").write_text(json.dumps(legacy), encoding="utf-8")
+
+    client = TestClient(main.app)
+    found = client.get("/api/clientes/search", params={"query": "extra"}).json()
+    assert [item["numero_cliente"] for item in found] == ["40111222", "40333444"]
+    assert client.post("/api/clientes/validate", json={"doc": "40333444"}).json()["valid"] is False
+    assert not (tmp_path / "clientes_extra.json").exists()
+    assert (tmp_path / "clientes_extra.json.migrado").exists()
+
+
+def test_corrupt_extra_clients_json_does_not_break_endpoints(clients, tmp_path):
+    (tmp_path / "clientes_extra.json").write_text('[{"numero_cliente": "401', encoding="utf-8")
+
+    client = TestClient(main.app)
+    for _ in range(2):
+        assert client.get("/api/clientes/search", params={"query": "zzz"}).status_code == 200
+    assert client.post("/api/clientes/validate", json={"doc": "40111222"}).status_code == 200
+    assert (tmp_path / "clientes_extra.json").exists()
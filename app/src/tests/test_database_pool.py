@@ -0,0 +1,52 @@
+"""Reutilización de conexiones de ``services.database.conectar_db``."""
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from services import database
+
+
+@pytest.fixture()
+def misc_db(tmp_path, monkeypatch):
+    monkeypatch.setitem(database.DB_PATHS, "misc", str(tmp_path / "misc.db"))
+    monkeypatch.setattr(database, "SQLITE_POOL", True)
+    yield
+    database.cerrar_conexiones()
+
+
+def test_connection_is_reused_per_thread(misc_db):
+    with database.conectar_db("misc") as first:
+        # Uso anidado: conexión propia para no mezclar transacciones.
+        with database.conectar_db("misc") as nested:
+            assert nested is not first
+    with database.conectar_db("misc") as second:
+        assert second is first
+        assert second.execute("PRAGMA temp_store").fetchone()[0] == 2
+
+    other = []
+
+    def worker():
+        with database.conectar_db("misc") as conexion:
+            other.append(conexion)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    thread.join()
+    assert other[0] is not first
+
+
+def test_uncommitted_work_is_discarded_on_release(misc_db):
+    with database.conectar_db("misc") as conexion:
+        conexion.execute("CREATE TABLE t (x INTEGER)")
+        conexion.commit()
+        conexion.execute("INSERT INTO t VALUES (1)")
+    with database.conectar_db("misc") as conexion:
+        assert conexion.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 0
+        conexion.execute("INSERT INTO t VALUES (2)")
+        conexion.commit()
+
+    database.cerrar_conexiones()
+    with database.conectar_db("misc") as conexion:
+        assert conexion.execute("SELECT x FROM t").fetchall() == [(2,)]
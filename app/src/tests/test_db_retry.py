@@ -0,0 +1,91 @@
+"""Reintentos ante bloqueos de SQLite (``services.db_retry``)."""
+from __future__ import annotations
+
+import asyncio
+import sqlite3
+
+import pytest
+
+from services import database, db_retry
+
+
+@pytest.fixture(autouse=True)
+def _stats():
+    db_retry.reiniciar_estadisticas()
+    yield
+    db_retry.reiniciar_estadisticas()
+
+
+def _flaky(fallos, error="database is locked"):
+    llamadas = []
+
+    def operacion():
+        llamadas.append(1)
+        if len(llamadas) <= fallos:
+            raise sqlite3.OperationalError(error)
+        return len(llamadas)
+
+    return operacion, llamadas
+
+
+def test_lock_is_retried_and_counted():
+    operacion, _ = _flaky(2)
+    assert db_retry.reintentar_si_bloqueada("probar")(operacion)() == 3
+    stats = db_retry.estadisticas_bloqueos()["probar"]
+    assert stats["esperas"] == 2 and stats["agotados"] == 0
+
+
+def test_deadline_returns_default_or_raises():
+    operacion, llamadas = _flaky(1000)
+    assert db_retry.reintentar_si_bloqueada("probar", por_defecto=list, plazo=0.2)(operacion)() == []
+    assert 1 < len(llamadas) < 1000
+    assert db_retry.estadisticas_bloqueos()["probar"]["agotados"] == 1
+
+    with pytest.raises(sqlite3.OperationalError):
+        db_retry.reintentar_si_bloqueada("probar", plazo=0)(_flaky(1000)[0])()
+
+
+def test_other_errors_are_not_retried():
+    operacion, llamadas = _flaky(5, error="no such table: x")
+    assert db_retry.reintentar_si_bloqueada("probar", por_defecto=None)(operacion)() is None
+    assert len(llamadas) == 1
+
+
+def test_async_variant_yields_to_the_event_loop():
+    operacion, _ = _flaky(3)
+    decorada = db_retry.reintentar_si_bloqueada("probar")(operacion)
+    ticks = []
+
+    async def latido():
+        for _ in range(50):
+            ticks.append(1)
+            await asyncio.sleep(0)
+
+    async def main():
+        return (await asyncio.gather(decorada.aio(), latido()))[0]
+
+    assert asyncio.run(main()) == 4
+    assert len(ticks) == 50
+
+
+def test_writer_waits_for_a_concurrent_transaction(tmp_path, monkeypatch):
+    monkeypatch.setitem(database.DB_PATHS, "misc", str(tmp_path / "misc.db"))
+    monkeypatch.setattr(db_retry, "BACKOFF_INICIAL", 0.01)
+    database.init_tabla("misc")
+    bloqueo = sqlite3.connect(str(tmp_path / "misc.db"), timeout=0, isolation_level=None)
+    bloqueo.execute("BEGIN IMMEDIATE")
+    monkeypatch.setattr(database, "SQLITE_BUSY_TIMEOUT_MS", 10)
+    database.cerrar_conexiones()
+
+    def liberar():
+        bloqueo.execute("COMMIT")
+        bloqueo.close()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.call_later(0.2, liberar)
+        assert loop.run_until_complete(database.save_cart.aio("a@pos", {"lines": []}, "t")) == 1
+    finally:
+        loop.close()
+        database.cerrar_conexiones()
+    assert db_retry.estadisticas_bloqueos()["guardar carrito"]["esperas"] >= 1
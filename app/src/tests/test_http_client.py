@@ -0,0 +1,26 @@
+"""Cliente HTTP compartido para D365."""
+from __future__ import annotations
+
+import asyncio
+
+from services import http_client
+
+
+def test_client_is_shared_per_loop_and_closed():
+    async def usar():
+        primero = http_client.obtener_cliente()
+        async with http_client.cliente_compartido() as segundo:
+            assert segundo is primero
+        assert not primero.is_closed
+        await http_client.cerrar_cliente()
+        assert primero.is_closed
+        assert http_client.obtener_cliente() is not primero
+        await http_client.cerrar_cliente()
+        return primero
+
+    assert asyncio.run(usar()) is not asyncio.run(usar())
+
+
+def test_timeouts_by_operation():
+    assert http_client.timeout("lote").read > http_client.timeout("consulta").read
+    assert http_client.timeout("alta").connect == http_client.D365_CONNECT_TIMEOUT
@@ -0,0 +1,63 @@
+"""Armado y lectura de lotes OData ``$batch``."""
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from services import odata_batch
+
+
+def _respuesta(partes, boundary="batchresponse_1", changeset="changesetresponse_2"):
+    cuerpo = [f"--{boundary}", f"Content-Type: multipart/mixed; boundary={changeset}", ""]
+    for content_id, estado, texto in partes:
+        cuerpo += [f"--{changeset}", "Content-Type: application/http", "Content-Transfer-Encoding: binary"]
+        if content_id:
+            cuerpo.append(f"Content-ID: {content_id}")
+        cuerpo += ["", f"HTTP/1.1 {estado}", "Content-Type: application/json; odata.metadata=minimal", "", texto]
+    cuerpo += [f"--{changeset}--", f"--{boundary}--", ""]
+    return f"multipart/mixed; boundary={boundary}", "\r\n".join(cuerpo).encode("utf-8")
+
+
+def test_changeset_references_previous_content_id():
+    content_type, cuerpo = odata_batch.construir_changeset([
+        odata_batch.Operacion("POST", "https://d365/data/SalesQuotationHeadersV2", {"a": 1}, "1"),
+        odata_batch.Operacion("POST", "$1/SalesQuotationLines", {"ItemNumber": "P1"}),
+    ])
+    boundary = content_type.split("boundary=")[1]
+    assert cuerpo.startswith(f"--{boundary}\r\n") and cuerpo.rstrip().endswith(f"--{boundary}--")
+    assert "Content-ID: 1\r\n" in cuerpo and "Content-ID: 2\r\n" in cuerpo
+    assert "POST $1/SalesQuotationLines HTTP/1.1" in cuerpo
+    assert json.dumps({"ItemNumber": "P1"}) in cuerpo
+
+
+def test_parse_nested_changeset_response():
+    content_type, contenido = _respuesta([
+        ("1", "201 Created", json.dumps({"SalesQuotationNumber": "Q-1", "Nombre": "Ñandú"})),
+        ("2", "201 Created", "{}"),
+    ])
+    respuestas = odata_batch.parsear_respuesta(content_type, contenido)
+    assert [(r.content_id, r.status) for r in respuestas] == [("1", 201), ("2", 201)]
+    assert respuestas[0].json() == {"SalesQuotationNumber": "Q-1", "Nombre": "Ñandú"}
+    assert odata_batch.errores(respuestas) == []
+
+
+def test_failed_changeset_is_reported_without_scanning_text():
+    # La línea "HTTP/1.1 400" dentro de un mensaje de error no es una operación.
+    error = json.dumps({"error": {"message": "texto con HTTP/1.1 500 adentro"}})
+    content_type, contenido = _respuesta([(None, "400 Bad Request", error)])
+    respuestas = odata_batch.parsear_respuesta(content_type, contenido)
+    assert [r.status for r in respuestas] == [400]
+    assert len(odata_batch.errores(respuestas)) == 1
+
+
+def test_non_multipart_body_has_no_operations():
+    assert odata_batch.parsear_respuesta("application/json", b'{"error": {}}') == []
+
+
+@pytest.mark.parametrize("estado", ["", "HTTP/1.1 abc Created"])
+def test_malformed_status_line_raises_value_error(estado):
+    content_type, contenido = _respuesta([("1", "201 Created", "{}")])
+    contenido = contenido.replace(b"HTTP/1.1 201 Created", estado.encode())
+    with pytest.raises(ValueError):
+        odata_batch.parsear_respuesta(content_type, contenido)
@@ -0,0 +1,68 @@
+"""Recarga en segundo plano de ``ParquetCache``."""
+from __future__ import annotations
+
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from backend_app import main
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_watcher_swaps_new_versions_without_blocking_readers(tmp_path):
+    path = str(tmp_path / "stock_cache.parquet")
+    pq.write_table(pa.table({"codigo": ["A"]}), path)
+    cache = main.ParquetCache()
+    builds = []
+
+    def codes(table):
+        builds.append(table.num_rows)
+        return table["codigo"].to_pylist()
+
+    cache.register(path, "codes", codes)
+    cache.start_watcher([path], interval=0.02, debounce=0.2)
+    try:
+        assert _wait_for(lambda: cache.stats().get(path))
+        assert cache.load_derived(path, "codes", codes) == ["A"]
+
+        # Con el watcher activo los lectores no toman el lock.
+        result = []
+        with cache._lock:
+            reader = threading.Thread(target=lambda: result.append(cache.load(path)))
+            reader.start()
+            reader.join(timeout=1)
+        assert result and result[0]["codigo"].to_pylist() == ["A"]
+
+        # Un archivo recién escrito no se publica hasta que se estabiliza y
+        # los derivados se recalculan antes del reemplazo.
+        pq.write_table(pa.table({"codigo": ["B", "C"]}), path)
+        time.sleep(0.1)
+        assert cache.load(path)["codigo"].to_pylist() == ["A"]
+        assert _wait_for(lambda: cache.load(path).num_rows == 2)
+        assert cache.load_derived(path, "codes", codes) == ["B", "C"]
+        assert builds == [1, 2]
+    finally:
+        cache.stop_watcher()
+
+
+def test_lazy_derived_is_published_without_mutating_the_entry(tmp_path):
+    path = str(tmp_path / "clientes_cache.parquet")
+    pq.write_table(pa.table({"codigo": ["A", "B"]}), path)
+    cache = main.ParquetCache()
+    cache.load(path)
+    before = cache._cache[path]
+
+    assert cache.load_derived(path, "count", lambda table: table.num_rows) == 2
+    assert "count" not in before[2]
+    assert cache._cache[path] is not before
+    assert cache._cache[path][2]["count"] == 2
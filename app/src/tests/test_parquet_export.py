@@ -0,0 +1,44 @@
+"""Exportación por lotes de cursores a Parquet (``services.parquet_export``)."""
+from __future__ import annotations
+
+import pyarrow.parquet as pq
+import pytest
+
+from services import database, parquet_export
+
+
+@pytest.fixture()
+def stock_db(tmp_path, monkeypatch):
+    monkeypatch.setitem(database.DB_PATHS, "stock", str(tmp_path / "stock.db"))
+    database.init_tabla("stock")
+    filas = [(f"C{index}", f"A{index % 3}", float(index), None if index % 4 else 1.5, 2.0, 0.0) for index in range(25)]
+    database.agregar_stock_masivo(filas)
+    yield filas
+    database.cerrar_conexiones()
+
+
+def test_sqlite_cursor_is_exported_with_fixed_schema(stock_db, tmp_path):
+    path = str(tmp_path / "stock_cache.parquet")
+    total = parquet_export.write_batches(database.iterar_stock(tamano=4), parquet_export.SCHEMA_STOCK, path, row_group_size=10)
+    assert total == 25
+    parquet = pq.ParquetFile(path)
+    assert parquet.schema_arrow == parquet_export.SCHEMA_STOCK
+    assert [parquet.metadata.row_group(i).num_rows for i in range(parquet.num_row_groups)] == [10, 10, 5]
+    assert sorted(map(tuple, (row.values() for row in parquet.read().to_pylist()))) == sorted(stock_db)
+
+
+def test_failed_or_empty_export_keeps_previous_file(tmp_path):
+    path = tmp_path / "atributos_cache.parquet"
+    schema = parquet_export.SCHEMA_ATRIBUTOS
+    assert parquet_export.write_batches([[("1", "P", "Color", 7)]], schema, str(path)) == 1
+    assert pq.read_table(path).column("AttributeValue").to_pylist() == ["7"]
+
+    def rota():
+        yield [("2", "Q", "Talle", "L")]
+        raise RuntimeError("se cortó el origen")
+
+    with pytest.raises(RuntimeError):
+        parquet_export.write_batches(rota(), schema, str(path), row_group_size=1)
+    assert parquet_export.write_batches(iter([]), schema, str(path)) == 0
+    assert pq.read_table(path).column("ProductNumber").to_pylist() == ["1"]
+    assert [p.name for p in tmp_path.iterdir()] == ["atributos_cache.parquet"]
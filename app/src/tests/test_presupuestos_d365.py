@@ -0,0 +1,193 @@
+"""Alta y consulta de presupuestos en D365 (``services.d365_interface``)."""
+from __future__ import annotations
+
+import asyncio
+import json
+from contextlib import asynccontextmanager
+
+import httpx
+import pytest
+
+from services import d365_interface
+
+
+def _multipart(partes):
+    cuerpo = ["--b", "Content-Type: multipart/mixed; boundary=c", ""]
+    for content_id, estado, datos in partes:
+        cuerpo += ["--c", "Content-Type: application/http", f"Content-ID: {content_id}", "",
+                   f"HTTP/1.1 {estado}", "Content-Type: application/json", "", json.dumps(datos)]
+    cuerpo += ["--c--", "--b--", ""]
+    return httpx.Response(200, headers={"Content-Type": "multipart/mixed; boundary=b"}, content="\r\n".join(cuerpo).encode())
+
+
+class _D365:
+    """Transporte falso: ``lote_unico(request)`` responde el ``$batch`` con ``$1``."""
+
+    def __init__(self, lote_unico):
+        self.lote_unico = lote_unico
+        self.pedidos = []
+
+    def __call__(self, request):
+        cuerpo = request.content.decode()
+        self.pedidos.append((request.method, request.url.path, "$1/" in cuerpo))
+        if request.url.path.endswith("/$batch"):
+            if "$1/" in cuerpo:
+                return self.lote_unico(request)
+            return _multipart([("1", "201 Created", {})])
+        return httpx.Response(201, json={"SalesQuotationNumber": "Q-DOS"})
+
+
+@pytest.fixture()
+def d365(monkeypatch):
+    correos = []
+    monkeypatch.setattr(d365_interface, "load_d365_config", lambda: {"client_prod": "https://d365.test"})
+    monkeypatch.setattr(d365_interface, "enviar_correo_fallo", lambda *args: correos.append(args))
+    monkeypatch.setattr(d365_interface, "_changeset_unico_soportado", True)
+
+    async def referencia():
+        return "BUSCADOR-000000001"
+
+    monkeypatch.setattr(d365_interface, "generar_referencia_presupuesto", referencia)
+
+    def usar(transporte):
+        @asynccontextmanager
+        async def cliente():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(transporte)) as client:
+                yield client
+
+        monkeypatch.setattr(d365_interface, "cliente_compartido", cliente)
+        return transporte
+
+    usar.correos = correos
+    return usar
+
+
+def _crear():
+    return asyncio.run(d365_interface.crear_presupuesto_batch({"sitio": "S1"}, [{"articulo": "P1", "cantidad": 2}], "tok"))
+
+
+def test_single_changeset_creates_in_one_round_trip(d365):
+    transporte = d365(_D365(lambda request: _multipart([
+        ("1", "201 Created", {"SalesQuotationNumber": "Q-UNO"}),
+        ("2", "201 Created", {}),
+    ])))
+    assert _crear() == ("Q-UNO", None)
+    assert transporte.pedidos == [("POST", "/data/$batch", True)]
+    assert d365_interface._changeset_unico_soportado is True
+
+
+def test_rejected_changeset_falls_back_and_disables_single_changeset(d365):
+    transporte = d365(_D365(lambda request: httpx.Response(400, json={"error": "$1 no soportado"})))
+    assert _crear() == ("Q-DOS", None)
+    assert transporte.pedidos == [
+        ("POST", "/data/$batch", True),
+        ("POST", "/data/SalesQuotationHeadersV2", False),
+        ("POST", "/data/$batch", False),
+    ]
+    assert d365_interface._changeset_unico_soportado is False
+
+    # Los siguientes presupuestos van directo en dos pasos.
+    transporte.pedidos.clear()
+    assert _crear() == ("Q-DOS", None)
+    assert [pedido[1] for pedido in transporte.pedidos] == ["/data/SalesQuotationHeadersV2", "/data/$batch"]
+
+
+@pytest.mark.parametrize("respuesta", [
+    httpx.Response(502, text="Bad Gateway"),
+    httpx.Response(429, text="Too Many Requests"),
+    httpx.Response(200, json={"value": []}),
+    # Parte cortada: sin línea de estado.
+    httpx.Response(200, headers={"Content-Type": "multipart/mixed; boundary=b"}, content=(
+        b"--b\r\nContent-Type: multipart/mixed; boundary=c\r\n\r\n"
+        b"--c\r\nContent-Type: application/http\r\nContent-ID: 1\r\n\r\n"
+        b"--c--\r\n--b--\r\n"
+    )),
+])
+def test_unknown_outcome_is_not_replayed(d365, respuesta):
+    transporte = d365(_D365(lambda request: respuesta))
+    numero, error = _crear()
+    assert numero is None and "incierto" in error
+    assert transporte.pedidos == [("POST", "/data/$batch", True)]
+    assert d365_interface._changeset_unico_soportado is True
+    assert d365.correos
+
+
+class _Presupuestos:
+    """GET de cabecera/líneas y ``$batch`` de actualización contra un presupuesto en memoria."""
+
+    def __init__(self):
+        self.items = ["P1"]
+        self.gets = 0
+        self.en_curso = 0
+        self.ambos = asyncio.Event()
+        self.liberar = None
+
+    async def __call__(self, request):
+        if request.method == "POST":
+            self.items = ["P2"]
+            return _multipart([("1", "204 No Content", {}), ("2", "201 Created", {})])
+        self.gets += 1
+        items = list(self.items)  # lo que D365 leyó al recibir la consulta
+        self.en_curso += 1
+        if self.en_curso == 2:
+            self.ambos.set()
+        # Ninguna respuesta sale hasta que llegaron las dos consultas.
+        await asyncio.wait_for(self.ambos.wait(), 1)
+        if self.liberar is not None:
+            await self.liberar.wait()
+        self.en_curso -= 1
+        if "SalesQuotationLines" in request.url.path:
+            return httpx.Response(200, json={"value": [{"ItemNumber": item} for item in items]})
+        return httpx.Response(200, json={"value": [{"SalesQuotationNumber": "Q-1"}]})
+
+    def reiniciar(self):
+        self.ambos = asyncio.Event()
+
+
+@pytest.fixture()
+def presupuestos(d365, monkeypatch):
+    monkeypatch.setattr(d365_interface, "_presupuestos_recientes", d365_interface.CacheTTL(60))
+    return d365(_Presupuestos())
+
+
+def _items(resultado):
+    datos, error = resultado
+    assert error is None
+    return [linea["ItemNumber"] for linea in datos["lines"]]
+
+
+async def _actualizar():
+    return await d365_interface.actualizar_presupuesto_d365("Q-1", {"observaciones": "x"}, [{"articulo": "P2"}], [], "tok")
+
+
+def test_quotation_fetch_is_concurrent_and_cached(presupuestos):
+    async def escenario():
+        assert _items(await d365_interface.obtener_presupuesto_d365("Q-1", "tok")) == ["P1"]
+        assert presupuestos.gets == 2
+        # Reabrir no toca la red.
+        assert _items(await d365_interface.obtener_presupuesto_d365("Q-1", "tok")) == ["P1"]
+        assert presupuestos.gets == 2
+
+        assert await _actualizar() == ("Q-1", None)
+        presupuestos.reiniciar()
+        assert _items(await d365_interface.obtener_presupuesto_d365("Q-1", "tok")) == ["P2"]
+        assert presupuestos.gets == 4
+
+    asyncio.run(escenario())
+
+
+def test_read_overlapping_an_update_does_not_cache_stale_data(presupuestos):
+    async def escenario():
+        presupuestos.liberar = asyncio.Event()
+        lectura = asyncio.create_task(d365_interface.obtener_presupuesto_d365("Q-1", "tok"))
+        await asyncio.wait_for(presupuestos.ambos.wait(), 1)
+
+        assert await _actualizar() == ("Q-1", None)
+        presupuestos.liberar.set()
+        assert _items(await lectura) == ["P1"]
+
+        presupuestos.reiniciar()
+        assert _items(await d365_interface.obtener_presupuesto_d365("Q-1", "tok")) == ["P2"]
+        assert presupuestos.gets == 4
+
+    asyncio.run(escenario())
@@ -0,0 +1,238 @@
+"""Equivalencia entre ``/api/productos/search`` y el algoritmo fila a fila original."""
+from __future__ import annotations
+
+import itertools
+import json
+import math
+import random
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+
+from backend_app import main
+
+STORES = ["BA001", "ba002", "CBA01"]
+CATEGORIES = ["Cerámicos", "CERAMICOS", "Pinturas", "Sanitarios", None, "  Grifería "]
+COVERAGE = ["A", "B", "Línea Blanca", None, ""]
+WORDS = ["porcelanato", "látex", "blanco", "mate", "inodoro", "grifo", "cañería", "pvc", "20x20", "ñandú"]
+
+
+def _catalog(rows: int = 400) -> pa.Table:
+    rng = random.Random(1234)
+    data = {
+        "Número de Producto": [],
+        "Nombre del Producto": [],
+        "Nombre de Categoría de Producto": [],
+        "Grupo de Cobertura": [],
+        "PrecioFinalConIVA": [],
+        "PrecioFinalConDescE": [],
+        "StoreNumber": [],
+        "TotalDisponibleVenta": [],
+        "CodigoBarras": [],
+        "descripcion": [],
+    }
+    for index in range(rows):
+        name = " ".join(rng.sample(WORDS, 3)).title() if index % 17 else None
+        data["Número de Producto"].append(f"{100000 + index // 3}")
+        data["Nombre del Producto"].append(name)
+        data["Nombre de Categoría de Producto"].append(rng.choice(CATEGORIES))
+        data["Grupo de Cobertura"].append(rng.choice(COVERAGE))
+        data["PrecioFinalConIVA"].append(round(rng.uniform(0, 5000), 2))
+        data["PrecioFinalConDescE"].append(rng.choice([0.0, None, round(rng.uniform(0, 5000), 2)]))
+        data["StoreNumber"].append(STORES[index % len(STORES)])
+        data["TotalDisponibleVenta"].append(rng.choice([-3.0, 0.0, 0.0, 1.0, 12.5, None]))
+        data["CodigoBarras"].append(f"779{index:010d}" if index % 5 else None)
+        data["descripcion"].append(rng.choice([None, "", "Uso interior", "Acabado satinado"]))
+    return pa.table(data)
+
+
+def _legacy_search(table, store, query, category, coverage_group, min_price, max_price,
+                   stock_positive, stock_zero, stock_negative, sort, page, per_page):
+    """Implementación previa del endpoint, conservada como referencia."""
+    table = main._rename_columns(table, main.PRODUCT_COLUMN_MAPPING)
+    table = main._filter_by_store(table, store)
+    tokens = [token for token in main._normalize_text(query).split() if token]
+    normalized_category = main._normalize_text(category)
+    normalized_coverage = main._normalize_text(coverage_group)
+    categories, coverage_groups, filtered = {}, {}, []
+    apply_stock_filter = stock_positive or stock_zero or stock_negative
+
+    for record in table.to_pylist():
+        product = main._normalize_product(record)
+        category_value = main._string(product.get("categoria"))
+        if category_value:
+            categories.setdefault(category_value.upper(), category_value)
+        coverage_value = main._string(product.get("grupo_cobertura"))
+        if coverage_value:
+            coverage_groups.setdefault(coverage_value.upper(), coverage_value)
+        if normalized_category and main._normalize_text(category_value) != normalized_category:
+            continue
+        if normalized_coverage and main._normalize_text(coverage_value) != normalized_coverage:
+            continue
+        price_value = main._coerce_float(product.get("precio"), 0.0)
+        if min_price is not None and price_value < float(min_price):
+            continue
+        if max_price is not None and price_value > float(max_price):
+            continue
+        stock_value = main._coerce_float(product.get("total_disponible_venta") or product.get("stock"), 0.0)
+        if apply_stock_filter and not (
+            (stock_positive and stock_value > 0) or (stock_zero and stock_value == 0) or (stock_negative and stock_value < 0)
+        ):
+            continue
+        haystack = [
+            main._normalize_text(product.get(key))
+            for key in ("nombre", "descripcion", "categoria", "grupo_cobertura", "codigo", "barcode")
+        ]
+        if not all(any(token in candidate for candidate in haystack if candidate) for token in tokens):
+            continue
+        filtered.append(product)
+
+    price = lambda item: main._coerce_float(item.get("precio"), 0.0)  # noqa: E731
+    if sort == "priceAsc":
+        filtered.sort(key=price)
+    elif sort == "priceDesc":
+        filtered.sort(key=price, reverse=True)
+    elif sort == "nameAsc":
+        filtered.sort(key=lambda item: main._normalize_text(item.get("nombre")))
+    elif sort == "nameDesc":
+        filtered.sort(key=lambda item: main._normalize_text(item.get("nombre")), reverse=True)
+    elif sort == "stockDesc":
+        filtered.sort(key=lambda item: main._coerce_float(item.get("total_disponible_venta"), 0.0), reverse=True)
+
+    def counts(field, names):
+        totals = {}
+        for item in filtered:
+            value = main._string(item.get(field))
+            if value:
+                totals[value.upper()] = totals.get(value.upper(), 0) + 1
+        return [{"name": name, "count": totals[name.upper()]} for name in names if name.upper() in totals]
+
+    category_names = sorted(categories.values(), key=str.lower)
+    coverage_names = sorted(coverage_groups.values(), key=str.lower)
+    total = len(filtered)
+    total_pages = max(1, math.ceil(total / per_page))
+    current_page = min(page, total_pages)
+    start = (current_page - 1) * per_page
+    return {
+        "items": filtered[start:start + per_page],
+        "total": total,
+        "page": current_page,
+        "per_page": per_page,
+        "total_pages": total_pages,
+        "facets": {
+            "categories": category_names,
+            "coverage_groups": coverage_names,
+            "category_counts": counts("categoria", category_names),
+            "coverage_group_counts": counts("grupo_cobertura", coverage_names),
+        },
+    }
+
+
+@pytest.fixture()
+def catalog(tmp_path, monkeypatch):
+    table = _catalog()
+    path = tmp_path / "productos_cache.parquet"
+    pq.write_table(table, path)
+    monkeypatch.setattr(main, "CACHE_FILE_PRODUCTOS", str(path))
+    monkeypatch.setattr(main, "parquet_cache", main.ParquetCache())
+    return table
+
+
+CASES = list(
+    itertools.product(
+        [None, "ba001", "CBA01"],
+        ["", "blanco", "LATEX mate", "779", "nandu", "1000"],
+        ["", "ceramicos"],
+        ["", "linea blanca"],
+        [(None, None), (100.0, 2500.0)],
+        [(True, True, False), (False, False, True), (False, False, False)],
+        ["relevance", "priceAsc", "priceDesc", "nameAsc", "nameDesc", "stockDesc"],
+    )
+)
+
+
+@pytest.mark.parametrize("store,query,category,coverage,prices,stock,sort", random.Random(7).sample(CASES, 150))
+def test_search_matches_legacy_implementation(catalog, store, query, category, coverage, prices, stock, sort):
+    client = TestClient(main.app)
+    # Con texto libre ``relevance`` ordena por puntaje: se comparan los
+    # resultados completos sin importar el orden.
+    ranked = sort == "relevance" and bool(query)
+    per_page = 200 if ranked else 7
+    for page in ((1,) if ranked else (1, 2)):
+        params = {
+            "query": query,
+            "category": category,
+            "coverage_group": coverage,
+            "stock_positive": stock[0],
+            "stock_zero": stock[1],
+            "stock_negative": stock[2],
+            "sort": sort,
+            "page": page,
+            "per_page": per_page,
+        }
+        if store:
+            params["store"] = store
+        if prices[0] is not None:
+            params["min_price"], params["max_price"] = prices
+        response = client.get("/api/productos/search", params=params)
+        assert response.status_code == 200
+        payload = response.json()
+        expected = _legacy_search(catalog, store, query, category, coverage, prices[0], prices[1], *stock, sort, page, per_page)
+        if ranked:
+            key = lambda item: json.dumps(item, sort_keys=True)  # noqa: E731
+            payload["items"] = sorted(payload["items"], key=key)
+            expected["items"] = sorted(expected["items"], key=key)
+        assert payload == expected
+
+
+def test_relevance_ranks_whole_words_first(tmp_path, monkeypatch):
+    table = pa.table({
+        "Número de Producto": ["1", "2", "3"],
+        "Nombre del Producto": ["Tornillo autoperforante", "Caja de tornillos", "Tornillo"],
+        "StoreNumber": ["BA001", "BA001", "BA001"],
+        "TotalDisponibleVenta": [1.0, 1.0, 1.0],
+    })
+    path = tmp_path / "productos_cache.parquet"
+    pq.write_table(table, path)
+    monkeypatch.setattr(main, "CACHE_FILE_PRODUCTOS", str(path))
+    monkeypatch.setattr(main, "parquet_cache", main.ParquetCache())
+
+    response = TestClient(main.app).get("/api/productos/search", params={"query": "tornillo"})
+    codes = [item["codigo"] for item in response.json()["items"]]
+    assert codes == ["1", "3", "2"]
+
+    response = TestClient(main.app).get("/api/productos/search", params={"query": "tornillo", "sort": "nameAsc"})
+    assert [item["codigo"] for item in response.json()["items"]] == ["2", "3", "1"]
+
+
+def _legacy_by_code(table, code, store, limit):
+    table = main._filter_by_store(main._rename_columns(table, main.PRODUCT_COLUMN_MAPPING), store)
+    code = code.strip().lower()
+    results = []
+    columns = ["numero_producto", "codigo", "nombre_producto", "nombre", "codigo_barras", "barcode"]
+    for record in table.to_pylist():
+        haystack = [main._string(record.get(c)).lower() for c in columns if c in record and record.get(c) is not None]
+        if any(code in value for value in haystack if value):
+            results.append(main._normalize_product(record))
+            if len(results) >= limit:
+                break
+    return results
+
+
+@pytest.mark.parametrize("code,store,limit", [
+    ("1000", None, 100),
+    ("1000", "ba002", 5),
+    ("LÁTEX", None, 20),
+    ("7790000000", "CBA01", 100),
+    ("no-existe", None, 100),
+    ("e pvc", None, 50),
+])
+def test_by_code_matches_legacy_implementation(catalog, code, store, limit):
+    params = {"code": code, "limit": limit}
+    if store:
+        params["store"] = store
+    response = TestClient(main.app).get("/api/productos/by_code", params=params)
+    assert response.status_code == 200
+    assert response.json() == _legacy_by_code(catalog, code, store, limit)
@@ -0,0 +1,57 @@
+"""Asignación de números de presupuesto/PDF (``services.database``)."""
+from __future__ import annotations
+
+import asyncio
+import threading
+
+import pytest
+
+from services import database
+
+
+@pytest.fixture()
+def dbs(tmp_path, monkeypatch):
+    for tabla in ("misc", "secuencias_numericas"):
+        monkeypatch.setitem(database.DB_PATHS, tabla, str(tmp_path / f"{tabla}.db"))
+    monkeypatch.setattr(database, "_contador_presupuesto", database.AsignadorSecuencia(
+        "presupuesto", inicial=lambda: database._contador_heredado("contador")))
+    yield
+    database.cerrar_conexiones()
+
+
+def test_reservations_are_atomic_blocks(dbs):
+    assert database.reservar_secuencia("x", 50) == (1, 50)
+    assert database.reservar_secuencia("x") == (51, 51)
+    assert database.reservar_secuencia("y", 3, inicial=100) == (101, 103)
+
+
+def test_budget_counter_continues_legacy_value_in_blocks(dbs, monkeypatch):
+    database.init_tabla("misc")
+    with database.conectar_db("misc") as conexion:
+        conexion.execute("INSERT INTO misc (id, token_d365, contador) VALUES (1, NULL, '41')")
+        conexion.commit()
+    monkeypatch.setattr(database, "SEQUENCE_BLOCK_SIZE", 5)
+    assert [database.obtener_contador_presupuesto() for _ in range(3)] == [42, 43, 44]
+    assert asyncio.run(database.obtener_contador_presupuesto_async()) == 45
+    # El bloque 42..46 quedó reservado en la base.
+    assert database.reservar_secuencia("presupuesto") == (47, 47)
+
+
+def test_concurrent_allocators_never_repeat_numbers(dbs):
+    asignadores = [database.AsignadorSecuencia("z", bloque=7) for _ in range(3)]
+    numeros, errores = [], []
+
+    def worker(asignador):
+        try:
+            for _ in range(40):
+                numeros.append(asignador.siguiente())
+        except Exception as exc:  # pragma: no cover - se reporta abajo
+            errores.append(exc)
+
+    hilos = [threading.Thread(target=worker, args=(asignadores[i % 3],)) for i in range(6)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert not errores
+    assert len(numeros) == 240 and len(set(numeros)) == 240
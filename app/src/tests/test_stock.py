@@ -0,0 +1,72 @@
+"""Consultas de stock por (producto, almacén) mediante el índice hash."""
+from __future__ import annotations
+
+import random
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+
+from backend_app import main
+
+STORES = ["BA001", "ba002", " CBA01 ", None, ""]
+
+
+def _stock(rows: int = 300) -> pa.Table:
+    rng = random.Random(99)
+    return pa.table({
+        "codigo": [rng.choice([f"P{index % 40}", f"p{index % 40}", None, ""]) for index in range(rows)],
+        "numero_producto": [f"P{index % 40}" if index % 7 else None for index in range(rows)],
+        "almacen": [rng.choice(STORES) for _ in range(rows)],
+        "almacen_365": [rng.choice(STORES) for _ in range(rows)],
+        "disponible_venta": [rng.choice([0.0, 1.0, 5.5]) for _ in range(rows)],
+        "disponible_entrega": [rng.choice([0.0, 2.0]) for _ in range(rows)],
+        "comprometido": [rng.choice([0.0, 3.0]) for _ in range(rows)],
+    })
+
+
+def _legacy(table, product_code, *store_ids):
+    product_code = product_code.strip().lower()
+    store_ids = {store_id.strip().lower() for store_id in store_ids}
+    records = []
+    for row in table.to_pylist():
+        codigo = main._string(row.get("codigo") or row.get("numero_producto") or row.get("productId")).lower()
+        if codigo and codigo != product_code:
+            continue
+        candidates = [main._string(row.get(name)) for name in ("almacen", "almacen_nombre", "almacen_365", "store")]
+        if not store_ids & {candidate.lower() for candidate in candidates if candidate}:
+            continue
+        records.append(main._stock_record(row))
+    return records
+
+
+@pytest.fixture()
+def stock(tmp_path, monkeypatch):
+    table = _stock()
+    path = tmp_path / "stock_cache.parquet"
+    pq.write_table(table, path)
+    monkeypatch.setattr(main, "CACHE_FILE_STOCK", str(path))
+    monkeypatch.setattr(main, "parquet_cache", main.ParquetCache())
+    return table
+
+
+@pytest.mark.parametrize("code,store", [("P1", "ba001"), ("p3", "BA002"), ("P12", "cba01"), ("P99", "ba001"), ("P5", "nope")])
+def test_stock_by_store_matches_row_scan(stock, code, store):
+    response = TestClient(main.app).get(f"/api/stock/{code}/{store}")
+    assert response.status_code == 200
+    assert response.json() == _legacy(stock, code, store)
+
+
+def test_stock_bulk_returns_every_code(stock):
+    codes = ["P1", "p2", "P2", "P99"]
+    response = TestClient(main.app).post("/api/stock/bulk", json={"store": "BA001", "codes": codes})
+    assert response.status_code == 200
+    assert response.json() == {code.lower(): _legacy(stock, code, "BA001") for code in codes}
+
+
+def test_stock_bulk_expands_fulfillment_group(stock, monkeypatch):
+    monkeypatch.setattr(main, "_fulfillment_stores", lambda store: [store, "CBA01"])
+    payload = {"store": "BA001", "codes": ["P4", "P7"], "fulfillment_group": True}
+    response = TestClient(main.app).post("/api/stock/bulk", json=payload)
+    assert response.json() == {code.lower(): _legacy(stock, code, "BA001", "CBA01") for code in payload["codes"]}
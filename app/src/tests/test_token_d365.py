@@ -0,0 +1,128 @@
+"""Token de D365 cacheado por entorno con refresco anticipado."""
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services import async_bridge, database, token_d365
+
+
+@pytest.fixture()
+def misc(tmp_path, monkeypatch):
+    monkeypatch.setitem(database.DB_PATHS, "misc", str(tmp_path / "misc.db"))
+    yield
+    async_bridge.detener()
+    database.cerrar_conexiones()
+
+
+class _Emisor:
+    def __init__(self, expira_en=3600.0):
+        self.pedidos = []
+        self.expira_en = expira_en
+
+    async def __call__(self, entorno):
+        self.pedidos.append(entorno)
+        await asyncio.sleep(0.1)
+        return f"{entorno}-{len(self.pedidos)}", self.expira_en
+
+
+def test_concurrent_callers_share_one_refresh(misc):
+    emisor = _Emisor()
+    gestor = token_d365.GestorToken("prod", solicitar=emisor)
+    with ThreadPoolExecutor(8) as pool:
+        tokens = set(pool.map(lambda _: gestor.obtener(), range(8)))
+    assert tokens == {"prod-1"}
+    assert emisor.pedidos == ["prod"]
+
+    # Otro proceso (u otro arranque) reutiliza el token persistido.
+    otro = token_d365.GestorToken("prod", solicitar=_Emisor())
+    assert otro.obtener() == "prod-1"
+    assert database.obtener_token_entorno("qa") is None
+
+
+def test_prod_and_qa_are_cached_separately(misc):
+    emisor = _Emisor()
+    prod = token_d365.GestorToken("prod", solicitar=emisor)
+    qa = token_d365.GestorToken("qa", solicitar=emisor)
+    assert prod.obtener() == "prod-1"
+    assert asyncio.run(qa.obtener_async()) == "qa-2"
+    assert database.obtener_token_entorno("prod")[0] == "prod-1"
+    assert database.obtener_token_entorno("qa")[0] == "qa-2"
+    with pytest.raises(ValueError):
+        token_d365.GestorToken("dev")
+
+
+def test_token_near_expiry_is_served_while_refreshing(misc):
+    database.guardar_token_entorno("prod", "viejo", time.time() + 120)
+    emisor = _Emisor()
+    gestor = token_d365.GestorToken("prod", solicitar=emisor, margen=300)
+
+    inicio = time.perf_counter()
+    assert gestor.obtener() == "viejo"
+    assert time.perf_counter() - inicio < 0.1
+    gestor._refresco.result(2)
+    assert gestor.obtener() == "prod-1"
+    assert emisor.pedidos == ["prod"]
+
+
+def test_expired_token_waits_for_refresh(misc):
+    database.guardar_token_entorno("prod", "vencido", time.time() + 5)
+    gestor = token_d365.GestorToken("prod", solicitar=_Emisor())
+    assert gestor.obtener() == "prod-1"
+
+
+def test_background_timer_refreshes_before_expiry(misc):
+    emisor = _Emisor(expira_en=31.5)
+    gestor = token_d365.GestorToken("prod", solicitar=emisor, margen=30)
+    assert gestor.obtener() == "prod-1"
+    deadline = time.time() + 5
+    while len(emisor.pedidos) < 2 and time.time() < deadline:
+        time.sleep(0.05)
+    assert len(emisor.pedidos) >= 2
+
+
+def test_failed_cold_fetch_raises(misc):
+    async def falla(entorno):
+        raise token_d365.ErrorTokenD365("sin red")
+
+    with pytest.raises(token_d365.ErrorTokenD365):
+        token_d365.GestorToken("qa", solicitar=falla).obtener()
+
+
+def test_sqlite_write_failure_keeps_token_and_schedules_refresh(misc, monkeypatch):
+    async def falla(*args):
+        raise database.sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(token_d365.guardar_token_entorno, "aio", falla)
+    gestor = token_d365.GestorToken("prod", solicitar=_Emisor())
+    assert gestor.obtener() == "prod-1"
+    assert gestor._temporizador is not None
+    assert database.obtener_token_entorno("prod") is None
+
+
+def test_stored_token_is_read_without_holding_the_lock(misc, monkeypatch):
+    database.guardar_token_entorno("prod", "guardado", time.time() + 3600)
+    gestor = token_d365.GestorToken("prod", solicitar=_Emisor())
+    leer = token_d365.obtener_token_entorno
+    libre = []
+
+    def probar_lock():
+        if gestor._lock.acquire(blocking=False):
+            gestor._lock.release()
+            libre.append(True)
+        else:
+            libre.append(False)
+
+    def lectura_lenta(entorno):
+        hilo = threading.Thread(target=probar_lock)
+        hilo.start()
+        hilo.join()
+        return leer(entorno)
+
+    monkeypatch.setattr(token_d365, "obtener_token_entorno", lectura_lenta)
+    assert gestor.obtener() == "guardado"
+    assert libre == [True]
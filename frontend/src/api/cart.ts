@@ -1,5 +1,6 @@
 ﻿import { get, post } from './http';
 import { deserializeCartSnapshot } from '@/utils/totals';
+import type { CartPatchOp } from '@/utils/cartPatch';
 import type { CartSnapshot } from '@/types/cart';
 
 export interface UserInfoResponse {
@@ -26,8 +27,18 @@ export const saveRemoteCart = async (payload: {
   userId: string;
   cart: CartSnapshot;
   timestamp?: string;
-}): Promise<void> => {
-  await post('/api/save_user_cart', payload);
+}): Promise<{ version?: number }> => {
+  return post<{ version?: number }>('/api/save_user_cart', payload);
+};
+
+/** Envía sólo los cambios sobre `baseVersion`; responde 409 si el carrito cambió en otra terminal. */
+export const patchRemoteCart = async (payload: {
+  userId: string;
+  baseVersion: number;
+  ops: CartPatchOp[];
+  timestamp?: string;
+}): Promise<{ version: number }> => {
+  return post<{ version: number }>('/api/patch_user_cart', payload);
 };
 
 export const updateLastStore = async (storeId: string): Promise<void> => {
@@ -1,4 +1,4 @@
-import { get } from './http';
+import { get, post } from './http';
 import { normalizeProduct, normalizeStockRow } from '@/utils/normalizers';
 import type { Product, ProductResponse } from '@/types/product';
 import type { StockRow, StockRowResponse } from '@/types/stock';
@@ -34,6 +34,11 @@ export interface SearchProductsParams {
   perPage?: number;
 }
 
+export interface FacetCount {
+  name: string;
+  count: number;
+}
+
 interface SearchProductsApiResponse {
   items?: ProductResponse[];
   total?: number;
@@ -43,6 +48,8 @@ interface SearchProductsApiResponse {
   facets?: {
     categories?: string[];
     coverage_groups?: string[];
+    category_counts?: FacetCount[];
+    coverage_group_counts?: FacetCount[];
   };
   categories?: string[];
   coverage_groups?: string[];
@@ -56,6 +63,8 @@ export interface ProductsSearchResult {
   totalPages: number;
   categories: string[];
   coverageGroups: string[];
+  categoryCounts: FacetCount[];
+  coverageGroupCounts: FacetCount[];
 }
 
 const DEFAULT_PAGE = 1;
@@ -87,6 +96,8 @@ export const searchProducts = async (params: SearchProductsParams): Promise<Prod
   const facets = data?.facets ?? {};
   const categories = toStringArray(facets.categories ?? data?.categories);
   const coverageGroups = toStringArray(facets.coverage_groups ?? data?.coverage_groups);
+  const categoryCounts = Array.isArray(facets.category_counts) ? facets.category_counts : [];
+  const coverageGroupCounts = Array.isArray(facets.coverage_group_counts) ? facets.coverage_group_counts : [];
 
   return {
     items,
@@ -96,6 +107,8 @@ export const searchProducts = async (params: SearchProductsParams): Promise<Prod
     totalPages,
     categories,
     coverageGroups,
+    categoryCounts,
+    coverageGroupCounts,
   };
 };
 
@@ -116,6 +129,24 @@ export const fetchStockByStore = async (productCode: string, storeId: string): P
   return data.map(normalizeStockRow);
 };
 
+export const fetchStockBatch = async (
+  productCodes: string[],
+  storeId: string,
+  fulfillmentGroup = false,
+): Promise<Record<string, StockRow[]>> => {
+  if (productCodes.length === 0) return {};
+  const data = await post<Record<string, StockRowResponse[]>>('/api/stock/bulk', {
+    store: storeId,
+    codes: productCodes,
+    fulfillment_group: fulfillmentGroup,
+  });
+  const result: Record<string, StockRow[]> = {};
+  Object.entries(data ?? {}).forEach(([code, rows]) => {
+    result[code] = Array.isArray(rows) ? rows.map(normalizeStockRow) : [];
+  });
+  return result;
+};
+
 export const fetchProductAttributes = async (productId: string): Promise<unknown> => {
   return get(`/producto/atributos/${encodeURIComponent(productId)}`, {
     headers: {
@@ -123,3 +154,13 @@ export const fetchProductAttributes = async (productId: string): Promise<unknown
     },
   });
 };
+
+export const fetchProductsAttributes = async (productIds: string[]): Promise<Record<string, unknown>> => {
+  if (productIds.length === 0) return {};
+  const query = productIds.map((id) => `ids=${encodeURIComponent(id)}`).join('&');
+  return get<Record<string, unknown>>(`/producto/atributos?${query}`, {
+    headers: {
+      'X-Requested-With': 'XMLHttpRequest',
+    },
+  });
+};
@@ -1,5 +1,8 @@
-﻿import { useCallback, useEffect } from 'react';
-import { saveRemoteCart } from '@/api/cart';
+﻿import { useCallback, useEffect, useRef } from 'react';
+import { patchRemoteCart, saveRemoteCart } from '@/api/cart';
+import { ApiError } from '@/api/http';
+import type { CartSnapshot } from '@/types/cart';
+import { diffCartSnapshots } from '@/utils/cartPatch';
 import { useCartStore } from '@/stores/useCartStore';
 import { useSessionStore } from '@/stores/useSessionStore';
 import { useOnlineStatus } from './useOnlineStatus';
@@ -16,12 +19,31 @@ export const useCartRemoteSync = () => {
   const isOnline = useOnlineStatus();
 
   const debouncedCart = useDebouncedValue({ cart, needsSync }, 400);
+  // Última versión confirmada por el servidor: permite enviar sólo el diff.
+  const synced = useRef<{ userId: string; version: number; cart: CartSnapshot } | null>(null);
 
   const sync = useCallback(async () => {
     if (!userEmail || !isOnline) return;
     try {
       setSyncing(true);
-      await saveRemoteCart({ userId: userEmail, cart, timestamp: new Date().toISOString() });
+      const timestamp = new Date().toISOString();
+      const base = synced.current?.userId === userEmail ? synced.current : null;
+      let version: number | undefined;
+      if (base) {
+        const ops = diffCartSnapshots(base.cart, cart);
+        try {
+          version = ops.length
+            ? (await patchRemoteCart({ userId: userEmail, baseVersion: base.version, ops, timestamp })).version
+            : base.version;
+        } catch (error) {
+          // Conflicto con otra terminal: se reenvía el carrito completo.
+          if (!(error instanceof ApiError) || error.status !== 409) throw error;
+        }
+      }
+      if (version === undefined) {
+        version = (await saveRemoteCart({ userId: userEmail, cart, timestamp }))?.version;
+      }
+      synced.current = typeof version === 'number' ? { userId: userEmail, version, cart } : null;
       markSynced();
       setRemoteError(null);
     } catch (error) {
@@ -0,0 +1,43 @@
+﻿import type { CartLine, CartSnapshot } from '@/types/cart';
+
+export type CartPatchOp =
+  | { op: 'add'; line: CartLine }
+  | { op: 'update_quantity'; lineId: string; quantity: number }
+  | { op: 'remove'; lineId: string }
+  | { op: 'set_client'; client: CartSnapshot['client'] }
+  | { op: 'set'; field: string; value: unknown };
+
+const same = (a: unknown, b: unknown) => JSON.stringify(a) === JSON.stringify(b);
+
+/** Operaciones que transforman `previous` en `next` (ver `/api/patch_user_cart`). */
+export const diffCartSnapshots = (previous: CartSnapshot, next: CartSnapshot): CartPatchOp[] => {
+  const ops: CartPatchOp[] = [];
+  const previousLines = new Map(previous.lines.map((line) => [line.lineId, line]));
+  const nextIds = new Set(next.lines.map((line) => line.lineId));
+
+  previous.lines.forEach((line) => {
+    if (!nextIds.has(line.lineId)) ops.push({ op: 'remove', lineId: line.lineId });
+  });
+  next.lines.forEach((line) => {
+    const before = previousLines.get(line.lineId);
+    if (!before) {
+      ops.push({ op: 'add', line });
+    } else if (!same(before, line)) {
+      ops.push(
+        same({ ...before, quantity: line.quantity }, line)
+          ? { op: 'update_quantity', lineId: line.lineId, quantity: line.quantity }
+          : { op: 'add', line },
+      );
+    }
+  });
+
+  if (!same(previous.client, next.client)) ops.push({ op: 'set_client', client: next.client });
+  const fields = new Set([...Object.keys(previous), ...Object.keys(next)]);
+  fields.forEach((field) => {
+    if (field === 'lines' || field === 'client') return;
+    const before = (previous as unknown as Record<string, unknown>)[field];
+    const after = (next as unknown as Record<string, unknown>)[field];
+    if (!same(before, after)) ops.push({ op: 'set', field, value: after ?? null });
+  });
+  return ops;
+};